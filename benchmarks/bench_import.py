@@ -0,0 +1,25 @@
+#
+# Benchmark of the import time of pkmodel
+#
+# Run with ``python benchmarks/run.py --filter bench_import``.
+#
+# Every worker process and short-lived command pays for ``import pkmodel``,
+# so it is timed in a fresh interpreter, next to the interpreter start-up
+# alone. pkmodel/tests/test_import.py enforces a budget on it.
+#
+
+import subprocess
+import sys
+
+
+class Import:
+    """Fresh interpreter start-up with and without import pkmodel."""
+
+    params = [['python', 'numpy', 'pkmodel']]
+    param_names = ['statement']
+
+    def setup(self, statement):
+        self.command = [sys.executable, '-c', '' if statement == 'python' else 'import ' + statement]
+
+    def time_import(self, statement):
+        subprocess.run(self.command, check=True)
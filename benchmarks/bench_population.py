@@ -0,0 +1,30 @@
+#
+# Benchmarks of PopulationSolution
+#
+# Run with ``python benchmarks/run.py --filter bench_population``.
+#
+
+import numpy as np
+
+import pkmodel as pk
+
+
+class Population:
+    """Batched exact solve against the number of patients."""
+
+    params = [[1, 10, 100, 1000], [0, 2]]
+    param_names = ['n_patients', 'n_peripheral']
+
+    def setup(self, n_patients, n_peripheral):
+        rng = np.random.default_rng(0)
+        self.population = pk.PopulationSolution(
+            clearance_rate=rng.lognormal(0, 0.3, n_patients),
+            vol_c=rng.lognormal(1, 0.3, n_patients),
+            absorption_rate=rng.lognormal(1, 0.3, n_patients),
+            vol_p=rng.lognormal(0, 0.3, (n_patients, n_peripheral)),
+            q_p=rng.lognormal(0, 0.3, (n_patients, n_peripheral)),
+            protocol=pk.Protocol(dose_times=[0, 6, 12, 18]))
+        self.t_eval = np.linspace(0, 24, 1000)
+
+    def time_solve(self, n_patients, n_peripheral):
+        self.population.solve(t_eval=self.t_eval)
@@ -0,0 +1,31 @@
+#
+# Benchmarks of Protocol.dose_at_time and the compiled DoseSchedule
+#
+# Run with ``python benchmarks/run.py --filter bench_protocol``.
+#
+
+import numpy as np
+
+import pkmodel as pk
+
+
+class DoseAtTime:
+    """Dose lookups against the number of dose times, one at a time and vectorised."""
+
+    params = [[1, 10, 100, 1000, 10000]]
+    param_names = ['n_boluses']
+
+    def setup(self, n_boluses):
+        self.protocol = pk.Protocol(dose_times=list(np.linspace(0, 100, n_boluses, endpoint=False)))
+        self.protocol.make_continuous(10, 20)
+        self.protocol.compile()
+        self.times = np.linspace(0, 100, 1000)
+
+    def time_scalar(self, n_boluses):
+        self.protocol.dose_at_time(50.0)
+
+    def time_array(self, n_boluses):
+        self.protocol.dose_at_time(self.times)
+
+    def time_dose_rate(self, n_boluses):
+        self.protocol.dose_rate(50.0)
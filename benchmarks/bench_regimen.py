@@ -0,0 +1,58 @@
+#
+# Benchmark of the dose regimen search
+#
+# Run with ``python benchmarks/bench_regimen.py`` once pkmodel is installed, or
+# as part of the suite with ``python benchmarks/run.py --filter bench_regimen``.
+#
+# Scores grids of dose amounts, intervals and infusion durations with a
+# RegimenOptimiser and reports the candidates searched per second.
+#
+
+import time
+
+import numpy as np
+
+import pkmodel as pk
+
+
+def regimen_model():
+    """
+    SC model with one peripheral compartment.
+    """
+    model = pk.Model(clearance_rate=0.5, vol_c=3)
+    model.add_peripheral_compartment(vol_p=2, q_p=0.4)
+    model.add_subcutaneous_compartment(absorption_rate=1.2)
+    return model
+
+
+class RegimenSearch:
+    """Time to score a grid of n_amounts x 48 intervals x 5 infusion durations."""
+
+    params = [[10, 100]]
+    param_names = ['n_amounts']
+
+    def setup(self, n_amounts):
+        self.optimiser = pk.RegimenOptimiser(regimen_model(), (0.5, 2.0),
+                                             np.linspace(0, 72, 1441), max_single_dose=10,
+                                             max_daily_dose=30)
+        self.amounts = np.linspace(0.5, 10, n_amounts)
+
+    def time_search(self, n_amounts):
+        self.optimiser.search(self.amounts, np.arange(1, 25, 0.5), [0, 0.5, 1, 2, 4])
+
+
+def main(n_amounts=(10, 40, 100)):
+    print('{:>10} {:>12} {:>10} {:>14}'.format('amounts', 'candidates', 'time [s]', 'per second'))
+    for n in n_amounts:
+        benchmark = RegimenSearch()
+        benchmark.setup(n)
+        start = time.perf_counter()
+        result = benchmark.optimiser.search(benchmark.amounts, np.arange(1, 25, 0.5),
+                                            [0, 0.5, 1, 2, 4])
+        elapsed = time.perf_counter() - start
+        print('{:>10} {:>12} {:>10.3f} {:>14.0f}'.format(
+            n, len(result['amount']), elapsed, len(result['amount']) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#
+# Benchmark of the right-hand side of the ODE system
+#
+# Run with ``python benchmarks/bench_rhs.py`` once pkmodel is installed, or
+# as part of the suite with ``python benchmarks/run.py --filter bench_rhs``.
+#
+# Times one evaluation of Solution.system_of_equations as the number of
+# peripheral compartments grows, next to the original per-compartment Python
+# loop that it replaced.
+#
+
+import timeit
+
+import numpy as np
+
+import pkmodel as pk
+
+
+def reference_system_of_equations(solution, t, y):
+    """
+    The original implementation of Solution.system_of_equations, kept here
+    as a baseline: it loops over the peripheral compartment dicts and
+    evaluates the dosing protocol on every call.
+    """
+    model = solution.model
+    dqi_dt = np.zeros(model.number_of_compartments)
+    transitions = np.zeros(model.number_of_peripheral_compartments)
+    for i in range(0, model.number_of_peripheral_compartments):
+        transitions[i] = (
+            model.peripheral_compartments[i]['q_p']
+            * (y[0] / model.vol_c - y[i + 1] / model.peripheral_compartments[i]['vol_p'])
+        )
+    if model.subcutaneous_compartment:
+        dqi_dt[0] = (
+            model.subcutaneous_compartment * y[-1]
+            - model.clearance_rate * y[0] / model.vol_c - np.sum(transitions)
+        )
+    else:
+        dqi_dt[0] = (
+            solution.protocol.dose_at_time(t)
+            - model.clearance_rate * y[0] / model.vol_c - np.sum(transitions)
+        )
+    for i in range(1, model.number_of_compartments):
+        if model.subcutaneous_compartment and i == model.number_of_compartments - 1:
+            dqi_dt[i] = solution.protocol.dose_at_time(t) - model.subcutaneous_compartment * y[-1]
+        else:
+            dqi_dt[i] = transitions[i - 1]
+    return dqi_dt
+
+
+def make_solution(route, n_peripheral):
+    """
+    Compiled solution of an IV ('iv') or SC ('sc') model with n_peripheral peripheral
+    compartments, dosed continuously over the first half hour.
+    """
+    model = pk.Model()
+    if route == 'sc':
+        model.add_subcutaneous_compartment()
+    for _ in range(n_peripheral):
+        model.add_peripheral_compartment()
+    protocol = pk.Protocol()
+    protocol.make_continuous(0, 0.5)
+    solution = pk.Solution(model, protocol)
+    solution.compile()
+    return solution
+
+
+class RightHandSide:
+    """One evaluation of the right-hand side, compiled and reference implementation."""
+
+    params = [['iv', 'sc'], [0, 1, 2, 5, 10, 20, 50, 100]]
+    param_names = ['route', 'n_peripheral']
+
+    def setup(self, route, n_peripheral):
+        self.solution = make_solution(route, n_peripheral)
+        self.y = np.random.default_rng(0).random(self.solution.model.number_of_compartments)
+
+    def time_compiled(self, route, n_peripheral):
+        self.solution.system_of_equations(0.25, self.y)
+
+    def time_reference(self, route, n_peripheral):
+        reference_system_of_equations(self.solution, 0.25, self.y)
+
+
+def time_call(function, number):
+    """
+    Returns the best time of one call to function, in microseconds.
+    """
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+
+def main(peripheral_counts=(0, 1, 2, 5, 10, 20, 50, 100), number=2000):
+    print('{:>12} {:>16} {:>16} {:>8}'.format(
+        'peripherals', 'reference [us]', 'compiled [us]', 'speedup'))
+    for n_peripheral in peripheral_counts:
+        solution = make_solution('sc', n_peripheral)
+        y = np.random.default_rng(0).random(solution.model.number_of_compartments)
+
+        reference = time_call(lambda: reference_system_of_equations(solution, 0.25, y), number)
+        compiled = time_call(lambda: solution.system_of_equations(0.25, y), number)
+        assert np.allclose(reference_system_of_equations(solution, 0.25, y),
+                           solution.system_of_equations(0.25, y))
+        print('{:>12} {:>16.2f} {:>16.2f} {:>8.1f}'.format(
+            n_peripheral, reference, compiled, reference / compiled))
+
+
+if __name__ == '__main__':
+    main()
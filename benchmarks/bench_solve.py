@@ -0,0 +1,70 @@
+#
+# Benchmarks of Solution.solve
+#
+# Run with ``python benchmarks/run.py --filter bench_solve``.
+#
+
+import numpy as np
+
+import pkmodel as pk
+
+
+def make_model(route, n_peripheral):
+    """
+    IV ('iv') or subcutaneous ('sc') model with n_peripheral peripheral compartments.
+    """
+    model = pk.Model(clearance_rate=1, vol_c=2)
+    if route == 'sc':
+        model.add_subcutaneous_compartment(absorption_rate=3)
+    for i in range(n_peripheral):
+        model.add_peripheral_compartment(vol_p=1 + i, q_p=0.5)
+    return model
+
+
+def make_protocol(n_boluses, horizon):
+    """
+    n_boluses evenly spread instantaneous doses over the horizon.
+    """
+    return pk.Protocol(dose_times=list(np.linspace(0, horizon, n_boluses, endpoint=False)))
+
+
+class ModelSize:
+    """Solve cost as the model grows, for IV and SC dosing."""
+
+    params = [['iv', 'sc'], [0, 1, 2, 5, 10], ['RK45', 'exact']]
+    param_names = ['route', 'n_peripheral', 'method']
+
+    def setup(self, route, n_peripheral, method):
+        self.solution = pk.Solution(make_model(route, n_peripheral), make_protocol(4, 24))
+        self.t_eval = np.linspace(0, 24, 1000)
+
+    def time_solve(self, route, n_peripheral, method):
+        self.solution.solve(t_eval=self.t_eval, method=method)
+
+
+class Horizon:
+    """Solve cost against the length of the simulated time span, at one dose a day."""
+
+    params = [[24, 24 * 7, 24 * 28], ['RK45', 'BDF', 'exact']]
+    param_names = ['horizon', 'method']
+
+    def setup(self, horizon, method):
+        self.solution = pk.Solution(make_model('sc', 2), make_protocol(horizon // 24, horizon))
+        self.t_eval = np.linspace(0, horizon, 1000)
+
+    def time_solve(self, horizon, method):
+        self.solution.solve(t_eval=self.t_eval, method=method)
+
+
+class Boluses:
+    """Solve cost against the number of instantaneous doses, each one a segment boundary."""
+
+    params = [[1, 10, 100, 1000], ['RK45', 'exact', 'superposition']]
+    param_names = ['n_boluses', 'method']
+
+    def setup(self, n_boluses, method):
+        self.solution = pk.Solution(make_model('iv', 1), make_protocol(n_boluses, 100))
+        self.t_eval = np.linspace(0, 100, 1000)
+
+    def time_solve(self, n_boluses, method):
+        self.solution.solve(t_eval=self.t_eval, method=method)
@@ -0,0 +1,80 @@
+#
+# Benchmark of automatic solver selection on stiff models
+#
+# Run with ``python benchmarks/bench_stiff.py`` once pkmodel is installed, or
+# as part of the suite with ``python benchmarks/run.py --filter bench_stiff``.
+#
+# Solves models that combine fast subcutaneous absorption with slow, deep
+# peripheral compartments with the default RK45 and with method='auto', and
+# compares wall time, right-hand side evaluations and accuracy against the
+# exact solution.
+#
+
+import time
+
+import numpy as np
+
+import pkmodel as pk
+
+
+def stiff_model(absorption_rate, n_deep):
+    """
+    SC model with a fast absorption rate and n_deep large, slowly exchanging
+    peripheral compartments.
+    """
+    model = pk.Model(clearance_rate=1, vol_c=10)
+    model.add_subcutaneous_compartment(absorption_rate=absorption_rate)
+    for _ in range(n_deep):
+        model.add_peripheral_compartment(vol_p=1000, q_p=0.05)
+    return model
+
+
+class StiffSolve:
+    """Solve cost of RK45 and method='auto' as SC absorption gets faster."""
+
+    params = [[1, 100, 1000], ['RK45', 'auto']]
+    param_names = ['absorption_rate', 'method']
+
+    def setup(self, absorption_rate, method):
+        self.solution = pk.Solution(stiff_model(absorption_rate, 2),
+                                    pk.Protocol(dose_amount=100, dose_times=[0, 12, 24, 36]))
+        self.t_eval = np.linspace(0, 48, 1000)
+
+    def time_solve(self, absorption_rate, method):
+        self.solution.solve(t_eval=self.t_eval, method=method)
+
+
+def time_solve(model, protocol, t_eval, method):
+    """
+    Returns the wall time in seconds, the number of right-hand side evaluations and
+    the solution of one solve.
+    """
+    solution = pk.Solution(model, protocol)
+    start = time.perf_counter()
+    solution.solve(t_eval=t_eval, method=method)
+    return time.perf_counter() - start, solution.solution.nfev, solution
+
+
+def main(absorption_rates=(1, 100, 1000, 10000), n_deep=2, horizon=48):
+    protocol = pk.Protocol(dose_amount=100, dose_times=[0, 12, 24, 36])
+    t_eval = np.linspace(0, horizon, 1000)
+    print('{:>10} {:>8} {:>10} {:>8} {:>10} {:>8} {:>8} {:>10} {:>10}'.format(
+        'ka [/h]', 'auto', 'RK45 [s]', 'nfev', 'auto [s]', 'nfev', 'speedup',
+        'RK45 err', 'auto err'))
+    for absorption_rate in absorption_rates:
+        model = stiff_model(absorption_rate, n_deep)
+        exact = pk.Solution(model, protocol)
+        exact.solve(t_eval=t_eval, method='exact')
+
+        rk45, rk45_nfev, rk45_solution = time_solve(model, protocol, t_eval, 'RK45')
+        auto, auto_nfev, auto_solution = time_solve(model, protocol, t_eval, 'auto')
+        scale = np.max(np.abs(exact.solution.y))
+        print('{:>10g} {:>8} {:>10.3f} {:>8} {:>10.3f} {:>8} {:>8.1f} {:>10.1e} {:>10.1e}'.format(
+            absorption_rate, auto_solution.method_info['method'], rk45, rk45_nfev, auto, auto_nfev,
+            rk45 / auto,
+            np.max(np.abs(rk45_solution.solution.y - exact.solution.y)) / scale,
+            np.max(np.abs(auto_solution.solution.y - exact.solution.y)) / scale))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#
+# Benchmark runner
+#
+# Run with ``python benchmarks/run.py`` once pkmodel is installed.
+#
+# Discovers the benchmarks in the benchmarks/bench_*.py modules, times every
+# parameter combination and writes the results as JSON, e.g.
+#
+#     python benchmarks/run.py -o results/1.0.0.json
+#     python benchmarks/run.py --filter Solve --quick
+#     python benchmarks/run.py --compare results/1.0.0.json results/new.json
+#
+# Benchmarks are classes written in the style of asv (airspeed velocity):
+# ``params`` is a list of value lists, ``param_names`` names them, ``setup``
+# is called with every combination of values before timing, and every
+# ``time_*`` method is timed with the same arguments.
+#
+
+import argparse
+import datetime
+import importlib
+import inspect
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+import scipy
+
+import pkmodel as pk
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def discover(pattern=None):
+    """
+    Yields (name, class, method name) for every time_* method of the benchmark
+    classes in the bench_*.py modules whose full name contains pattern.
+    """
+    sys.path.insert(0, BENCHMARK_DIR)
+    for filename in sorted(os.listdir(BENCHMARK_DIR)):
+        if not (filename.startswith('bench_') and filename.endswith('.py')):
+            continue
+        module = importlib.import_module(filename[:-3])
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            for method_name in sorted(name for name in dir(cls) if name.startswith('time_')):
+                name = '{}.{}.{}'.format(module.__name__, class_name, method_name)
+                if pattern is None or pattern in name:
+                    yield name, cls, method_name
+
+
+def time_benchmark(cls, method_name, params, repeat, min_time):
+    """
+    Best time of one call of a benchmark method, in seconds, and the number of calls
+    per measurement, chosen so that a measurement takes at least min_time.
+    """
+    benchmark = cls()
+    if hasattr(benchmark, 'setup'):
+        benchmark.setup(*params)
+    method = getattr(benchmark, method_name)
+    timer = timeit.Timer(lambda: method(*params))
+    number = 1
+    while timer.timeit(number) < min_time and number < 10**6:
+        number *= 10
+    return min(timer.repeat(repeat=repeat, number=number)) / number, number
+
+
+def metadata():
+    """
+    Versions and machine details stored with the results, so that runs can be compared.
+    """
+    try:
+        # stdout=PIPE and universal_newlines rather than capture_output and text, which are 3.7+
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARK_DIR, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'pkmodel': pk.VERSION, 'commit': commit, 'numpy': np.__version__,
+            'scipy': scipy.__version__, 'python': platform.python_version(),
+            'machine': platform.machine(), 'processor': platform.processor(),
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat()}
+
+
+def run(pattern=None, repeat=5, min_time=0.05):
+    """
+    Times every benchmark and parameter combination.
+
+    :return: dict with 'metadata' and a list of 'results', each with the benchmark
+             name, its parameters, the best time per call in seconds and the number
+             of calls per measurement
+    """
+    results = []
+    for name, cls, method_name in discover(pattern):
+        params = getattr(cls, 'params', [])
+        param_names = getattr(cls, 'param_names', ['p{}'.format(i) for i in range(len(params))])
+        for values in itertools.product(*params):
+            seconds, number = time_benchmark(cls, method_name, values, repeat, min_time)
+            results.append({'benchmark': name, 'params': dict(zip(param_names, values)),
+                            'seconds': seconds, 'number': number})
+            print('{:<55} {:<45} {:>12.3e} s'.format(
+                name, json.dumps(results[-1]['params']), seconds), flush=True)
+    return {'metadata': metadata(), 'results': results}
+
+
+def compare(old, new, threshold=0.2):
+    """
+    Matches the results of two runs by benchmark and parameters, and prints the ratio
+    of the new to the old time.
+
+    :return: list of the (name, params, ratio) that got slower by more than threshold
+    """
+    def key(result):
+        return result['benchmark'], json.dumps(result['params'], sort_keys=True)
+
+    before = {key(result): result['seconds'] for result in old['results']}
+    regressions = []
+    for result in new['results']:
+        if key(result) not in before:
+            continue
+        ratio = result['seconds'] / before[key(result)]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'SLOWER'
+            regressions.append((result['benchmark'], result['params'], ratio))
+        elif ratio < 1 / (1 + threshold):
+            flag = 'faster'
+        print('{:<55} {:<45} {:>8.2f} {}'.format(
+            result['benchmark'], json.dumps(result['params']), ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-o', '--output', help='JSON file to write the results to')
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='one repeat of at least 10 ms')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slow-down reported as a regression')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        return 1 if compare(old, new, args.threshold) else 0
+
+    if args.quick:
+        report = run(args.filter, repeat=1, min_time=0.01)
+    else:
+        report = run(args.filter)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
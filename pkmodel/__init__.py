@@ -9,5 +9,18 @@ from .version_info import VERSION_INT, VERSION  # noqa
 
 # Import main classes
 from .model import Model    # noqa
-from .protocol import Protocol    # noqa
+from .network import CompartmentNetwork    # noqa
+from .protocol import Protocol, DoseSchedule, SampledProtocol    # noqa
+from .metrics import ExposureMetrics    # noqa
+from .events import ThresholdEvent    # noqa
+from .sensitivity import SensitivityPropagator    # noqa
+from .stats import SolveStats, add_hook, remove_hook, collect_stats    # noqa
+from .fit import ModelFit, fit_many    # noqa
 from .solution import Solution     # noqa
+from .cache import SolutionCache    # noqa
+from .population import PopulationSolution    # noqa
+from .sweep import ParameterSweep    # noqa
+from .steady_state import PeriodicDosing    # noqa
+from .store import ResultStore    # noqa
+from .uncertainty import MonteCarlo    # noqa
+from .regimen import RegimenOptimiser    # noqa
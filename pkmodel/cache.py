@@ -0,0 +1,128 @@
+#
+# SolutionCache class
+#
+
+import collections
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class SolutionCache:
+    """Memoises solutions keyed on a canonical hash of everything that determines
+    them: model parameters and compartment layout, dosing protocol, initial values,
+    time points and solve method. Keeps the most recently used solutions in memory
+    and, optionally, every solution as a .npy file in a directory that survives
+    process restarts.
+    """
+
+    def __init__(self, maxsize=128, directory=None):
+        """
+        :param maxsize: number of solutions kept in memory
+        :param directory: directory for the on-disk store, or None for memory only
+        :arg hits, misses: number of lookups answered / not answered by the cache
+        :arg disk_hits: number of hits that had to be loaded from disk
+        :arg evictions: number of solutions dropped from memory
+        """
+        if maxsize < 0:
+            raise ValueError("maxsize cannot be negative")
+        self.maxsize = maxsize
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._memory = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model, protocol, y0, t_eval, method):
+        """
+        Canonical hash of a solve.
+
+        :return: hex digest string
+        """
+        digest = hashlib.sha256()
+        description = {"model": model.to_dict(), "protocol": protocol.to_dict(), "method": method}
+        digest.update(json.dumps(description, sort_keys=True, default=float).encode())
+        for array in (y0, t_eval):
+            array = np.ascontiguousarray(array, dtype=np.float64)
+            digest.update(str(array.shape).encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key):
+        """
+        Looks up a solution, first in memory and then on disk.
+
+        :param key: as returned by key
+        :return: copy of the stored (n_compartments, n_times) array, or None on a miss
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key].copy()
+
+        if self.directory is not None and os.path.exists(self._path(key)):
+            y = np.load(self._path(key))
+            self._remember(key, y)
+            self.hits += 1
+            self.disk_hits += 1
+            return y.copy()
+
+        self.misses += 1
+        return None
+
+    def put(self, key, y):
+        """
+        Stores a solution in memory and, if there is one, in the on-disk store.
+
+        :param key: as returned by key
+        :param y: (n_compartments, n_times) array of drug quantities
+        """
+        y = np.array(y, dtype=np.float64)
+        self._remember(key, y)
+        if self.directory is not None:
+            # write then rename, so concurrent readers never see a partial file
+            tmp = self._path(key) + ".{}.tmp".format(os.getpid())
+            with open(tmp, "wb") as f:
+                np.save(f, y)
+            os.replace(tmp, self._path(key))
+
+    def _remember(self, key, y):
+        """
+        Adds y to the in-memory LRU, evicting the least recently used entries.
+        """
+        self._memory[key] = y
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        :return: dict of hit/miss statistics and the current memory usage
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._memory),
+                "maxsize": self.maxsize,
+                "nbytes": sum(y.nbytes for y in self._memory.values())}
+
+    def clear(self):
+        """
+        Empties the in-memory cache and resets the statistics.
+        The on-disk store is left untouched.
+        """
+        self._memory.clear()
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
@@ -0,0 +1,152 @@
+#
+# ThresholdEvent class
+#
+
+import numpy as np
+
+
+class ThresholdEvent:
+    """The drug quantity in one compartment crossing a level, e.g. the central
+    compartment exceeding a toxicity limit. Can be passed to Solution.solve,
+    and is also a valid scipy.integrate.solve_ivp event function.
+    """
+
+    def __init__(self, compartment, level, direction=0, terminal=False):
+        """
+        :param compartment: index of the compartment that is watched
+        :param level: drug quantity that triggers the event
+        :param direction: 1 to only count upward crossings, -1 for downward ones,
+                          0 for both
+        :param terminal: whether the solve stops at the first crossing
+        """
+        self.compartment = compartment
+        self.level = level
+        self.direction = direction
+        self.terminal = terminal
+
+    def __call__(self, t, y):
+        return y[self.compartment] - self.level
+
+    def crossings(self, before, after):
+        """
+        Which consecutive pairs of drug quantities cross the level in the watched
+        direction.
+
+        :param before: array of values of the event function
+        :param after: array of values of the event function, one step later
+        :return: boolean numpy array
+        """
+        up = (before < 0) & (after >= 0)
+        down = (before > 0) & (after <= 0)
+        if self.direction > 0:
+            return up
+        if self.direction < 0:
+            return down
+        return up | down
+
+
+class EventLog:
+    """Records the crossings of a list of ThresholdEvents while a solution is computed
+    segment by segment, and the time of the first terminal crossing.
+    """
+
+    def __init__(self, events, t0, y0, samples=16):
+        """
+        :param events: list of ThresholdEvent objects
+        :param t0: initial time
+        :param y0: initial drug quantities, before any dose at t0
+        :param samples: number of extra points per segment at which the exact
+                        solution is checked for sign changes
+        """
+        self.events = list(events)
+        self.samples = samples
+        self.times = [[] for _ in self.events]
+        self.states = [[] for _ in self.events]
+        self.t_terminal = None
+        self._t_last, self._y_last = t0, np.array(y0, dtype=float)
+
+    @property
+    def terminated(self):
+        return self.t_terminal is not None
+
+    def record(self, i, t, y):
+        """
+        Records a crossing of event i at time t in state y.
+        """
+        self.times[i].append(t)
+        self.states[i].append(np.array(y, dtype=float))
+        if self.events[i].terminal and (self.t_terminal is None or t < self.t_terminal):
+            self.t_terminal = t
+
+    def check_jump(self, t, y):
+        """
+        Records crossings caused by an instantaneous dose, i.e. between the state at the
+        end of the previous segment and the state y at the start of the next one.
+        """
+        if t != self._t_last:
+            return
+        for i, event in enumerate(self.events):
+            if event.crossings(event(t, self._y_last), event(t, y)):
+                self.record(i, t, y)
+
+    def locate(self, trajectory, start, end, t):
+        """
+        Finds crossings within a segment of the exact solution. The event functions are
+        evaluated at t, at the segment edges and at evenly spaced extra points; every
+        sign change is then refined by root finding on the exact trajectory. Crossings
+        that come and go between two of these points are missed. After a terminal
+        crossing, later crossings are discarded.
+
+        :param trajectory: function mapping an array of times to the (n, len) states
+        :param start: start of the segment
+        :param end: end of the segment
+        :param t: output times in the segment
+        """
+        import scipy.optimize
+
+        points = np.unique(np.concatenate([[start, end], t, np.linspace(start, end, self.samples + 2)]))
+        y = trajectory(points)
+        found = []
+        for i, event in enumerate(self.events):
+            g = event(points, y)
+            for j in np.nonzero(event.crossings(g[:-1], g[1:]))[0]:
+                if g[j + 1] == 0:
+                    root = points[j + 1]
+                else:
+                    root = scipy.optimize.brentq(
+                        lambda s: event(s, trajectory(np.array([s]))[:, 0]), points[j], points[j + 1],
+                        xtol=1e-14, rtol=8 * np.finfo(float).eps)
+                found.append((root, i))
+
+        for root, i in sorted(found):
+            if self.terminated and root > self.t_terminal:
+                break
+            self.record(i, root, trajectory(np.array([root]))[:, 0])
+
+    def record_solve_ivp(self, sol):
+        """
+        Records the events found by a solve_ivp call given events=self.events.
+        """
+        for i in range(len(self.events)):
+            for t, y in zip(sol.t_events[i], sol.y_events[i]):
+                self.record(i, t, y)
+
+    def done(self, t, y):
+        """
+        Marks the end of a segment at time t in state y.
+        """
+        self._t_last, self._y_last = t, np.array(y, dtype=float)
+
+    def apply(self, result):
+        """
+        Adds t_events and y_events to a solution bunch, and truncates it after a terminal
+        event, as solve_ivp does.
+        """
+        n = result.y.shape[0]
+        result.t_events = [np.array(times, dtype=float) for times in self.times]
+        result.y_events = [np.array(states, dtype=float).reshape(-1, n) for states in self.states]
+        if self.terminated:
+            keep = result.t <= self.t_terminal
+            result.t, result.y = result.t[keep], result.y[:, keep]
+            result.status, result.message = 1, 'A termination event occurred.'
+        return result
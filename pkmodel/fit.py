@@ -0,0 +1,178 @@
+#
+# ModelFit class
+#
+
+import numpy as np
+from pkmodel.model import Model
+from pkmodel.solution import Solution
+
+
+def _set_parameters(model, names, values):
+    """
+    Copy of model with the parameters called names (see Model.parameter_names) set to values.
+    """
+    data = model.to_dict()
+    for name, value in zip(names, values):
+        value = float(value)
+        if name == "absorption_rate":
+            data["subcutaneous_compartment"] = value
+        elif name.startswith(("vol_p_", "q_p_")):
+            key, i = name.rsplit("_", 1)
+            data["peripheral_compartments"][int(i) - 1][key] = value
+        else:
+            data[name] = value
+    return Model.from_dict(data)
+
+
+def _get_parameters(model, names):
+    """
+    Values of the parameters called names, as a numpy array.
+    """
+    data = model.to_dict()
+    values = []
+    for name in names:
+        if name == "absorption_rate":
+            values.append(data["subcutaneous_compartment"])
+        elif name.startswith(("vol_p_", "q_p_")):
+            key, i = name.rsplit("_", 1)
+            values.append(data["peripheral_compartments"][int(i) - 1][key])
+        else:
+            values.append(data[name])
+    return np.array(values, dtype=float)
+
+
+def _fit(fit, options):
+    """
+    Worker task of fit_many.
+    """
+    return fit.fit(**options)
+
+
+def fit_many(fits, max_workers=None, chunk_size=8, **options):
+    """
+    Fits many patients at once, spreading the ModelFit objects over a pool of worker
+    processes. Each fit is small, so they are handed out chunk_size at a time.
+
+    :param fits: sequence of ModelFit objects, e.g. one per patient
+    :param max_workers: number of worker processes, defaults to the number of CPUs;
+                        1 fits every patient in this process
+    :param chunk_size: number of fits handed to a worker at a time
+    :param options: keyword arguments passed on to ModelFit.fit
+    :return: list of results of ModelFit.fit, in the order of fits
+    """
+    fits = list(fits)
+    if max_workers == 1:
+        return [fit.fit(**options) for fit in fits]
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_fit, fits, [options] * len(fits), chunksize=chunk_size))
+
+
+class ModelFit:
+    """Fits model parameters to drug concentrations measured in the central compartment
+    (quantity / vol_c) by nonlinear least squares. The model is only solved at the
+    observation times, and the Jacobian of the residuals comes from the exact forward
+    sensitivities (see Solution.sensitivities), which are computed in the same pass as
+    the residuals.
+    """
+
+    def __init__(self, model, protocol, times, concentrations, parameters=None,
+                 sigma=None, y0=None, t_start=0):
+        """
+        :param model: Model giving the topology and the initial parameter values
+        :param protocol: dosing protocol of the patient
+        :param times: observation times, after t_start
+        :param concentrations: observed central concentrations, one per time
+        :param parameters: names of the fitted parameters (see Model.parameter_names),
+                           defaults to all of them; the others keep their values
+        :param sigma: standard deviation of each observation, scalar or one per time;
+                      residuals are divided by it
+        :param y0: initial drug quantities at t_start, zero by default
+        :param t_start: time at which the protocol and the solve start
+        """
+        self.model = model
+        self.protocol = protocol
+        self.times = np.asarray(times, dtype=float)
+        self.concentrations = np.asarray(concentrations, dtype=float)
+        if self.times.shape != self.concentrations.shape or self.times.ndim != 1:
+            raise ValueError("times and concentrations must be 1D arrays of the same length")
+        if np.any(self.times < t_start):
+            raise ValueError("Observation times cannot be before t_start")
+        self.parameters = list(model.parameter_names() if parameters is None else parameters)
+        for name in self.parameters:
+            if name not in model.parameter_names():
+                raise ValueError("The model has no parameter {}".format(name))
+        self.sigma = np.broadcast_to(np.asarray(1.0 if sigma is None else sigma, dtype=float),
+                                     self.times.shape)
+        self.y0 = y0
+
+        # the solve only visits t_start and the distinct observation times
+        self.t_eval, self._index = np.unique(np.append(t_start, self.times), return_inverse=True)
+        self._index = self._index[1:]
+        self._solution = Solution(model, protocol)
+        self._last = None
+
+    def _evaluate(self, x):
+        """
+        Residuals and their Jacobian at parameter values x, kept for the last x since
+        the optimiser asks for both at the same point.
+        """
+        x = np.asarray(x, dtype=float)
+        if self._last is not None and np.array_equal(self._last[0], x):
+            return self._last[1:]
+
+        model = _set_parameters(self.model, self.parameters, x)
+        self._solution.model = model
+        y0 = None if self.y0 is None else np.asarray(self.y0, dtype=float)
+        sensitivities = self._solution.sensitivities(y0=y0, t_eval=self.t_eval, method='exact')
+        quantity = self._solution.solution.y[0, self._index]
+        vol_c = model.vol_c
+
+        residuals = (quantity / vol_c - self.concentrations) / self.sigma
+        columns = [model.parameter_names().index(name) for name in self.parameters]
+        jacobian = sensitivities[columns][:, 0, self._index].T / vol_c
+        if "vol_c" in self.parameters:
+            jacobian[:, self.parameters.index("vol_c")] -= quantity / vol_c**2
+        jacobian /= self.sigma[:, np.newaxis]
+        self._last = (x.copy(), residuals, jacobian)
+        return residuals, jacobian
+
+    def residuals(self, x):
+        """
+        Weighted differences between predicted and observed concentrations.
+
+        :param x: values of the fitted parameters, in the order of self.parameters
+        :return: (n_observations,) numpy array
+        """
+        return self._evaluate(x)[0]
+
+    def jacobian(self, x):
+        """
+        Exact derivatives of the residuals with respect to the fitted parameters.
+
+        :param x: values of the fitted parameters, in the order of self.parameters
+        :return: (n_observations, n_parameters) numpy array
+        """
+        return self._evaluate(x)[1]
+
+    def fit(self, x0=None, **options):
+        """
+        Minimises the sum of squared residuals with scipy.optimize.least_squares,
+        keeping every parameter positive.
+
+        :param x0: initial parameter values, defaults to those of the model
+        :param options: keyword arguments passed on to scipy.optimize.least_squares
+        :return: scipy OptimizeResult, with additionally the fitted 'parameters' as a
+                 dict and the fitted 'model'
+        """
+        import scipy.optimize
+
+        if x0 is None:
+            x0 = _get_parameters(self.model, self.parameters)
+        options.setdefault('bounds', (0, np.inf))
+        options.setdefault('x_scale', 'jac')
+        result = scipy.optimize.least_squares(self.residuals, x0, jac=self.jacobian, **options)
+        result.parameters = {name: float(value) for name, value in zip(self.parameters, result.x)}
+        result.model = _set_parameters(self.model, self.parameters, result.x)
+        return result
@@ -0,0 +1,184 @@
+#
+# LinearPropagator class
+#
+
+import sys
+
+import numpy as np
+
+
+class LinearPropagator:
+    """Advances the linear system dx/dt = A x + b u exactly, for a constant
+    input rate u, using the eigendecomposition of the rate matrix A.
+    A may be a stack of matrices (..., n, n), e.g. one per patient, in which
+    case every system is advanced at once.
+    Systems whose A is not (numerically) diagonalisable fall back to matrix
+    exponentials of the augmented system [[A, b], [0, 0]].
+    """
+
+    def __init__(self, rate_matrix, input_vector, max_condition=1e8):
+        """
+        Decomposes the rate matrix once so that every later step is exact
+        and only costs a few small mat-vecs.
+
+        :param rate_matrix: (..., n, n) array A of first-order transfer rates
+        :param input_vector: (..., n) array b distributing the dose rate u
+        :param max_condition: largest condition number of the eigenvector
+                              matrix for which the eigendecomposition is used
+        """
+        self.rate_matrix = np.asarray(rate_matrix, dtype=float)
+        self.input_vector = np.broadcast_to(
+            np.asarray(input_vector, dtype=float), self.rate_matrix.shape[:-1])
+
+        eigenvalues, eigenvectors = np.linalg.eig(self.rate_matrix)
+        # condition numbers above max_condition (or inf) flag defective matrices
+        self.defective = ~(np.linalg.cond(eigenvectors) < max_condition)
+        eigenvectors[self.defective] = np.eye(self.rate_matrix.shape[-1])
+
+        self.eigenvalues = eigenvalues
+        self.eigenvectors = eigenvectors
+        self.inverse_eigenvectors = np.linalg.inv(eigenvectors)
+        self._input_modes = (self.inverse_eigenvectors
+                             @ self.input_vector[..., np.newaxis])[..., 0]
+
+    def step(self, x0, u, dt):
+        """
+        Evaluates the state a time dt after x0, with the input held at u.
+
+        :param x0: (..., n) state at the start of the interval
+        :param u: constant input rate over the interval, scalar or (...)
+        :param dt: array of non-negative time offsets from the start
+        :return: (..., n, len(dt)) array of states
+        """
+        x0 = np.asarray(x0, dtype=float)
+        u = np.asarray(u, dtype=float)
+        dt = np.atleast_1d(np.asarray(dt, dtype=float))
+
+        lam = self.eigenvalues[..., np.newaxis]
+        decay = np.exp(lam * dt)
+        # integral of exp(lam * s) over [0, dt], exact also for lam == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(lam == 0, dt, np.expm1(lam * dt) / lam)
+
+        modes = (decay * (self.inverse_eigenvectors @ x0[..., np.newaxis])
+                 + growth * self._input_modes[..., np.newaxis]
+                 * u[..., np.newaxis, np.newaxis])
+        x = np.real(self.eigenvectors @ modes)
+
+        if np.any(self.defective):
+            x0 = np.broadcast_to(x0, self.input_vector.shape)
+            u = np.broadcast_to(u, self.defective.shape)
+            for index in np.ndindex(*self.defective.shape):
+                if self.defective[index]:
+                    x[index] = self._step_expm(index, x0[index], u[index], dt)
+        return x
+
+    def _step_expm(self, index, x0, u, dt):
+        """
+        Same as step for the single system at index, using the exponential
+        of the augmented matrix for every offset in dt.
+        """
+        import scipy.linalg
+
+        n = self.rate_matrix.shape[-1]
+        augmented = np.zeros((n + 1, n + 1))
+        augmented[:n, :n] = self.rate_matrix[index]
+        augmented[:n, n] = self.input_vector[index]
+        z0 = np.append(x0, u)
+
+        x = np.empty((n, len(dt)))
+        for j, d in enumerate(dt):
+            x[:, j] = (scipy.linalg.expm(augmented * d) @ z0)[:n]
+        return x
+
+
+def is_sparse(matrix):
+    """
+    Whether matrix is a scipy.sparse matrix or array. scipy.sparse is not imported for the
+    check: if it has not been loaded, nothing can be sparse.
+    """
+    return 'scipy.sparse' in sys.modules and sys.modules['scipy.sparse'].issparse(matrix)
+
+
+def solve_linear(matrix, rhs):
+    """
+    Solves matrix @ x = rhs for a dense stack of matrices or a sparse matrix.
+
+    :param matrix: (..., n, n) numpy array or (n, n) scipy.sparse matrix
+    :param rhs: (..., n) numpy array
+    :return: (..., n) numpy array
+    """
+    if is_sparse(matrix):
+        import scipy.sparse.linalg
+
+        rhs = np.asarray(rhs, dtype=float)
+        x = scipy.sparse.linalg.spsolve(matrix.tocsc(), rhs.reshape(-1, rhs.shape[-1]).T)
+        return np.asarray(x).T.reshape(rhs.shape)
+    return np.linalg.solve(matrix, np.asarray(rhs)[..., np.newaxis])[..., 0]
+
+
+def make_propagator(rate_matrix, input_vector):
+    """
+    Propagator for a rate matrix: a SparsePropagator for a scipy.sparse matrix, a
+    LinearPropagator otherwise.
+    """
+    if is_sparse(rate_matrix):
+        return SparsePropagator(rate_matrix, input_vector)
+    return LinearPropagator(rate_matrix, input_vector)
+
+
+class SparsePropagator:
+    """Advances the linear system dx/dt = A x + b u exactly for a large, sparse rate
+    matrix A (see CompartmentNetwork), with the same step method as LinearPropagator.
+    The action of the exponential of the augmented matrix [[A, b], [0, 0]] is computed
+    with scipy.sparse.linalg.expm_multiply, whose cost grows with the number of
+    non-zero entries (transfers) rather than with n squared. A is never decomposed or
+    made dense.
+    """
+
+    def __init__(self, rate_matrix, input_vector):
+        """
+        :param rate_matrix: (n, n) scipy.sparse matrix A of first-order transfer rates
+        :param input_vector: (n,) array b distributing the dose rate u
+        """
+        import scipy.sparse
+
+        self.rate_matrix = scipy.sparse.csr_matrix(rate_matrix, dtype=float)
+        self.input_vector = np.asarray(input_vector, dtype=float)
+        n = len(self.input_vector)
+        self._augmented = scipy.sparse.bmat(
+            [[self.rate_matrix, scipy.sparse.csr_matrix(self.input_vector[:, np.newaxis])],
+             [None, scipy.sparse.csr_matrix((1, 1))]], format='csr')
+        self._n = n
+
+    def step(self, x0, u, dt):
+        """
+        Evaluates the state a time dt after x0, with the input held at u.
+
+        :param x0: (n,) state at the start of the interval
+        :param u: constant input rate over the interval
+        :param dt: sorted array of non-negative time offsets from the start
+        :return: (n, len(dt)) array of states
+        """
+        import scipy.sparse.linalg
+
+        dt = np.atleast_1d(np.asarray(dt, dtype=float))
+        z = np.append(np.asarray(x0, dtype=float), float(u))
+        x = np.empty((self._n, len(dt)))
+        # evenly spaced offsets (but for the last, the end of a segment) in one call
+        grid = len(dt) - 1
+        if grid >= 3 and np.allclose(np.diff(dt[:grid]), dt[1] - dt[0], rtol=1e-12, atol=0):
+            if dt[0] > 0:
+                z = scipy.sparse.linalg.expm_multiply(self._augmented * dt[0], z)
+            z_grid = scipy.sparse.linalg.expm_multiply(
+                self._augmented, z, start=0, stop=dt[grid - 1] - dt[0], num=grid, endpoint=True)
+            x[:, :grid] = z_grid[:, :self._n].T
+            z, previous, first = z_grid[-1], dt[grid - 1], grid
+        else:
+            previous, first = 0.0, 0
+        for j in range(first, len(dt)):
+            if dt[j] > previous:
+                z = scipy.sparse.linalg.expm_multiply(self._augmented * (dt[j] - previous), z)
+                previous = dt[j]
+            x[:, j] = z[:self._n]
+        return x
@@ -0,0 +1,115 @@
+#
+# ExposureMetrics class
+#
+
+import numpy as np
+from pkmodel.linear import solve_linear
+
+
+def _time_above(a, b, dt, level):
+    """
+    Time that the straight line from a to b, over an interval of length dt,
+    spends above level.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = dt * (np.maximum(a, b) - level) / np.abs(b - a)
+    time = np.where((a > level) & (b > level), dt, 0.0)
+    return np.where((a > level) != (b > level), crossing, time)
+
+
+class ExposureMetrics:
+    """Exposure metrics of every compartment (AUC, Cmax/Tmax, Cmin/Tmin, time above a
+    toxicity threshold and time within a therapeutic window), accumulated in a single
+    pass over blocks of solver output such as those of Solution.iter_solve. Blocks may
+    carry batch axes, e.g. (n_patients, n_compartments, n_times). Between time points
+    the trajectory is taken to be linear. Metrics are computed on the solved
+    quantities (drug mass), so thresholds are in the same units.
+    """
+
+    def __init__(self, toxicity_threshold=None, therapeutic_window=None):
+        """
+        :param toxicity_threshold: level above which time is counted as toxic
+        :param therapeutic_window: (low, high) levels between which time is counted
+                                   as therapeutic
+        """
+        self.toxicity_threshold = toxicity_threshold
+        self.therapeutic_window = therapeutic_window
+        self.t_start = None
+        self.y_start = None
+        self._t_last = None
+        self._y_last = None
+
+    def update(self, t, y):
+        """
+        Adds a block of the solution, which continues the previous one.
+
+        :param t: (m,) time points, later than those of earlier blocks
+        :param y: (..., n_compartments, m) solution at t
+        :return: ---
+        """
+        t = np.asarray(t, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if len(t) == 0:
+            return
+        if self._t_last is None:
+            self.t_start, self.y_start = t[0], y[..., 0].copy()
+            self.auc = np.zeros(y.shape[:-1])
+            self.cmax, self.tmax = y[..., 0].copy(), np.full(y.shape[:-1], t[0])
+            self.cmin, self.tmin = y[..., 0].copy(), np.full(y.shape[:-1], t[0])
+            self.time_above = np.zeros(y.shape[:-1])
+            self.time_in_window = np.zeros(y.shape[:-1])
+        else:
+            # join the block to the end of the previous one
+            t = np.append(self._t_last, t)
+            y = np.concatenate([self._y_last[..., np.newaxis], y], axis=-1)
+
+        dt = np.diff(t)
+        a, b = y[..., :-1], y[..., 1:]
+        self.auc += np.sum(0.5 * (a + b) * dt, axis=-1)
+
+        i = np.argmax(y, axis=-1)
+        peak = np.take_along_axis(y, i[..., np.newaxis], axis=-1)[..., 0]
+        higher = peak > self.cmax
+        self.cmax, self.tmax = np.where(higher, peak, self.cmax), np.where(higher, t[i], self.tmax)
+        i = np.argmin(y, axis=-1)
+        trough = np.take_along_axis(y, i[..., np.newaxis], axis=-1)[..., 0]
+        lower = trough < self.cmin
+        self.cmin, self.tmin = np.where(lower, trough, self.cmin), np.where(lower, t[i], self.tmin)
+
+        if self.toxicity_threshold is not None:
+            self.time_above += np.sum(_time_above(a, b, dt, self.toxicity_threshold), axis=-1)
+        if self.therapeutic_window is not None:
+            low, high = self.therapeutic_window
+            self.time_in_window += np.sum(
+                _time_above(a, b, dt, low) - _time_above(a, b, dt, high), axis=-1)
+
+        self._t_last, self._y_last = t[-1], y[..., -1].copy()
+
+    def exact_auc(self, model, protocol):
+        """
+        AUC of the exact solution of the linear model over the time covered so far.
+        Integrating dx/dt = A x + b u gives A AUC = x(end) - x(start) - b D, where D is
+        the dose given after the start, so no quadrature error is involved.
+
+        :param model: Model (or PopulationSolution, for batched blocks) that was solved
+        :param protocol: dosing protocol that was solved
+        :return: (..., n_compartments) numpy array
+        """
+        dose = protocol.total_dose(self.t_start, self._t_last)
+        change = self._y_last - self.y_start - dose * model.input_vector()
+        return solve_linear(model.rate_matrix(), change)
+
+    def result(self):
+        """
+        :return: dict of (..., n_compartments) numpy arrays
+        """
+        if self._t_last is None:
+            raise ValueError("No solution has been added yet")
+        result = {"auc": self.auc, "cmax": self.cmax, "tmax": self.tmax,
+                  "cmin": self.cmin, "tmin": self.tmin,
+                  "duration": self._t_last - self.t_start}
+        if self.toxicity_threshold is not None:
+            result["time_above_threshold"] = self.time_above
+        if self.therapeutic_window is not None:
+            result["time_in_window"] = self.time_in_window
+        return result
@@ -2,6 +2,52 @@
 # Model class
 #
 
+import numpy as np
+
+
+def assemble_rate_matrix(clearance_rate, vol_c, vol_p=(), q_p=(),
+                         absorption_rate=None):
+    '''Assembles the rate matrix A of dq/dt = A q + b dose(t) for a central
+    compartment, any number of peripheral compartments and an optional SC
+    compartment. All parameters may carry the same leading batch shape
+    (e.g. one value per patient) to build a stack of matrices at once.
+    State order: central, peripherals, then SC.
+
+    :param clearance_rate: (...) clearance rates [ml/h]
+    :param vol_c: (...) central compartment volumes [ml]
+    :param vol_p: (..., n_peripheral) peripheral compartment volumes [ml]
+    :param q_p: (..., n_peripheral) peripheral transfer rates [ml/h]
+    :param absorption_rate: (...) SC absorption rates [/h], or None for IVB
+    :return: (..., n, n) numpy array of transfer rates [/h]
+    '''
+    clearance_rate = np.asarray(clearance_rate, dtype=float)
+    vol_c = np.asarray(vol_c, dtype=float)
+    vol_p = np.asarray(vol_p, dtype=float)
+    q_p = np.asarray(q_p, dtype=float)
+    if absorption_rate is not None:
+        absorption_rate = np.asarray(absorption_rate, dtype=float)
+    batch = np.broadcast(
+        clearance_rate, vol_c, vol_p.sum(axis=-1), q_p.sum(axis=-1),
+        0 if absorption_rate is None else absorption_rate).shape
+
+    n_peripheral = vol_p.shape[-1]
+    n = 1 + n_peripheral + (absorption_rate is not None)
+    A = np.zeros(batch + (n, n))
+
+    to_peripheral = q_p / vol_c[..., np.newaxis]
+    to_central = q_p / vol_p
+    A[..., 0, 0] = -clearance_rate / vol_c - to_peripheral.sum(axis=-1)
+    peripheral = np.arange(1, n_peripheral + 1)
+    A[..., peripheral, 0] = to_peripheral
+    A[..., 0, peripheral] = to_central
+    A[..., peripheral, peripheral] = -to_central
+
+    if absorption_rate is not None:
+        A[..., 0, n - 1] = absorption_rate
+        A[..., n - 1, n - 1] = -absorption_rate
+    return A
+
+
 class Model:
     """A Pharmokinetic (PK) model.
     Defaults to Intravenous Bolus.
@@ -76,3 +122,114 @@ class Model:
             {"name": pc_name, "vol_p": vol_p, "q_p": q_p})
         self.number_of_compartments += 1
         self.number_of_peripheral_compartments += 1
+
+    def dosing_compartment(self):
+        '''Index of the compartment the dose is given into:
+        the SC compartment (last) if there is one, else the central one (0).
+
+        :return: int index into the state vector
+        '''
+        if self.subcutaneous_compartment:
+            return self.number_of_compartments - 1
+        return 0
+
+    def rate_matrix(self):
+        '''Assembles the linear system dq/dt = A q + b dose(t).
+        State order: central, peripherals in insertion order, then SC.
+
+        :return: (n, n) numpy array A of transfer rates [/h]
+        '''
+        return assemble_rate_matrix(
+            self.clearance_rate, self.vol_c,
+            vol_p=[pc["vol_p"] for pc in self.peripheral_compartments],
+            q_p=[pc["q_p"] for pc in self.peripheral_compartments],
+            absorption_rate=self.subcutaneous_compartment)
+
+    def input_vector(self):
+        '''Unit vector b routing the dose into the dosing compartment.
+
+        :return: (n,) numpy array
+        '''
+        b = np.zeros(self.number_of_compartments)
+        b[self.dosing_compartment()] = 1.0
+        return b
+
+    def parameter_names(self):
+        '''Names of the model parameters, in the order used by
+        rate_matrix_derivatives: clearance_rate, vol_c, vol_p_i and q_p_i
+        for each peripheral compartment i, then absorption_rate for SC.
+
+        :return: list of str
+        '''
+        names = ["clearance_rate", "vol_c"]
+        for i in range(1, self.number_of_peripheral_compartments + 1):
+            names += ["vol_p_{}".format(i), "q_p_{}".format(i)]
+        if self.subcutaneous_compartment:
+            names.append("absorption_rate")
+        return names
+
+    def rate_matrix_derivatives(self):
+        '''Derivatives of the rate matrix with respect to each parameter,
+        in the order of parameter_names. The input vector does not depend
+        on any parameter.
+
+        :return: (n_params, n, n) numpy array dA/dp
+        '''
+        n = self.number_of_compartments
+        cl, vol_c = self.clearance_rate, self.vol_c
+        dA = np.zeros((len(self.parameter_names()), n, n))
+        dA[0, 0, 0] = -1 / vol_c
+        dA[1, 0, 0] = cl / vol_c**2
+        for i, pc in enumerate(self.peripheral_compartments, start=1):
+            vol_p, q_p = pc["vol_p"], pc["q_p"]
+            # d/dvol_c of the central <-> peripheral exchange
+            dA[1, 0, 0] += q_p / vol_c**2
+            dA[1, i, 0] = -q_p / vol_c**2
+            # d/dvol_p
+            dA[2 * i, 0, i] = -q_p / vol_p**2
+            dA[2 * i, i, i] = q_p / vol_p**2
+            # d/dq_p
+            dA[2 * i + 1, 0, 0] = -1 / vol_c
+            dA[2 * i + 1, i, 0] = 1 / vol_c
+            dA[2 * i + 1, 0, i] = 1 / vol_p
+            dA[2 * i + 1, i, i] = -1 / vol_p
+        if self.subcutaneous_compartment:
+            dA[-1, 0, n - 1] = 1
+            dA[-1, n - 1, n - 1] = -1
+        return dA
+
+    def compartment_names(self):
+        '''Names of the compartments in state order.
+
+        :return: list of str
+        '''
+        names = ["Central Compartment"]
+        names += [pc["name"] for pc in self.peripheral_compartments]
+        if self.subcutaneous_compartment:
+            names.append("Subcutaneous Compartment")
+        return names
+
+    def to_dict(self):
+        '''Describes the model parameters and compartment layout as plain
+        python types, e.g. for hashing or saving as JSON.
+
+        :return: dict
+        '''
+        return {"clearance_rate": self.clearance_rate,
+                "vol_c": self.vol_c,
+                "subcutaneous_compartment": self.subcutaneous_compartment,
+                "peripheral_compartments": [dict(pc) for pc in self.peripheral_compartments]}
+
+    @classmethod
+    def from_dict(cls, data):
+        '''Rebuilds a model from the output of to_dict.
+
+        :param data: dict as returned by to_dict
+        :return: Model
+        '''
+        model = cls(clearance_rate=data["clearance_rate"], vol_c=data["vol_c"])
+        for pc in data["peripheral_compartments"]:
+            model.add_peripheral_compartment(pc_name=pc["name"], vol_p=pc["vol_p"], q_p=pc["q_p"])
+        if data["subcutaneous_compartment"] is not None:
+            model.add_subcutaneous_compartment(absorption_rate=data["subcutaneous_compartment"])
+        return model
@@ -0,0 +1,211 @@
+#
+# CompartmentNetwork class
+#
+
+import numpy as np
+
+
+class CompartmentNetwork:
+    """A linear compartment model of any topology, built as a directed graph: the
+    compartments are nodes, and every first-order transfer of drug from one compartment
+    to another (or out of the body) is an edge. The rate matrix is assembled as a
+    scipy.sparse matrix straight from the edges, so building and solving it costs in
+    proportion to the number of transfers, which suits physiologically based models
+    with hundreds of compartments. It can be solved by Solution like a Model.
+
+    The IV and SC models are special cases, see from_model. Features defined in terms of
+    the Model's parameters are not available for networks: Solution.sensitivities,
+    ModelFit, MonteCarlo, PopulationSolution and the SimulationService.
+    """
+
+    def __init__(self):
+        """
+        :arg compartments: list of {"name", "volume"} dicts, in state order
+        :arg transfers: list of {"source", "target", "rate"} dicts, with compartment
+                        indices and a first-order rate constant [/h]; a target of None
+                        is elimination from the body
+        :arg number_of_compartments: int initialised to 0
+        """
+        self.compartments = []
+        self.transfers = []
+        self.number_of_compartments = 0
+        self._dosing = 0
+        self._index = {}
+
+    def add_compartment(self, name=None, volume=1):
+        '''Adds a compartment to the network.
+
+        :param name: unique name, defaults to "Compartment <i>"
+        :param volume: volume of the compartment [ml]
+        :return: int index of the compartment in the state vector
+        '''
+        if name is None:
+            name = "Compartment {}".format(self.number_of_compartments + 1)
+        if name in self._index:
+            raise ValueError("There already is a compartment called {}".format(name))
+        if not volume > 0:
+            raise ValueError("The volume must be positive")
+        self.compartments.append({"name": name, "volume": volume})
+        self._index[name] = self.number_of_compartments
+        self.number_of_compartments += 1
+        return self._index[name]
+
+    def index(self, compartment):
+        '''Index of a compartment given by name or index.
+
+        :param compartment: str name or int index
+        :return: int index
+        '''
+        if isinstance(compartment, str):
+            if compartment not in self._index:
+                raise KeyError("There is no compartment called {}".format(compartment))
+            return self._index[compartment]
+        if not 0 <= compartment < self.number_of_compartments:
+            raise IndexError("There is no compartment {}".format(compartment))
+        return int(compartment)
+
+    def add_transfer(self, source, target, rate=None, clearance=None):
+        '''Adds a first-order flow of drug from source to target, given either as a
+        rate constant k (flow = k q_source) or as a clearance CL
+        (flow = CL / V_source q_source). Parallel transfers add up.
+
+        :param source: name or index of the compartment the drug leaves
+        :param target: name or index of the compartment the drug enters,
+                       None for elimination from the body
+        :param rate: rate constant [/h]
+        :param clearance: clearance [ml/h]
+        :return: ---
+        '''
+        source = self.index(source)
+        if target is not None:
+            target = self.index(target)
+            if target == source:
+                raise ValueError("A transfer needs two different compartments")
+        if (rate is None) == (clearance is None):
+            raise ValueError("Give either a rate or a clearance")
+        if rate is None:
+            rate = clearance / self.compartments[source]["volume"]
+        if rate < 0:
+            raise ValueError("Transfer rates cannot be negative")
+        self.transfers.append({"source": source, "target": target, "rate": rate})
+
+    def add_elimination(self, compartment, rate=None, clearance=None):
+        '''Adds first-order elimination of drug from a compartment out of the body.
+
+        :param compartment: name or index of the compartment
+        :param rate: rate constant [/h]
+        :param clearance: clearance [ml/h]
+        :return: ---
+        '''
+        self.add_transfer(compartment, None, rate=rate, clearance=clearance)
+
+    def add_exchange(self, first, second, q):
+        '''Adds the two-way exchange of a peripheral compartment: drug flows from
+        each compartment to the other with the intercompartmental clearance q.
+
+        :param first: name or index of one compartment
+        :param second: name or index of the other compartment
+        :param q: intercompartmental clearance [ml/h]
+        :return: ---
+        '''
+        self.add_transfer(first, second, clearance=q)
+        self.add_transfer(second, first, clearance=q)
+
+    def set_dosing_compartment(self, compartment):
+        '''Sets the compartment the dose is given into (the first one by default).
+
+        :param compartment: name or index of the compartment
+        :return: ---
+        '''
+        self._dosing = self.index(compartment)
+
+    def dosing_compartment(self):
+        '''Index of the compartment the dose is given into.
+
+        :return: int index into the state vector
+        '''
+        return self._dosing
+
+    def rate_matrix(self):
+        '''Assembles the sparse rate matrix A of dq/dt = A q + b dose(t):
+        every transfer adds its rate to A[target, source] and subtracts it from
+        A[source, source].
+
+        :return: (n, n) scipy.sparse.csr_matrix of transfer rates [/h]
+        '''
+        import scipy.sparse
+
+        n = self.number_of_compartments
+        sources = np.array([t["source"] for t in self.transfers], dtype=int)
+        rates = np.array([t["rate"] for t in self.transfers], dtype=float)
+        moved = np.array([t["target"] is not None for t in self.transfers], dtype=bool)
+        targets = np.array([t["target"] for t in self.transfers if t["target"] is not None],
+                           dtype=int)
+        rows = np.concatenate([sources, targets])
+        columns = np.concatenate([sources, sources[moved]])
+        data = np.concatenate([-rates, rates[moved]])
+        # duplicate entries are summed
+        return scipy.sparse.csr_matrix((data, (rows, columns)), shape=(n, n))
+
+    def input_vector(self):
+        '''Unit vector b routing the dose into the dosing compartment.
+
+        :return: (n,) numpy array
+        '''
+        b = np.zeros(self.number_of_compartments)
+        b[self.dosing_compartment()] = 1.0
+        return b
+
+    def compartment_names(self):
+        '''Names of the compartments in state order.
+
+        :return: list of str
+        '''
+        return [c["name"] for c in self.compartments]
+
+    def to_dict(self):
+        '''Describes the network as plain python types, e.g. for hashing or
+        saving as JSON.
+
+        :return: dict
+        '''
+        return {"compartments": [dict(c) for c in self.compartments],
+                "transfers": [dict(t) for t in self.transfers],
+                "dosing_compartment": self._dosing}
+
+    @classmethod
+    def from_dict(cls, data):
+        '''Rebuilds a network from the output of to_dict.
+
+        :param data: dict as returned by to_dict
+        :return: CompartmentNetwork
+        '''
+        network = cls()
+        for c in data["compartments"]:
+            network.add_compartment(c["name"], c["volume"])
+        for t in data["transfers"]:
+            network.add_transfer(t["source"], t["target"], rate=t["rate"])
+        network.set_dosing_compartment(data["dosing_compartment"])
+        return network
+
+    @classmethod
+    def from_model(cls, model):
+        '''Builds the network of a Model: a central compartment with clearance,
+        a two-way exchange with every peripheral compartment, and for SC dosing a
+        depot that drains into the central compartment. The state order, and so
+        the rate matrix, are the same as the model's.
+
+        :param model: Model object
+        :return: CompartmentNetwork
+        '''
+        network = cls()
+        central = network.add_compartment("Central Compartment", model.vol_c)
+        network.add_elimination(central, clearance=model.clearance_rate)
+        for pc in model.peripheral_compartments:
+            peripheral = network.add_compartment(pc["name"], pc["vol_p"])
+            network.add_exchange(central, peripheral, pc["q_p"])
+        if model.subcutaneous_compartment:
+            depot = network.add_compartment("Subcutaneous Compartment")
+            network.add_transfer(depot, central, rate=model.subcutaneous_compartment)
+        network.set_dosing_compartment(model.dosing_compartment())
+        return network
@@ -0,0 +1,248 @@
+#
+# PopulationSolution class
+#
+
+import numpy as np
+from pkmodel.linear import LinearPropagator
+from pkmodel.metrics import ExposureMetrics
+from pkmodel.model import assemble_rate_matrix
+from pkmodel.protocol import Protocol
+from pkmodel.solution import integrate_segments
+
+
+class PopulationSolution:
+    """Solves the same model topology and dosing protocol for a whole population
+    of virtual patients at once. Every patient has their own parameter values;
+    the rate matrices are stacked and advanced together with the exact solver,
+    so the cost per patient is a handful of vectorised numpy operations.
+    """
+
+    def __init__(self, clearance_rate, vol_c, absorption_rate=None,
+                 vol_p=None, q_p=None, protocol=None):
+        """
+        :param clearance_rate: (n_patients,) clearance rates [ml/h]
+        :param vol_c: (n_patients,) central compartment volumes [ml]
+        :param absorption_rate: (n_patients,) SC absorption rates [/h],
+                                or None for an intravenous model
+        :param vol_p: (n_patients, n_peripheral) peripheral volumes [ml], or
+                      (n_peripheral,) volumes shared by all patients
+        :param q_p: (n_patients, n_peripheral) peripheral transfer rates [ml/h], or
+                    (n_peripheral,) rates shared by all patients
+        :param protocol: dosing protocol shared by all patients
+        :arg solution: (n_patients, n_compartments, n_times) array, set by solve
+        """
+        self.clearance_rate = np.atleast_1d(np.asarray(clearance_rate, dtype=float))
+        self.n_patients = len(self.clearance_rate)
+        self.vol_c = self._per_patient(vol_c, "vol_c")
+        self.absorption_rate = None
+        if absorption_rate is not None:
+            self.absorption_rate = self._per_patient(absorption_rate, "absorption_rate")
+        if vol_p is None and q_p is None:
+            vol_p = q_p = np.zeros((self.n_patients, 0))
+        elif vol_p is None or q_p is None:
+            raise ValueError("Peripheral compartments need both vol_p and q_p")
+        self.vol_p = self._per_patient(vol_p, "vol_p", peripheral=True)
+        self.q_p = self._per_patient(q_p, "q_p", peripheral=True)
+        if self.vol_p.shape != self.q_p.shape:
+            raise ValueError("vol_p and q_p must have the same shape")
+
+        self.protocol = protocol if protocol is not None else Protocol()
+        self.number_of_peripheral_compartments = self.vol_p.shape[1]
+        self.number_of_compartments = (1 + self.number_of_peripheral_compartments
+                                       + (self.absorption_rate is not None))
+        self.t = None
+        self.solution = None
+
+        for values in (self.clearance_rate, self.vol_c, self.vol_p, self.q_p,
+                       self.absorption_rate):
+            if values is not None and not np.all(values > 0):
+                raise ValueError("Model parameters must be positive")
+
+    @classmethod
+    def from_models(cls, models, protocol=None):
+        """
+        Stacks the parameters of Model objects sharing the same topology
+        (number of peripheral compartments and presence of an SC compartment).
+
+        :param models: sequence of Model objects, one per patient
+        :param protocol: dosing protocol shared by all patients
+        :return: PopulationSolution
+        """
+        topologies = {(m.number_of_peripheral_compartments, m.subcutaneous_compartment is None)
+                      for m in models}
+        if len(topologies) != 1:
+            raise ValueError("All models must share the same compartment layout")
+        absorption_rate = None
+        if models[0].subcutaneous_compartment is not None:
+            absorption_rate = [m.subcutaneous_compartment for m in models]
+        return cls(
+            clearance_rate=[m.clearance_rate for m in models],
+            vol_c=[m.vol_c for m in models],
+            absorption_rate=absorption_rate,
+            vol_p=[[pc["vol_p"] for pc in m.peripheral_compartments] for m in models],
+            q_p=[[pc["q_p"] for pc in m.peripheral_compartments] for m in models],
+            protocol=protocol)
+
+    def _per_patient(self, values, name, peripheral=False):
+        """
+        Checks that values has one entry (or one row, for peripheral parameters)
+        per patient and returns it as a float array. A 1-D array of peripheral
+        parameters is one value per compartment, shared by all patients.
+        """
+        values = np.asarray(values, dtype=float)
+        if peripheral:
+            if values.ndim > 2:
+                raise ValueError("{} must be a 1-D or 2-D array".format(name))
+            if values.ndim < 2:
+                values = np.broadcast_to(values.ravel(), (self.n_patients, values.size)).copy()
+        if values.shape[:1] != (self.n_patients,):
+            raise ValueError("{} must have one entry per patient".format(name))
+        return values
+
+    def compartment_names(self):
+        """
+        Names of the compartments in state order.
+
+        :return: list of str
+        """
+        names = ["Central Compartment"]
+        names += ["Peripheral Compartment {}".format(i + 1)
+                  for i in range(self.number_of_peripheral_compartments)]
+        if self.absorption_rate is not None:
+            names.append("Subcutaneous Compartment")
+        return names
+
+    def to_dict(self):
+        """
+        Describes the parameters of every patient as plain python types.
+
+        :return: dict
+        """
+        return {"clearance_rate": self.clearance_rate.tolist(),
+                "vol_c": self.vol_c.tolist(),
+                "absorption_rate": None if self.absorption_rate is None
+                else self.absorption_rate.tolist(),
+                "vol_p": self.vol_p.tolist(),
+                "q_p": self.q_p.tolist()}
+
+    @classmethod
+    def from_dict(cls, data, protocol=None):
+        """
+        Rebuilds a population from the output of to_dict.
+
+        :param data: dict as returned by to_dict
+        :param protocol: dosing protocol shared by all patients
+        :return: PopulationSolution
+        """
+        return cls(protocol=protocol, **data)
+
+    def dosing_compartment(self):
+        """
+        Index of the compartment the dose is given into (see Model.dosing_compartment).
+
+        :return: int
+        """
+        if self.absorption_rate is not None:
+            return self.number_of_compartments - 1
+        return 0
+
+    def rate_matrix(self):
+        """
+        Stack of the rate matrices of all patients.
+
+        :return: (n_patients, n, n) numpy array
+        """
+        return assemble_rate_matrix(self.clearance_rate, self.vol_c, self.vol_p, self.q_p,
+                                    self.absorption_rate)
+
+    def input_vector(self):
+        """
+        Unit vector routing the dose into the dosing compartment, shared by all patients.
+
+        :return: (n,) numpy array
+        """
+        b = np.zeros(self.number_of_compartments)
+        b[self.dosing_compartment()] = 1.0
+        return b
+
+    def _initial_values(self, y0, t_eval):
+        """
+        Fills in and checks the initial values and time points of a solve.
+
+        :return: y0 of shape (n_patients, n_compartments), t_eval
+        """
+        if y0 is None:
+            y0 = np.zeros(self.number_of_compartments)
+        if t_eval is None:
+            t_eval = np.linspace(0, 1, 1000)
+        y0 = np.broadcast_to(np.asarray(y0, dtype=float),
+                             (self.n_patients, self.number_of_compartments))
+        if not np.all(y0 >= 0.0):
+            raise ValueError("The initial concentration cannot be negative.")
+        return y0, np.asarray(t_eval)
+
+    def _advance(self):
+        """
+        Advance function for integrate_segments that steps every patient exactly.
+        """
+        propagator = LinearPropagator(self.rate_matrix(), self.input_vector())
+
+        def advance(state, rate, start, end, t):
+            x = propagator.step(state, rate, np.append(t, end) - start)
+            return x[..., :-1], x[..., -1]
+        return advance
+
+    def iter_solve(self, y0=None, t_eval=None, chunk=1000):
+        """
+        Solves the whole population chunk by chunk, yielding each block as soon as it is
+        computed (see Solution.iter_solve). self.solution is not set.
+
+        :param y0: (n_compartments,) or (n_patients, n_compartments) initial drug quantities
+        :param t_eval: sorted time points, defaults to 1000 points over 1 hour
+        :param chunk: number of time points per block
+        :return: generator of (t, y) blocks, with y of shape (n_patients, n_compartments, len(t))
+        """
+        if chunk < 1:
+            raise ValueError("chunk must be at least 1")
+        y0, t_eval = self._initial_values(y0, t_eval)
+        advance = self._advance()
+        state = y0
+        for i in range(0, len(t_eval), chunk):
+            t = t_eval[i:i + chunk]
+            last = i + chunk >= len(t_eval)
+            span = t if last else np.append(t, t_eval[i + chunk])
+            y = integrate_segments(self.protocol, self.dosing_compartment(), state, span,
+                                   advance, final_dose=last)
+            if not last:
+                state, y = y[..., -1], y[..., :-1]
+            yield t, y
+
+    def metrics(self, y0=None, t_eval=None, chunk=1000, toxicity_threshold=None,
+                therapeutic_window=None):
+        """
+        Computes exposure metrics of every patient and compartment in a single streaming
+        pass, without keeping the trajectories (see ExposureMetrics).
+
+        :return: dict of (n_patients, n_compartments) numpy arrays
+        """
+        metrics = ExposureMetrics(toxicity_threshold, therapeutic_window)
+        for t, y in self.iter_solve(y0, t_eval, chunk):
+            metrics.update(t, y)
+        result = metrics.result()
+        result['auc_exact'] = metrics.exact_auc(self, self.protocol)
+        return result
+
+    def solve(self, y0=None, t_eval=None):
+        """
+        Solves the model of every patient exactly over t_eval.
+
+        :param y0: (n_compartments,) or (n_patients, n_compartments) initial drug quantities,
+                   zero by default
+        :param t_eval: sorted time points, defaults to 1000 points over 1 hour
+        :return: (n_patients, n_compartments, n_times) numpy array, also stored in self.solution
+        """
+        y0, t_eval = self._initial_values(y0, t_eval)
+        self.t = t_eval
+        self.solution = integrate_segments(self.protocol, self.dosing_compartment(), y0,
+                                           self.t, self._advance())
+        return self.solution
@@ -2,6 +2,38 @@
 # Protocol class
 #
 
+import bisect
+
+import numpy as np
+
+
+class _TrackedList(list):
+    """A list that calls changed() after every in-place edit, so that the
+    Protocol owning it can invalidate its compiled schedule in O(1).
+    """
+    def __init__(self, values, changed):
+        super().__init__(values)
+        self.changed = changed
+
+    def __reduce_ex__(self, protocol):
+        # copied and pickled as a plain list, which the owner tracks again
+        return list, (list(self),)
+
+
+def _tracked(name):
+    def edit(self, *args):
+        result = getattr(list, name)(self, *args)
+        self.changed()
+        return result
+    edit.__name__ = name
+    return edit
+
+
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__', 'append',
+              'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse'):
+    setattr(_TrackedList, _name, _tracked(_name))
+
+
 class Protocol:
     """A Pharmokinetic (PK) dosing protocol
     Allows for continuous or instantaneous (at one or more time points) dosing.
@@ -30,12 +62,50 @@ class Protocol:
     def __init__(self, dose_amount=1,
                  continuous=False, continuous_period=[0, 0],
                  instantaneous=True, dose_times=[0]):
+        self._version = 0
+        self._schedule = None
+        self._compiled_from = None
         self.dose_amount = dose_amount
         self.continuous = continuous
         self.instantaneous = instantaneous
-        self.dose_times = dose_times
+        # copies, so that the default lists are never modified
+        self.dose_times = sorted(dose_times)
         self.continuous_period = continuous_period
-        self.dose_times.sort()
+
+    @property
+    def dose_times(self):
+        """
+        Returns: The list of instantaneous dose times. Editing it in place
+        changes the doses, like assigning a new list does.
+        """
+        return self._dose_times
+
+    @dose_times.setter
+    def dose_times(self, dose_times):
+        self._dose_times = _TrackedList(dose_times, self._changed)
+        self._changed()
+
+    @property
+    def continuous_period(self):
+        """
+        Returns: The [start, end] list of the continuous period, tracked like
+        dose_times.
+        """
+        return self._continuous_period
+
+    @continuous_period.setter
+    def continuous_period(self, continuous_period):
+        self._continuous_period = _TrackedList(continuous_period, self._changed)
+        self._changed()
+
+    def _changed(self):
+        self._version += 1
+
+    def __setstate__(self, state):
+        # copies and unpickled protocols track their own lists
+        self.__dict__.update(state)
+        self.dose_times = self._dose_times
+        self.continuous_period = self._continuous_period
 
     def make_continuous(self, time_start, time_finish):
         """
@@ -47,8 +117,7 @@ class Protocol:
         protocol to continuous over a user specified time period.
         """
         self.continuous = True
-        self.continuous_period[0] = time_start
-        self.continuous_period[1] = time_finish
+        self.continuous_period = [time_start, time_finish]
 
     def add_instantaneous(self, time):
         """
@@ -57,8 +126,7 @@ class Protocol:
         This method modifies an object of class Protocol to add an additional
         user specified instantaneous dose time.
         """
-        self.dose_times.append(time)
-        self.dose_times.sort()
+        bisect.insort(self.dose_times, time)
 
     def change_dose(self, dose_amount):
         """
@@ -68,21 +136,318 @@ class Protocol:
         """
         self.dose_amount = dose_amount
 
+    def _snapshot(self):
+        # the scalar settings and the version of the lists, which every edit
+        # bumps, so that checking for changes costs O(1)
+        return (self.dose_amount, self.continuous, self.instantaneous, self._version)
+
+    def compile(self):
+        """
+        Returns: The DoseSchedule of this protocol, built once and reused
+        until the protocol is changed, either by reassigning an attribute or
+        by editing dose_times or continuous_period in place.
+        """
+        snapshot = self._snapshot()
+        if self._schedule is None or snapshot != self._compiled_from:
+            self._compiled_from = snapshot
+            bolus_times = self.dose_times if self.instantaneous else []
+            infusions = [self.continuous_period] if self.continuous else []
+            self._schedule = DoseSchedule(
+                bolus_times=bolus_times, bolus_amounts=self.dose_amount,
+                infusion_starts=[start for start, _ in infusions],
+                infusion_ends=[end for _, end in infusions],
+                infusion_rates=self.dose_amount)
+        return self._schedule
+
     def dose_at_time(self, t):
         """
-        Paramater: t: time at which you want dose(t) to be returned.
+        Paramater: t: time, or array of times, at which you want dose(t) to be
+        returned.
         Returns: Dose(t) for the specific dosing protocol set up in the object
         of class Protocol.
         """
-        dose_t_continuous, dose_t_instantaneous = 0, 0
-        if self.instantaneous:
-            if t in self.dose_times:
-                dose_t_instantaneous = self.dose_amount
+        return self.compile().dose_at_time(t)
+
+    def dose_rate(self, t):
+        """
+        Paramater: t: time, or array of times, at which you want the continuous
+        dose rate.
+        Returns: The continuous dose rate at time t, i.e. dose(t) without the
+        instantaneous doses, which are applied as jumps in the drug quantity.
+        """
+        return self.compile().rate(t)
+
+    def total_dose(self, t_start, t_end):
+        """
+        Paramater: t_start: start of the time span.
+        Parameter: t_end: end of the time span.
+        Returns: The dose given after t_start and up to and including t_end.
+        """
+        return self.compile().total_dose(t_start, t_end)
+
+    def segments(self, t_start, t_end):
+        """
+        Paramater: t_start: start of the simulated time span.
+        Parameter: t_end: end of the simulated time span.
+        Returns: list of (start, end, bolus, rate) tuples splitting the span
+        at every dose time and at both edges of the continuous period
+        (see DoseSchedule.segments).
+        """
+        return self.compile().segments(t_start, t_end)
+
+    def to_dict(self):
+        """
+        Returns: The dosing protocol as a dict of plain python types, e.g. for
+        hashing or saving as JSON.
+        """
+        return {"dose_amount": self.dose_amount,
+                "continuous": self.continuous,
+                "continuous_period": list(self.continuous_period),
+                "instantaneous": self.instantaneous,
+                "dose_times": list(self.dose_times)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Paramater: data: dict as returned by to_dict.
+        Returns: The Protocol described by data.
+        """
+        return cls(**data)
+
+
+class DoseSchedule:
+    """An immutable, compiled dosing schedule backed by sorted numpy arrays.
+    Every instantaneous dose and every continuous infusion has its own amount
+    or rate, and all queries accept whole arrays of times. Each lookup is a
+    binary search, so it stays O(log n) for schedules with many doses.
+
+    Parameters
+    ----------
+    bolus_times: numerical array, optional
+        Times at which instantaneous doses are given.
+    bolus_amounts: numeric or numerical array, optional, default = 1
+        Amount of each instantaneous dose in ng.
+    infusion_starts, infusion_ends: numerical arrays, optional
+        Times at which each continuous infusion starts and ends.
+    infusion_rates: numeric or numerical array, optional, default = 1
+        Rate of each continuous infusion in ng per hour. Overlapping
+        infusions add up.
+
+    """
+    def __init__(self, bolus_times=(), bolus_amounts=1,
+                 infusion_starts=(), infusion_ends=(), infusion_rates=1):
+        bolus_times = np.asarray(bolus_times, dtype=float).ravel()
+        bolus_amounts = np.broadcast_to(
+            np.asarray(bolus_amounts, dtype=float), bolus_times.shape)
+        order = np.argsort(bolus_times, kind='stable')
+        self.bolus_times = bolus_times[order]
+        self.bolus_amounts = bolus_amounts[order]
+        # cumulative amounts, so that the dose over any time range is a difference
+        self._bolus_totals = np.concatenate([[0.0], np.cumsum(self.bolus_amounts)])
+
+        starts = np.asarray(infusion_starts, dtype=float).ravel()
+        ends = np.asarray(infusion_ends, dtype=float).ravel()
+        if starts.shape != ends.shape:
+            raise ValueError("Every infusion needs a start and an end")
+        if np.any(ends < starts):
+            raise ValueError("Infusions cannot end before they start")
+        rates = np.broadcast_to(np.asarray(infusion_rates, dtype=float), starts.shape)
+        self.infusion_starts, self.infusion_ends, self.infusion_rates = starts, ends, rates
+
+        # the total infusion rate is piecewise constant between change times
+        times = np.concatenate([starts, ends])
+        self.change_times, inverse = np.unique(times, return_inverse=True)
+        changes = np.bincount(inverse.ravel(), weights=np.concatenate([rates, -rates]),
+                              minlength=len(self.change_times))
+        # rates[i] is the total rate from change_times[i - 1] until change_times[i]
+        self.rates = np.concatenate([[0.0], np.cumsum(changes)])
+
+        for array in (self.bolus_times, self.bolus_amounts, self._bolus_totals,
+                      self.infusion_starts, self.infusion_ends, self.infusion_rates,
+                      self.change_times, self.rates):
+            array.setflags(write=False)
+
+    def compile(self):
+        """
+        Returns: The schedule itself, so a DoseSchedule can be used wherever
+        a Protocol is.
+        """
+        return self
+
+    def rate(self, t):
+        """
+        Paramater: t: time, or array of times.
+        Returns: The total continuous dose rate at t.
+        """
+        rate = self.rates[np.searchsorted(self.change_times, t, side='right')]
+        return rate if np.ndim(t) else float(rate)
+
+    def dose_rate(self, t):
+        """
+        Same as rate, for compatibility with Protocol.
+        """
+        return self.rate(t)
+
+    def bolus(self, t):
+        """
+        Paramater: t: time, or array of times.
+        Returns: The total instantaneous dose given exactly at t.
+        """
+        lo = np.searchsorted(self.bolus_times, t, side='left')
+        hi = np.searchsorted(self.bolus_times, t, side='right')
+        amount = self._bolus_totals[hi] - self._bolus_totals[lo]
+        return amount if np.ndim(t) else float(amount)
+
+    def dose_at_time(self, t):
+        """
+        Paramater: t: time, or array of times.
+        Returns: Dose(t), the continuous dose rate plus any instantaneous
+        dose given exactly at t.
+        """
+        return self.rate(t) + self.bolus(t)
+
+    def total_dose(self, t_start, t_end):
+        """
+        Paramater: t_start: start of the time span.
+        Parameter: t_end: end of the time span.
+        Returns: The dose given after t_start and up to and including t_end.
+        """
+        boluses = self._bolus_totals[np.searchsorted(self.bolus_times, t_end, side='right')] \
+            - self._bolus_totals[np.searchsorted(self.bolus_times, t_start, side='right')]
+        overlap = np.clip(np.minimum(self.infusion_ends, t_end)
+                          - np.maximum(self.infusion_starts, t_start), 0, None)
+        return float(boluses + np.sum(overlap * self.infusion_rates))
+
+    def segments(self, t_start, t_end):
+        """
+        Paramater: t_start: start of the simulated time span.
+        Parameter: t_end: end of the simulated time span.
+        Returns: list of (start, end, bolus, rate) tuples splitting the span
+        at every dose time and every change of the infusion rate.
+        bolus is the instantaneous dose given at start and rate is the
+        continuous dose rate over [start, end). The final tuple has
+        start == end == t_end so that a dose given at t_end is included.
+        """
+        bolus_times = self.bolus_times[
+            np.searchsorted(self.bolus_times, t_start, side='left'):
+            np.searchsorted(self.bolus_times, t_end, side='right')]
+        change_times = self.change_times[
+            np.searchsorted(self.change_times, t_start, side='right'):
+            np.searchsorted(self.change_times, t_end, side='left')]
+        times = np.unique(np.concatenate([[t_start, t_end], bolus_times, change_times]))
+        ends = np.append(times[1:], times[-1])
+        return list(zip(times.tolist(), ends.tolist(), self.bolus(times).tolist(),
+                        self.rate(times).tolist()))
+
+    def to_dict(self):
+        """
+        Returns: The schedule as a dict of plain python types.
+        """
+        return {"bolus_times": self.bolus_times.tolist(),
+                "bolus_amounts": self.bolus_amounts.tolist(),
+                "infusion_starts": self.infusion_starts.tolist(),
+                "infusion_ends": self.infusion_ends.tolist(),
+                "infusion_rates": self.infusion_rates.tolist()}
 
-        if self.continuous:
-            if t < self.continuous_period[1] and \
-               t >= self.continuous_period[0]:
-                dose_t_continuous = self.dose_amount
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Paramater: data: dict as returned by to_dict.
+        Returns: The DoseSchedule described by data.
+        """
+        return cls(**data)
+
+
+class SampledProtocol:
+    """A dosing protocol given as a sampled dose rate, e.g. an infusion pump log.
+    The rate is held constant over each sampling interval (zero-order hold)
+    and is zero before the first and after the last sample.
+
+    Parameters
+    ----------
+    rates: numerical array
+        Dose rate in ng per hour over each sampling interval.
+    dt: numeric
+        Length of the sampling intervals in hours.
+    t_start: numeric, optional, default = 0
+        Time at which the first sampling interval begins.
 
-        dose_t = dose_t_continuous + dose_t_instantaneous
-        return dose_t
+    """
+    def __init__(self, rates, dt, t_start=0):
+        self.rates = np.array(rates, dtype=float)
+        self.dt = dt
+        self.t_start = t_start
+        if self.rates.ndim != 1:
+            raise ValueError("Rates must be a one dimensional array")
+        if not self.dt > 0:
+            raise ValueError("The sampling interval must be positive")
+        if np.any(self.rates < 0):
+            raise ValueError("Dose rates cannot be negative")
+
+    @property
+    def edges(self):
+        """
+        Returns: The times at which the sampling intervals begin and end.
+        """
+        return self.t_start + self.dt * np.arange(len(self.rates) + 1)
+
+    def dose_rate(self, t):
+        """
+        Paramater: t: time, or array of times, at which you want the dose rate.
+        Returns: The sampled dose rate at t.
+        """
+        index = np.searchsorted(self.edges, t, side='right') - 1
+        inside = (index >= 0) & (index < len(self.rates))
+        return np.where(inside, self.rates[np.clip(index, 0, len(self.rates) - 1)], 0.0)
+
+    def dose_at_time(self, t):
+        """
+        Paramater: t: time at which you want dose(t) to be returned.
+        Returns: Dose(t), which is the sampled dose rate since there are no
+        instantaneous doses.
+        """
+        return self.dose_rate(t)
+
+    def cumulative_dose(self, t):
+        """
+        Paramater: t: time, or array of times.
+        Returns: The total dose given up to t.
+        """
+        totals = np.concatenate([[0.0], np.cumsum(self.rates * self.dt)])
+        return np.interp(t, self.edges, totals)
+
+    def total_dose(self, t_start, t_end):
+        """
+        Paramater: t_start: start of the time span.
+        Parameter: t_end: end of the time span.
+        Returns: The dose given between t_start and t_end.
+        """
+        return float(self.cumulative_dose(t_end) - self.cumulative_dose(t_start))
+
+    def segments(self, t_start, t_end):
+        """
+        Paramater: t_start: start of the simulated time span.
+        Parameter: t_end: end of the simulated time span.
+        Returns: list of (start, end, bolus, rate) tuples, one per sampling
+        interval, as for Protocol.segments.
+        """
+        edges = self.edges
+        times = np.unique(np.concatenate(
+            [[t_start, t_end], edges[(edges > t_start) & (edges < t_end)]]))
+        rates = self.dose_rate(times)
+        ends = np.append(times[1:], times[-1])
+        return list(zip(times, ends, np.zeros(len(times)), rates))
+
+    def to_dict(self):
+        """
+        Returns: The dosing protocol as a dict of plain python types.
+        """
+        return {"rates": self.rates.tolist(), "dt": self.dt, "t_start": self.t_start}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Paramater: data: dict as returned by to_dict.
+        Returns: The SampledProtocol described by data.
+        """
+        return cls(**data)
@@ -0,0 +1,281 @@
+#
+# RegimenOptimiser class
+#
+
+import math
+
+import numpy as np
+from pkmodel.linear import is_sparse, make_propagator
+from pkmodel.metrics import ExposureMetrics
+from pkmodel.protocol import DoseSchedule
+
+# largest number of (dose, time point) offsets held at once by _repeated_response
+_BLOCK = 2 ** 20
+
+
+def _strided_sum(values, stride):
+    """
+    values[i] + values[i - stride] + values[i - 2 stride] + ... for every i, as a
+    cumulative sum down the columns of values reshaped into rows of stride elements.
+    """
+    rows = -(-len(values) // stride)
+    padded = np.zeros(rows * stride)
+    padded[:len(values)] = values
+    return padded.reshape(rows, stride).cumsum(axis=0).ravel()[:len(values)]
+
+
+class RegimenOptimiser:
+    """Searches repeated dosing regimens - a dose amount given every interval, either
+    instantaneously or infused over a window at the start of the interval - for the one
+    that keeps the central concentration inside a therapeutic window for the longest
+    time, subject to a maximum single dose and a maximum daily total.
+
+    Since the model is linear, the concentration of a regimen is its dose amount times
+    the response to unit doses, which is the sum of shifted copies of the response to a
+    single unit dose. On evenly spaced t_eval, that response is evaluated exactly once
+    per infusion duration, and summing its copies costs O(n_times) time and memory for
+    every interval that is a multiple of the spacing (other intervals and uneven t_eval
+    cost O(n_doses * n_times) time, in blocks of bounded memory). Every amount then
+    costs a multiplication, and scoring a candidate O(n_times): about 4,400 candidates
+    over a 4-week grid of 0.1 h take roughly two seconds.
+
+    The propagator of a sparse CompartmentNetwork costs one expm_multiply per distinct
+    offset, so its response is instead evaluated in one call on a regular grid with the
+    smallest spacing of t_eval and interpolated linearly. This is exact for offsets on
+    the grid, i.e. evenly spaced t_eval with intervals and infusion durations that are
+    multiples of the spacing.
+    """
+
+    def __init__(self, model, therapeutic_window, t_eval, max_single_dose=None,
+                 max_daily_dose=None, day=24, compartment=0, volume=None):
+        """
+        :param model: Model (or CompartmentNetwork) object
+        :param therapeutic_window: (low, high) concentrations between which time is
+                                   counted as therapeutic [ng/ml]
+        :param t_eval: sorted time points at which the concentration is checked. Doses
+                       are given from time 0 until the last time point
+        :param max_single_dose: largest amount of a single dose [ng], None for no limit
+        :param max_daily_dose: largest total amount given within any day [ng],
+                               None for no limit
+        :param day: length of a day in the model's time unit [h]
+        :param compartment: index of the compartment whose concentration is checked
+        :param volume: volume of that compartment [ml], defaults to model.vol_c
+        """
+        low, high = therapeutic_window
+        if not 0 <= low < high:
+            raise ValueError("The therapeutic window must be (low, high) with 0 <= low < high")
+        self.model = model
+        self.therapeutic_window = (low, high)
+        self.t_eval = np.asarray(t_eval, dtype=float)
+        if self.t_eval.ndim != 1 or len(self.t_eval) < 2 or self.t_eval[0] < 0:
+            raise ValueError("t_eval must hold at least two non-negative time points")
+        self.max_single_dose = max_single_dose
+        self.max_daily_dose = max_daily_dose
+        self.day = day
+        self.compartment = compartment
+        if volume is None:
+            if not hasattr(model, 'vol_c'):
+                raise ValueError("The model has no vol_c, give the volume of the checked "
+                                 "compartment")
+            volume = model.vol_c
+        self.volume = volume
+        self.propagator = make_propagator(model.rate_matrix(), model.input_vector())
+
+    def _dose_times(self, interval):
+        """
+        Start times of the doses of a regimen with the given interval.
+        """
+        return interval * np.arange(math.ceil(self.t_eval[-1] / interval))
+
+    def _step(self, x0, u, offsets):
+        """
+        Drug quantity in the checked compartment at sorted offsets from x0 under a
+        constant input u; on a regular grid for sparse propagators (see class docstring).
+        """
+        if len(offsets) < 2 or not is_sparse(self.propagator.rate_matrix):
+            return self.propagator.step(x0, u, offsets)[self.compartment]
+        spacing = np.diff(self.t_eval)
+        spacing = spacing[spacing > 0].min()
+        n = int(math.ceil((offsets[-1] - offsets[0]) / spacing - 1e-9)) + 1
+        grid = offsets[0] + spacing * np.arange(n)
+        return np.interp(offsets, grid, self.propagator.step(x0, u, grid)[self.compartment])
+
+    def _unit_response(self, infusion_duration, offsets):
+        """
+        Drug quantity in the checked compartment at sorted offsets after the start of a
+        unit dose, given instantaneously or infused over infusion_duration.
+        """
+        n = len(self.propagator.input_vector)
+        b = self.propagator.input_vector
+        if infusion_duration == 0:
+            return self._step(b, 0, offsets)
+        rate = 1 / infusion_duration
+        during = offsets < infusion_duration
+        y = np.empty(len(offsets))
+        y[during] = self._step(np.zeros(n), rate, offsets[during])
+        x_end = self.propagator.step(np.zeros(n), rate, infusion_duration)[:, 0]
+        y[~during] = self._step(x_end, 0, offsets[~during] - infusion_duration)
+        return y
+
+    def _grid(self):
+        """
+        Spacing h of evenly spaced t_eval, and the grid t_eval[0] + m h, extended back
+        to time 0, on which the response to a dose at a multiple of h is needed; None
+        if t_eval is not evenly spaced.
+        """
+        steps = np.diff(self.t_eval)
+        h = steps[0]
+        if not (h > 0 and np.allclose(steps, h, rtol=1e-9, atol=0)):
+            return None
+        m = np.arange(-math.floor(self.t_eval[0] / h + 1e-9), len(self.t_eval))
+        return h, np.maximum(self.t_eval[0] + h * m, 0)
+
+    def _repeated_response(self, interval, infusion_duration):
+        """
+        Drug quantity in the checked compartment over t_eval after unit doses repeated
+        at interval, summed over blocks of doses so that at most _BLOCK offsets are held
+        at once.
+        """
+        total = np.zeros(len(self.t_eval))
+        times = self._dose_times(interval)
+        block = max(1, _BLOCK // len(self.t_eval))
+        for start in range(0, len(times), block):
+            shifted = self.t_eval - times[start:start + block, np.newaxis]
+            mask = shifted >= 0
+            distinct, inverse = np.unique(shifted[mask], return_inverse=True)
+            doses = np.zeros(shifted.shape)
+            doses[mask] = self._unit_response(infusion_duration, distinct)[inverse.ravel()]
+            total += doses.sum(axis=0)
+        return total
+
+    def _unit_curves(self, intervals, infusion_duration):
+        """
+        Generator of the concentrations of unit_concentrations, one interval at a time.
+        """
+        n = len(self.t_eval)
+        grid = self._grid()
+        response = None
+        for interval in intervals:
+            stride = 0 if grid is None else interval / grid[0]
+            if stride < 1 or abs(stride - round(stride)) > 1e-9 * stride:
+                yield self._repeated_response(interval, infusion_duration) / self.volume
+                continue
+            h, offsets = grid
+            if response is None:
+                response = self._unit_response(infusion_duration, offsets)
+            stride = int(round(stride))
+            curve = _strided_sum(response, stride)[-n:]
+            if offsets[0] < 1e-9 * h and (len(offsets) - 1) % stride == 0:
+                # the sum includes a dose at the last time point, which is not given
+                curve[-1] -= response[0]
+            yield curve / self.volume
+
+    def unit_concentrations(self, intervals, infusion_duration=0):
+        """
+        Concentration over t_eval of unit doses repeated at each interval. On evenly
+        spaced t_eval, the response to a single dose is evaluated once on the grid of
+        t_eval, and for intervals that are multiples of its spacing h the sum of its
+        shifted copies is a cumulative sum with a stride of interval / h steps, which
+        takes O(n_times) time and memory. Other intervals sum blocks of doses.
+
+        :param intervals: sequence of dosing intervals [h]
+        :param infusion_duration: 0 for instantaneous doses, otherwise the time over
+                                  which each dose is infused [h]
+        :return: (len(intervals), n_times) numpy array [ng/ml per ng]
+        """
+        curves = np.empty((len(intervals), len(self.t_eval)))
+        for i, curve in enumerate(self._unit_curves(intervals, infusion_duration)):
+            curves[i] = curve
+        return curves
+
+    def daily_dose(self, amount, interval):
+        """
+        Largest total amount given within any day: the number of dose starts that fit
+        into a day, at most the number of doses, times the amount.
+
+        :param amount: dose amount [ng]
+        :param interval: dosing interval [h]
+        :return: float [ng]
+        """
+        doses = min(math.ceil(self.day / interval - 1e-9), len(self._dose_times(interval)))
+        return amount * doses
+
+    def time_in_window(self, concentrations):
+        """
+        Fraction of the time spanned by t_eval that concentrations spend inside the
+        therapeutic window, taking them to be linear between time points.
+
+        :param concentrations: (..., n_times) numpy array
+        :return: (...) numpy array of fractions between 0 and 1
+        """
+        metrics = ExposureMetrics(therapeutic_window=self.therapeutic_window)
+        metrics.update(self.t_eval, concentrations)
+        return metrics.result()["time_in_window"] / (self.t_eval[-1] - self.t_eval[0])
+
+    def search(self, amounts, intervals, infusion_durations=(0,)):
+        """
+        Scores every combination of amount, interval and infusion duration that meets
+        the constraints; infusions must fit into the interval.
+
+        :param amounts: sequence of candidate dose amounts [ng]
+        :param intervals: sequence of candidate dosing intervals [h]
+        :param infusion_durations: sequence of candidate infusion durations [h],
+                                   0 for instantaneous doses
+        :return: dict of numpy arrays 'amount', 'interval', 'infusion_duration',
+                 'daily_dose' and 'time_in_window' over the feasible candidates, best
+                 first (ties go to the smaller daily dose), and 'best', the schedule
+                 of the best candidate as a DoseSchedule
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        intervals = np.asarray(intervals, dtype=float)
+        if not (np.all(amounts > 0) and np.all(intervals > 0)):
+            raise ValueError("Dose amounts and intervals must be positive")
+        if np.any(np.asarray(infusion_durations) < 0):
+            raise ValueError("Infusion durations cannot be negative")
+        if self.max_single_dose is not None:
+            amounts = amounts[amounts <= self.max_single_dose]
+
+        columns = {"amount": [], "interval": [], "infusion_duration": [],
+                   "daily_dose": [], "time_in_window": []}
+        for duration in infusion_durations:
+            fitting = intervals[intervals >= duration]
+            if len(fitting) == 0 or len(amounts) == 0:
+                continue
+            # one curve at a time, so that memory does not grow with the intervals
+            for interval, curve in zip(fitting, self._unit_curves(fitting, duration)):
+                daily = np.array([self.daily_dose(a, interval) for a in amounts])
+                feasible = (np.ones(len(amounts), dtype=bool) if self.max_daily_dose is None
+                            else daily <= self.max_daily_dose)
+                if not np.any(feasible):
+                    continue
+                columns["amount"].append(amounts[feasible])
+                columns["interval"].append(np.full(feasible.sum(), interval))
+                columns["infusion_duration"].append(np.full(feasible.sum(), float(duration)))
+                columns["daily_dose"].append(daily[feasible])
+                columns["time_in_window"].append(
+                    self.time_in_window(amounts[feasible, np.newaxis] * curve))
+        if not columns["amount"]:
+            raise ValueError("No candidate regimen meets the constraints")
+
+        result = {name: np.concatenate(values) for name, values in columns.items()}
+        order = np.lexsort((result["daily_dose"], -result["time_in_window"]))
+        result = {name: values[order] for name, values in result.items()}
+        result["best"] = self.schedule(result["amount"][0], result["interval"][0],
+                                       result["infusion_duration"][0])
+        return result
+
+    def schedule(self, amount, interval, infusion_duration=0):
+        """
+        Dosing schedule of a regimen over t_eval.
+
+        :param amount: dose amount [ng]
+        :param interval: dosing interval [h]
+        :param infusion_duration: 0 for instantaneous doses, otherwise the time over
+                                  which each dose is infused [h]
+        :return: DoseSchedule
+        """
+        starts = self._dose_times(interval)
+        if infusion_duration == 0:
+            return DoseSchedule(bolus_times=starts, bolus_amounts=amount)
+        return DoseSchedule(infusion_starts=starts, infusion_ends=starts + infusion_duration,
+                            infusion_rates=amount / infusion_duration)
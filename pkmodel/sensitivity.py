@@ -0,0 +1,94 @@
+#
+# SensitivityPropagator class
+#
+
+import numpy as np
+
+
+class SensitivityPropagator:
+    """Advances a model together with its forward sensitivities, the derivatives
+    S_p = dq/dp of every drug quantity with respect to every model parameter p.
+    They obey dS_p/dt = A S_p + (dA/dp) q with S_p = 0 initially, and do not jump at
+    instantaneous doses, so the state and sensitivities form a single linear system
+    with the block lower triangular rate matrix [[A, 0], [dA/dp, A]].
+    That matrix is defective (A is repeated on its diagonal), so it is advanced with
+    matrix exponentials, which are kept for every distinct step size.
+    """
+
+    def __init__(self, model, max_cached=256):
+        """
+        :param model: Model whose parameters are differentiated (see Model.parameter_names)
+        :param max_cached: number of matrix exponentials kept before the cache is emptied
+        """
+        A = model.rate_matrix()
+        dA = model.rate_matrix_derivatives()
+        n, p = len(A), len(dA)
+        self.number_of_compartments = n
+        self.number_of_parameters = p
+        self.rate_matrix = np.kron(np.eye(p + 1), A)
+        for k in range(p):
+            self.rate_matrix[(k + 1) * n:(k + 2) * n, :n] = dA[k]
+        self.input_vector = np.zeros((p + 1) * n)
+        self.input_vector[:n] = model.input_vector()
+        self.max_cached = max_cached
+        self._exponentials = {}
+
+    def initial_state(self, y0):
+        """
+        Augmented state for the drug quantities y0, with zero sensitivities.
+
+        :param y0: (n,) initial drug quantities
+        :return: ((n_params + 1) * n,) numpy array
+        """
+        z0 = np.zeros(len(self.input_vector))
+        z0[:self.number_of_compartments] = y0
+        return z0
+
+    def split(self, z):
+        """
+        Splits augmented states into drug quantities and sensitivities.
+
+        :param z: ((n_params + 1) * n, m) numpy array of augmented states
+        :return: (n, m) drug quantities, (n_params, n, m) sensitivities
+        """
+        n, p = self.number_of_compartments, self.number_of_parameters
+        return z[:n], z[n:].reshape((p, n) + z.shape[1:])
+
+    def _exponential(self, dt):
+        """
+        Exponential of the augmented matrix [[M, b], [0, 0]] dt, for the step size dt
+        rounded to 12 significant digits, so that evenly spaced time points share one.
+        """
+        dt = float('{:.12g}'.format(dt))
+        if dt not in self._exponentials:
+            import scipy.linalg
+
+            if len(self._exponentials) >= self.max_cached:
+                self._exponentials = {}
+            N = len(self.input_vector)
+            augmented = np.zeros((N + 1, N + 1))
+            augmented[:N, :N] = self.rate_matrix
+            augmented[:N, N] = self.input_vector
+            self._exponentials[dt] = scipy.linalg.expm(augmented * dt)
+        return self._exponentials[dt]
+
+    def step(self, x0, u, dt):
+        """
+        Evaluates the augmented state a time dt after x0, with the input held at u
+        (same interface as LinearPropagator.step, for a single system).
+
+        :param x0: augmented state at the start of the interval
+        :param u: constant input rate over the interval
+        :param dt: sorted array of non-negative time offsets from the start
+        :return: (len(x0), len(dt)) numpy array of augmented states
+        """
+        dt = np.atleast_1d(np.asarray(dt, dtype=float))
+        z = np.append(np.asarray(x0, dtype=float), u)
+        x = np.empty((len(z) - 1, len(dt)))
+        previous = 0.0
+        for j, d in enumerate(dt):
+            if d > previous:
+                z = self._exponential(d - previous) @ z
+                previous = d
+            x[:, j] = z[:-1]
+        return x
@@ -0,0 +1,387 @@
+#
+# SimulationService class
+#
+
+import asyncio
+import json
+
+import numpy as np
+from pkmodel.model import Model
+from pkmodel.population import PopulationSolution
+from pkmodel.protocol import DoseSchedule, Protocol, SampledProtocol
+
+# asyncio.get_running_loop is Python 3.7+; inside a coroutine get_event_loop returns
+# the running loop as well
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+def protocol_from_dict(data):
+    """
+    Rebuilds a Protocol, DoseSchedule or SampledProtocol from the output of its to_dict,
+    telling them apart by their keys.
+
+    :param data: dict as returned by to_dict
+    :return: dosing protocol
+    """
+    if "rates" in data:
+        return SampledProtocol.from_dict(data)
+    if "bolus_times" in data:
+        return DoseSchedule.from_dict(data)
+    return Protocol.from_dict(data)
+
+
+def _solve_group(models, protocol, t_eval, y0):
+    """
+    Worker task: solves a group of requests sharing topology, protocol and time points
+    as one PopulationSolution. Takes and returns plain data, so that it can run in a
+    process pool as well as a thread pool.
+
+    :param models: list of Model.to_dict outputs
+    :param protocol: output of the protocol's to_dict
+    :param t_eval: time points
+    :param y0: (n_requests, n_compartments) initial drug quantities
+    :return: (n_requests, n_compartments, n_times) numpy array
+    """
+    population = PopulationSolution.from_models([Model.from_dict(model) for model in models],
+                                                protocol_from_dict(protocol))
+    return population.solve(y0=y0, t_eval=t_eval)
+
+
+def _parse_request(message):
+    """
+    Arguments of SimulationService.solve from a request of the JSON-lines protocol.
+
+    :param message: decoded request object (see SimulationService.serve)
+    :return: model, protocol, t_eval (None for the default), y0 (None for zeros)
+    """
+    t_eval = message.get("t_eval")
+    return (Model.from_dict(message["model"]),
+            protocol_from_dict(message.get("protocol", Protocol().to_dict())),
+            None if t_eval is None else np.asarray(t_eval, dtype=float),
+            message.get("y0"))
+
+
+class _Request:
+    """A pending solve and the future its caller awaits."""
+
+    def __init__(self, model, protocol, t_eval, y0, future):
+        self.model = model.to_dict()
+        self.protocol = protocol.to_dict()
+        self.t_eval = np.asarray(t_eval, dtype=float)
+        n = model.number_of_compartments
+        self.y0 = np.zeros(n) if y0 is None else np.asarray(y0, dtype=float)
+        if self.y0.shape != (n,):
+            raise ValueError("y0 must have one entry per compartment")
+        self.future = future
+        # requests with equal keys are solved together
+        self.key = (model.number_of_peripheral_compartments,
+                    model.subcutaneous_compartment is not None,
+                    json.dumps(self.protocol, sort_keys=True),
+                    self.t_eval.tobytes())
+
+
+class SimulationService:
+    """Solves concurrent requests from asyncio code without blocking the event loop.
+    Requests arriving within max_latency of the first one in a batch are gathered,
+    grouped by compartment layout, protocol and time points, and every group is solved
+    as one vectorised PopulationSolution on an executor. Each caller awaits its own
+    result.
+
+    Use as ``async with SimulationService() as service: y = await service.solve(...)``,
+    or call start and close.
+    """
+
+    def __init__(self, max_batch_size=256, max_latency=0.005, executor=None):
+        """
+        :param max_batch_size: largest number of requests gathered into one batch
+        :param max_latency: longest time [s] the first request of a batch waits for
+                            others to join it
+        :param executor: concurrent.futures executor the groups are solved on, defaults
+                         to the event loop's default (thread pool) executor
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.executor = executor
+        self.batches = 0
+        self.groups = 0
+        self._queue = None
+        self._task = None
+        self._running = set()
+
+    async def start(self):
+        """
+        Starts gathering requests on the running event loop.
+        """
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = _running_loop().create_task(self._gather())
+
+    async def close(self):
+        """
+        Stops gathering requests and waits for the groups being solved.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            request = self._queue.get_nowait()
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("The service was closed"))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def solve(self, model, protocol=None, t_eval=None, y0=None):
+        """
+        Solves one model exactly, batched with the other requests pending at the time.
+
+        :param model: Model to solve; requests are batched by the Model's compartment
+                      layout, so other models such as a CompartmentNetwork are rejected
+        :param protocol: dosing protocol, a default Protocol() if None
+        :param t_eval: sorted time points, defaults to 1000 points over 1 hour
+        :param y0: initial drug quantities, zero by default
+        :return: (n_compartments, n_times) numpy array of drug quantities
+        """
+        if not isinstance(model, Model):
+            raise TypeError("SimulationService only solves Model objects, not {}".format(
+                type(model).__name__))
+        await self.start()
+        protocol = protocol if protocol is not None else Protocol()
+        t_eval = np.linspace(0, 1, 1000) if t_eval is None else t_eval
+        future = _running_loop().create_future()
+        await self._queue.put(_Request(model, protocol, t_eval, y0, future))
+        return await future
+
+    async def _gather(self):
+        """
+        Collects batches of requests and hands their groups to the executor.
+        """
+        loop = _running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                request = await self._get(deadline - loop.time())
+                if request is None:
+                    break
+                batch.append(request)
+            self.batches += 1
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for group in groups.values():
+                self.groups += 1
+                task = loop.create_task(self._run_group(group))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+    async def _get(self, timeout):
+        """
+        Next request in the queue, waiting at most timeout [s] for one, or None.
+        Unlike asyncio.wait_for before Python 3.12, this never drops a request that was
+        taken from the queue just as the timeout expired.
+        """
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            if timeout <= 0:
+                return None
+        getter = _running_loop().create_task(self._queue.get())
+        try:
+            await asyncio.wait({getter}, timeout=timeout)
+            if not getter.done():
+                # a getter cancelled before it took a request leaves it in the queue
+                getter.cancel()
+                await asyncio.wait({getter})
+        except asyncio.CancelledError:
+            getter.cancel()
+            if getter.done() and not getter.cancelled():
+                # put a request already taken back, for close to fail it
+                self._queue.put_nowait(getter.result())
+            raise
+        return None if getter.cancelled() else getter.result()
+
+    async def _run_group(self, group):
+        """
+        Solves a group of requests on the executor and resolves their futures.
+        """
+        first = group[0]
+        try:
+            y = await _running_loop().run_in_executor(
+                self.executor, _solve_group, [request.model for request in group],
+                first.protocol, first.t_eval, np.array([request.y0 for request in group]))
+        except Exception as e:
+            for request in group:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        for request, y_request in zip(group, y):
+            if not request.future.done():
+                request.future.set_result(y_request)
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Serves one connection of the JSON-lines protocol (see serve). Requests on a
+        connection are solved concurrently and answered as they complete.
+        """
+        lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = _running_loop().create_task(self._answer(line, writer, lock))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            writer.close()
+
+    async def _answer(self, line, writer, lock):
+        """
+        Solves the request on one line and writes its response, holding lock while
+        writing so that responses on a connection are never interleaved.
+        """
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            response = {"id": None, "error": "Invalid JSON: {}".format(e)}
+        else:
+            response = {"id": message.get("id") if isinstance(message, dict) else None}
+            try:
+                model, protocol, t_eval, y0 = _parse_request(message)
+                y = await self.solve(model, protocol, t_eval=t_eval, y0=y0)
+                response["y"] = y.tolist()
+            except Exception as e:
+                response["error"] = "{}: {}".format(type(e).__name__, e)
+        async with lock:
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=0, path=None):
+        """
+        Starts a server speaking newline-delimited JSON over TCP, or over a Unix socket if
+        path is given. Every request line is an object with an optional "id", a "model"
+        (Model.to_dict), an optional "protocol" (to_dict of any protocol class) and
+        optional "t_eval" and "y0" lists. Every response line carries the same "id" and
+        either "y" (nested lists, compartments by times) or an "error" message.
+
+        :param host: TCP host
+        :param port: TCP port, 0 for any free one
+        :param path: Unix socket path, used instead of host and port
+        :return: asyncio.Server; stop it with server.close()
+        """
+        await self.start()
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle_connection, path=path)
+        return await asyncio.start_server(self._handle_connection, host=host, port=port)
+
+
+class ServiceClient:
+    """Client of a SimulationService server. Requests are sent over one connection
+    and may be awaited concurrently; responses are matched to them by id.
+    """
+
+    def __init__(self, host='127.0.0.1', port=None, path=None):
+        """
+        :param host: TCP host of the server
+        :param port: TCP port of the server
+        :param path: Unix socket path of the server, used instead of host and port
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        self._reader = None
+        self._writer = None
+        self._listener = None
+        self._pending = {}
+        self._next_id = 0
+
+    async def connect(self):
+        """
+        Opens the connection.
+        """
+        if self.path is not None:
+            self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._listener = _running_loop().create_task(self._listen())
+
+    async def close(self):
+        """
+        Closes the connection; requests still waiting fail with ConnectionError.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            if hasattr(self._writer, 'wait_closed'):
+                # Python 3.7+
+                await self._writer.wait_closed()
+            await self._listener
+            self._writer = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _listen(self):
+        """
+        Resolves the pending requests as their responses arrive.
+        """
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.pop(response.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(RuntimeError(response["error"]))
+                else:
+                    future.set_result(np.array(response["y"]))
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("The connection was closed"))
+            self._pending = {}
+
+    async def solve(self, model, protocol=None, t_eval=None, y0=None):
+        """
+        Sends a request to the server (see SimulationService.solve).
+
+        :return: (n_compartments, n_times) numpy array of drug quantities
+        """
+        self._next_id += 1
+        request_id = self._next_id
+        message = {"id": request_id, "model": model.to_dict()}
+        if protocol is not None:
+            message["protocol"] = protocol.to_dict()
+        if t_eval is not None:
+            message["t_eval"] = np.asarray(t_eval, dtype=float).tolist()
+        if y0 is not None:
+            message["y0"] = np.asarray(y0, dtype=float).tolist()
+        future = _running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write((json.dumps(message) + "\n").encode())
+        await self._writer.drain()
+        return await future
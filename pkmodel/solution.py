@@ -2,11 +2,204 @@
 # Solution class
 #
 
-import matplotlib.pylab as plt
+import collections
+import time
+
 import numpy as np
-import scipy.integrate
+from pkmodel.events import EventLog
+from pkmodel.linear import is_sparse, make_propagator
+from pkmodel.metrics import ExposureMetrics
 from pkmodel.model import Model
-from pkmodel.protocol import Protocol
+from pkmodel.protocol import Protocol, SampledProtocol
+from pkmodel.sensitivity import SensitivityPropagator
+from pkmodel.stats import RK_STAGES, SolveStats, emit
+
+# scipy.integrate, scipy.optimize, scipy.signal and matplotlib are imported where
+# they are used, so that importing pkmodel stays cheap for worker processes and
+# headless machines; the exact solver only needs numpy
+
+# solve_ivp methods that make use of the Jacobian
+IMPLICIT_METHODS = ('Radau', 'BDF', 'LSODA')
+
+# number of unit responses to dose times off the superposition grid kept between solves
+MAX_UNIT_RESPONSES = 64
+
+
+class SolveResult(dict):
+    """Result of a solve with the fields of scipy's solve_ivp result (t, y, t_events,
+    y_events, nfev, njev, nlu, status, message, success), readable as attributes or
+    keys like scipy's OptimizeResult, which is not imported for it.
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(name) from e
+
+    __setattr__ = dict.__setitem__
+    __delattr__ = dict.__delitem__
+
+    def __dir__(self):
+        return list(self.keys())
+
+
+def _counting_solver(method, result):
+    """
+    Subclass of the solve_ivp method class that adds every accepted step to result.n_steps.
+    Only the public OdeSolver.step is overridden: each call that moves the solver on
+    makes exactly one accepted step, whatever rejected attempts it takes internally.
+    """
+    import scipy.integrate
+
+    class CountingSolver(getattr(scipy.integrate, method)):
+        def step(self):
+            t = self.t
+            message = super().step()
+            if self.status != 'failed' and self.t != t:
+                result.n_steps += 1
+            return message
+    return CountingSolver
+
+
+def _record_segment(method, result, sol, steps):
+    """
+    Adds the evaluation counts, rejected steps and status of the solve_ivp result sol of
+    one segment to result, which counted steps before the segment.
+    """
+    if method in RK_STAGES:
+        # two evaluations start the segment, every attempted step costs the stages
+        attempts = (sol.nfev - 2) // RK_STAGES[method]
+        result.n_rejected += attempts - (result.n_steps - steps)
+    for key in ('nfev', 'njev', 'nlu'):
+        result[key] += sol[key]
+    result.status, result.message, result.success = sol.status, sol.message, sol.success
+
+
+def _stopped_before(log, start, state, x):
+    """
+    Checks the jump in the state at the start of a segment for crossings of the events
+    in log. Returns whether a terminal event has stopped the solve before the segment,
+    which is then left as NaN in x but for the state at its start if the jump stopped it.
+    """
+    if log.terminated:
+        return True
+    log.check_jump(start, state)
+    if log.terminated:
+        x[:, 0] = state
+        return True
+    return False
+
+
+def _bound_spectrum(rate_matrix):
+    """
+    Stand-in for the eigenvalues of a large sparse rate matrix: a lower bound on the
+    fastest one and the one closest to zero, or NaN if that could not be found.
+    """
+    import scipy.sparse.linalg
+
+    fastest = -2 * np.abs(rate_matrix.diagonal()).max()
+    try:
+        slowest = scipy.sparse.linalg.eigs(rate_matrix.tocsc(), k=1, sigma=0,
+                                           return_eigenvectors=False)[0]
+    except RuntimeError:
+        # singular matrices (drug that is never eliminated) or no convergence
+        slowest = np.nan
+    return np.array([fastest, slowest])
+
+
+def choose_method(rate_matrix, t_span, scale=1.0, max_explicit_steps=1000, min_stiffness_ratio=100,
+                  dense_limit=500):
+    """
+    Picks a solve_ivp method and tolerances from the spectrum of the rate matrix.
+    An explicit method needs about |lambda_max| * t_span steps just to stay stable,
+    whatever the accuracy asked for, so the system counts as stiff when that number is
+    large and the slowest and fastest rates are far apart. Stiff systems get BDF, or
+    Radau if some modes oscillate (BDF is not stable for those at higher orders);
+    all others get RK45. Tolerances are relative to scale, the amount of drug.
+
+    :param rate_matrix: (n, n) rate matrix of the model. For a sparse matrix with more
+                        than dense_limit rows the fastest rate is bounded from the
+                        diagonal (by Gershgorin's theorem, as every column of a
+                        compartment model sums to at most zero), and the slowest is the
+                        eigenvalue closest to zero, found by shift-invert iteration. If
+                        that fails the stiffness ratio is unknown and taken to be
+                        infinite, and the choice rests on the fastest rate alone. Oscillating modes
+                        are then only detected if the slowest one oscillates
+    :param t_span: length of the solved time span
+    :param scale: typical drug quantity, e.g. y0 plus the total dose
+    :param max_explicit_steps: largest |lambda_max| * t_span left to an explicit method
+    :param min_stiffness_ratio: smallest ratio of fastest to slowest rate counted as stiff
+    :param dense_limit: largest sparse matrix whose eigenvalues are computed
+    :return: dict with the 'method', 'rtol', 'atol', the 'reason' for the choice, the
+             'fastest_rate', 'slowest_rate' and 'stiffness_ratio' of the spectrum
+    """
+    if is_sparse(rate_matrix):
+        if rate_matrix.shape[0] <= dense_limit:
+            rate_matrix = rate_matrix.toarray()
+        else:
+            eigenvalues = _bound_spectrum(rate_matrix)
+    if not is_sparse(rate_matrix):
+        eigenvalues = np.linalg.eigvals(rate_matrix)
+    rates = np.abs(eigenvalues.real)
+    rates = rates[rates > 0]
+    fastest = float(rates.max()) if len(rates) else 0.0
+    slowest = float(rates.min()) if len(rates) else 0.0
+    ratio = fastest / slowest if slowest > 0 else 1.0
+    if np.any(np.isnan(eigenvalues)):
+        ratio = np.inf
+    explicit_steps = fastest * t_span
+
+    info = {'fastest_rate': fastest, 'slowest_rate': slowest, 'stiffness_ratio': ratio,
+            'rtol': 1e-6, 'atol': 1e-9 * scale}
+    if explicit_steps <= max_explicit_steps or ratio < min_stiffness_ratio:
+        info['method'] = 'RK45'
+        info['reason'] = ("not stiff: fastest rate x time span = {:.3g}, stiffness ratio = {:.3g}"
+                          .format(explicit_steps, ratio))
+    else:
+        oscillating = np.any(np.abs(eigenvalues.imag) > np.abs(eigenvalues.real))
+        info['method'] = 'Radau' if oscillating else 'BDF'
+        info['reason'] = ("stiff: fastest rate x time span = {:.3g}, stiffness ratio = {:.3g}{}"
+                          .format(explicit_steps, ratio, ", oscillating modes" if oscillating else ""))
+    return info
+
+
+def integrate_segments(protocol, dosing_compartment, y0, t_eval, advance, final_dose=True,
+                       segments=None, checkpoints=None):
+    """
+    Splits the time span at every dosing event (see Protocol.segments). Instantaneous
+    doses are added to the dosing compartment as jumps between segments, and each
+    segment, over which the dose rate is constant, is handed to advance.
+
+    :param protocol: dosing protocol
+    :param dosing_compartment: index of the compartment the dose is given into
+    :param y0: (..., n) initial drug quantities, with optional batch dimensions
+    :param t_eval: sorted time points at which the solution is stored
+    :param advance: function (state, rate, start, end, t) returning the states at the
+                    times t in [start, end) and the state at end
+    :param final_dose: whether an instantaneous dose at t_eval[-1] is applied
+    :param segments: the protocol's segments over t_eval, if already known
+    :param checkpoints: optional list to which the state at the start of every segment,
+                        before its instantaneous dose, is appended
+    :return: (..., n, len(t_eval)) numpy array of drug quantities
+    """
+    y = np.empty(np.shape(y0) + (len(t_eval),))
+    state = np.array(y0, dtype=float)
+    if segments is None:
+        segments = protocol.segments(t_eval[0], t_eval[-1])
+    for start, end, bolus, rate in segments:
+        if checkpoints is not None:
+            checkpoints.append(state.copy())
+        if end > start or final_dose:
+            state[..., dosing_compartment] += bolus
+        lo = np.searchsorted(t_eval, start, side='left')
+        if end > start:
+            hi = np.searchsorted(t_eval, end, side='left')
+            y[..., lo:hi], state = advance(state, rate, start, end, t_eval[lo:hi])
+        else:
+            # the last segment has zero length and owns the points at t_eval[-1]
+            y[..., lo:] = state[..., np.newaxis]
+    return y
 
 
 class Solution:
@@ -14,82 +207,180 @@ class Solution:
     either returning a plot or arrays of the drug concentrations over time.
     """
 
-    def __init__(self, model=Model(), protocol=Protocol()):
+    def __init__(self, model=None, protocol=None):
         """
 
-        :param model: model object containing all relevant initial values
+        :param model: model object containing all relevant initial values,
+                      a default Model() if None
+        :param protocol: dosing protocol, a default Protocol() if None
         :arg solution: serves as the variable to which solutions are saved
         """
-        self.model = model
-        self.protocol = protocol
+        self.model = model if model is not None else Model()
+        self.protocol = protocol if protocol is not None else Protocol()
         self.solution = None
+        self._rate_matrix = None
+        self._input_vector = None
+        self._propagator = None
+        self._propagator_model = None
+        self._sensitivity = None
+        self._sensitivity_model = None
+        self.method_info = None
+        self.stats = None
+        self._checkpoints = None
+        self._unit_grid = None
+        self._unit_step = None
+        self._unit_bases = {}
+        self._unit_responses = collections.OrderedDict()
+
+    def compile(self):
+        """
+        Assembles the rate matrix and dosing input vector of the model once, so that
+        every evaluation of the right-hand side is a single mat-vec.
+        Called by solve, and again whenever the model has been changed.
+
+        :return: ---
+        """
+        self._rate_matrix = self.model.rate_matrix()
+        self._input_vector = self.model.input_vector()
 
-    def system_of_equations(self, t, y):
+    def system_of_equations(self, t, y, dose_rate=None):
         """
-        Implements the algebraic ODE formula from the project description in python
-        and evaluates it at a specific time point.
+        Evaluates the right-hand side of the ODE system, dq/dt = A q + b dose(t),
+        with the rate matrix A and input vector b assembled by compile.
+        State order is central, peripherals, then subcutaneous (see Model.rate_matrix).
+        Instantaneous doses are not part of dose(t); solve applies them as jumps.
 
         :param t: point in time, only relevant if you have a continuous dosing protocol
         :param y: value from which the ODE expression is calculated
+        :param dose_rate: continuous dose rate to use instead of looking it up in the protocol
         :return: derivative of drug concentrations with respect to time
         """
+        if self._rate_matrix is None:
+            self.compile()
+        if dose_rate is None:
+            dose_rate = self.protocol.dose_rate(t)
+        return self._rate_matrix @ y + self._input_vector * dose_rate
+
+    def jacobian(self, t, y):
+        """
+        Exact Jacobian of system_of_equations, which is the constant rate matrix.
+
+        :param t: point in time (unused)
+        :param y: state (unused)
+        :return: (n, n) numpy array
+        """
+        if self._rate_matrix is None:
+            self.compile()
+        return self._rate_matrix
 
-        # we initialize concentrations and derivatives for each compartment
-        # the notation goes as follows:
-        # 0 is the central compartment
-        # if we have a subcutaneous compartment, it goes last
-        # the peripheral components go [1,last-1) (or [1,last), if there's no subcutaneous compartment)
-        # this way we can reuse the code to calculate the transitions of the peripheral compartments
+    def solve(self, y0=None, t_eval=None, method='RK45', cache=None, events=None, resume=False):
+        """
+        Uses the scipy library to solve the initial value problem for the system of
+        equations specified in the system_of_equations function,
+        (we currently assume that the initial drug concentrations are zero).
 
-        qi = y  # we initialize all concentrations to y
-        dqi_dt = np.zeros(self.model.number_of_compartments)  # and all derivatives to zero
+        :param method: any scipy.integrate.solve_ivp method (implicit ones are given the
+                       exact Jacobian), 'auto' to pick one and its tolerances from the
+                       stiffness of the model (see choose_method; the choice is stored in
+                       self.method_info), 'exact' to advance the linear system with its
+                       eigendecomposition between dosing events, 'superposition' to sum
+                       scaled and shifted unit responses that are kept between solves, or
+                       'fft' to convolve the dose rate of a SampledProtocol with the
+                       impulse response
+        :param cache: optional SolutionCache; solutions found in it are not recomputed
+        :param events: optional list of ThresholdEvent objects, supported by 'exact' and
+                       the solve_ivp methods. Crossing times and states are stored in
+                       t_events and y_events, one array per event; a terminal event stops
+                       the solve, and the solution then ends at the crossing (status 1)
+        :param resume: whether to reuse the previous solve of this Solution up to the first
+                       dosing event that differs from it (see _integrate)
+        :return: SolveResult bunch object
 
-        # we then calculate the transitions for each peripheral compartment
-        # CAUTION: be aware of the the slightly awkward situation where we loop from
-        # 0 through the parameters of the peripheral compartments, but from 1 through the
-        # concentration array
+        The work done is recorded in self.stats (see SolveStats) and handed to every
+        hook registered with pkmodel.stats.add_hook.
+        With resume=True, solving again after editing the protocol only recomputes the
+        solution from the first changed dose onward, for 'exact' and the solve_ivp methods
+        without events; the time it resumed from is stored in resumed_from.
+        """
+        clock = time.perf_counter()
+        previous = self._previous_checkpoints(resume)
+        y0, t_eval = self._initial_values(y0, t_eval)
+        requested = method
+        method, tolerances = self._resolve_method(method, y0, t_eval)
+        if events and method in ('superposition', 'fft'):
+            raise ValueError("events are supported by 'exact' and solve_ivp methods")
+        stats = SolveStats(method, len(y0), len(t_eval))
 
-        transitions = np.zeros(self.model.number_of_peripheral_compartments)
-        for i in range(0, self.model.number_of_peripheral_compartments):
-            transitions[i] = (
-                self.model.peripheral_compartments[i]['q_p']
-                * (qi[0] / self.model.vol_c - qi[i + 1] / self.model.peripheral_compartments[i]['vol_p'])
-            )
+        key = None
+        if cache is not None and not events:
+            key = cache.key(self.model, self.protocol, y0, t_eval, requested)
+            if self._load_cached(cache, key, t_eval, stats, clock):
+                return
 
-        # depending on the model type, we calculate the derivative of the central compartment
+        self.compile()
+        if method in ('exact', 'superposition', 'fft'):
+            self.linear_propagator()
+        stats.compile_time = time.perf_counter() - clock
 
-        if self.model.subcutaneous_compartment:
-            dqi_dt[0] = (
-                self.model.subcutaneous_compartment * qi[self.model.number_of_compartments - 1]
-                - qi[0] / self.model.vol_c - np.sum(transitions)
-            )
+        clock = time.perf_counter()
+        if method == 'exact':
+            self.solution = self._solve_exact(y0, t_eval, events, previous)
+        elif method == 'superposition':
+            self.solution = self._solve_superposition(y0, t_eval)
+        elif method == 'fft':
+            self.solution = self._solve_fft(y0, t_eval)
         else:
-            dqi_dt[0] = self.protocol.dose_at_time(t) - qi[0] / self.model.vol_c - np.sum(transitions)
+            self.solution = self._solve_numerical(y0, t_eval, method, events, tolerances, previous)
+        stats.integrate_time = time.perf_counter() - clock
 
-        # we now set the derivatives of the peripheral compartments as the transitions calculated above
-        # and check whether we have to calculate the last derivative differently, in case of
-        # a subcutaneous model
+        clock = time.perf_counter()
+        if key is not None and self.solution.success:
+            cache.put(key, self.solution.y)
+        for field in ('nfev', 'njev', 'nlu', 'n_steps', 'n_rejected'):
+            value = self.solution.get(field, getattr(stats, field))
+            setattr(stats, field, None if value is None else int(value))
+        stats.resumed_from = self.solution.resumed_from
+        stats.postprocess_time = time.perf_counter() - clock
+        self._finish(stats)
 
-        for i in range(1, self.model.number_of_compartments):
-            if self.model.subcutaneous_compartment and i == self.model.number_of_compartments - 1:
-                dqi_dt[i] = (
-                    self.protocol.dose_at_time(t) - self.model.subcutaneous_compartment
-                    * qi[self.model.number_of_compartments - 1]
-                )
-            else:
-                dqi_dt[i] = transitions[i - 1]
+    def _previous_checkpoints(self, resume):
+        """
+        Checkpoints of the previous solve to resume from, None if not resuming. They are
+        dropped from self either way, since they only ever describe the solve just before
+        this one.
+        """
+        previous, self._checkpoints = self._checkpoints, None
+        return previous if resume else None
 
-        return dqi_dt
+    def _load_cached(self, cache, key, t_eval, stats, clock):
+        """
+        Finishes the solve with the solution stored in cache under key, if there is one.
 
-    def solve(self, y0=None, t_eval=None):
+        :return: whether the solution was found
         """
-        Uses the scipy library to solve the initial value problem for the system of
-        equations specified in the system_of_equations function,
-        (we currently assume that the initial drug concentrations are zero).
+        y = cache.get(key)
+        if y is None:
+            return False
+        self.solution = self._empty_result(t_eval, 'Solution loaded from cache.')
+        self.solution.y = y
+        stats.cache_hit = True
+        stats.compile_time = time.perf_counter() - clock
+        self._finish(stats)
+        return True
 
-        :return: scipy bunch object
+    def _finish(self, stats):
+        """
+        Stores the stats of a finished solve and passes them to the registered hooks.
         """
+        self.stats = stats
+        emit(stats)
 
+    def _initial_values(self, y0, t_eval):
+        """
+        Fills in and checks the initial values and time points of a solve.
+
+        :return: y0, t_eval
+        """
         if y0 is None:
             y0 = np.zeros(self.model.number_of_compartments)
 
@@ -102,12 +393,489 @@ class Solution:
         if not np.all((y0 >= 0.0)):
             raise ValueError("The initial concentration cannot be larger than zero.")
 
-        sol = scipy.integrate.solve_ivp(
-            fun=lambda t, y: self.system_of_equations(t, y),
-            t_span=[t_eval[0], t_eval[-1]],
-            y0=y0, t_eval=t_eval)
+        return y0, t_eval
 
-        self.solution = sol
+    def _resolve_method(self, method, y0, t_eval):
+        """
+        Replaces method='auto' by the method chosen by choose_method, and records the
+        choice in self.method_info.
+
+        :return: method, dict of solve_ivp tolerances (empty unless chosen)
+        """
+        if method != 'auto':
+            return method, {}
+        t_eval = np.asarray(t_eval, dtype=float)
+        scale = np.sum(y0) + self.protocol.total_dose(np.nextafter(t_eval[0], -np.inf), t_eval[-1])
+        self.method_info = choose_method(self.model.rate_matrix(), t_eval[-1] - t_eval[0],
+                                         scale=scale if scale > 0 else 1.0)
+        return self.method_info['method'], {key: self.method_info[key] for key in ('rtol', 'atol')}
+
+    def iter_solve(self, y0=None, t_eval=None, chunk=1000, method='exact'):
+        """
+        Solves the model chunk by chunk and yields each block of the solution as soon as
+        it is computed, carrying the state from one chunk to the next. Only one chunk is
+        held in memory at a time, however long t_eval is. self.solution is not set.
+
+        :param y0: initial drug quantities, zero by default
+        :param t_eval: sorted time points, defaults to 1000 points over 1 hour
+        :param chunk: number of time points per block
+        :param method: 'exact', 'auto' or any scipy.integrate.solve_ivp method
+        :return: generator of (t, y) blocks, with y of shape (n, len(t))
+        """
+        if chunk < 1:
+            raise ValueError("chunk must be at least 1")
+        if method in ('superposition', 'fft'):
+            raise ValueError("iter_solve supports 'exact' and solve_ivp methods")
+        y0, t_eval = self._initial_values(y0, t_eval)
+        method, tolerances = self._resolve_method(method, y0, t_eval)
+        self.compile()
+        if method == 'exact':
+            advance = self._exact_advance()
+        else:
+            advance = self._numerical_advance(method, self._empty_result(t_eval),
+                                              tolerances=tolerances)
+        dosing = self.model.dosing_compartment()
+
+        state = y0
+        for i in range(0, len(t_eval), chunk):
+            t = t_eval[i:i + chunk]
+            last = i + chunk >= len(t_eval)
+            # every chunk but the last runs up to the first point of the next one,
+            # whose doses are left to that chunk
+            span = t if last else np.append(t, t_eval[i + chunk])
+            y = integrate_segments(self.protocol, dosing, state, span, advance, final_dose=last)
+            if not last:
+                state, y = y[:, -1], y[:, :-1]
+            yield t, y
+
+    def metrics(self, y0=None, t_eval=None, chunk=1000, method='exact',
+                toxicity_threshold=None, therapeutic_window=None):
+        """
+        Computes exposure metrics of every compartment in a single streaming pass over
+        iter_solve, without keeping the trajectories (see ExposureMetrics).
+
+        :param y0: initial drug quantities, zero by default
+        :param t_eval: sorted time points, defaults to 1000 points over 1 hour
+        :param chunk: number of time points solved at a time
+        :param method: 'exact' or any scipy.integrate.solve_ivp method
+        :param toxicity_threshold: level above which time is counted as toxic
+        :param therapeutic_window: (low, high) levels between which time is counted
+        :return: dict of (n_compartments,) numpy arrays, including the trapezoidal 'auc'
+                 and the 'auc_exact' of the linear model
+        """
+        metrics = ExposureMetrics(toxicity_threshold, therapeutic_window)
+        for t, y in self.iter_solve(y0, t_eval, chunk, method):
+            metrics.update(t, y)
+        result = metrics.result()
+        result['auc_exact'] = metrics.exact_auc(self.model, self.protocol)
+        return result
+
+    def linear_propagator(self):
+        """
+        Exact propagator of the model, kept between solves until the model changes.
+
+        :return: LinearPropagator, or SparsePropagator for a sparse rate matrix
+        """
+        model = self.model.to_dict()
+        if self._propagator is None or model != self._propagator_model:
+            self._propagator = make_propagator(self.model.rate_matrix(), self.model.input_vector())
+            self._propagator_model = model
+            self._unit_grid = None
+        return self._propagator
+
+    def sensitivity_propagator(self):
+        """
+        Propagator of the model with its forward sensitivities, kept between solves
+        until the model changes.
+
+        :return: SensitivityPropagator
+        """
+        model = self.model.to_dict()
+        if self._sensitivity is None or model != self._sensitivity_model:
+            self._sensitivity = SensitivityPropagator(self.model)
+            self._sensitivity_model = model
+        return self._sensitivity
+
+    def sensitivities(self, y0=None, t_eval=None, method='exact'):
+        """
+        Solves the model together with the derivatives of every drug quantity with
+        respect to every model parameter, in one pass over the augmented linear system
+        (see SensitivityPropagator). The solution of the model itself is stored in
+        self.solution as by solve.
+
+        :param y0: initial drug quantities, zero by default
+        :param t_eval: sorted time points, defaults to 1000 points over 1 hour
+        :param method: 'exact' or any scipy.integrate.solve_ivp method
+        :return: (n_params, n_compartments, len(t_eval)) numpy array, with parameters in
+                 the order of Model.parameter_names
+        """
+        if method in ('superposition', 'fft'):
+            raise ValueError("sensitivities supports 'exact' and solve_ivp methods")
+        if not hasattr(self.model, 'rate_matrix_derivatives'):
+            raise TypeError("sensitivities need the parameter derivatives of a Model, which a {} "
+                            "does not have".format(type(self.model).__name__))
+        y0, t_eval = self._initial_values(y0, t_eval)
+        self.compile()
+        system = self.sensitivity_propagator()
+        if method == 'exact':
+            result = self._empty_result(t_eval, 'Exact solution computed.')
+            advance = self._exact_advance(propagator=system)
+        else:
+            result = self._empty_result(t_eval)
+            advance = self._numerical_advance(method, result, rate_matrix=system.rate_matrix,
+                                              input_vector=system.input_vector)
+        z = integrate_segments(self.protocol, self.model.dosing_compartment(),
+                               system.initial_state(y0), t_eval, advance)
+        result.y, sensitivities = system.split(z)
+        self.solution = result
+        return sensitivities
+
+    def impulse_response(self, t):
+        """
+        Response to a unit instantaneous dose at time 0.
+
+        :param t: array of time points
+        :return: (n, len(t)) numpy array, zero for t < 0
+        """
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        propagator = self.linear_propagator()
+        y = np.zeros((len(propagator.input_vector), len(t)))
+        after = t >= 0
+        y[:, after] = propagator.step(propagator.input_vector, 0, t[after])
+        return y
+
+    def step_response(self, t):
+        """
+        Response to a unit continuous dose rate switched on at time 0.
+
+        :param t: array of time points
+        :return: (n, len(t)) numpy array, zero for t < 0
+        """
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        propagator = self.linear_propagator()
+        y = np.zeros((len(propagator.input_vector), len(t)))
+        after = t >= 0
+        y[:, after] = propagator.step(np.zeros(len(propagator.input_vector)), 1, t[after])
+        return y
+
+    def _add_unit_response(self, y, scale, kind, time):
+        """
+        Adds scale times the impulse ('bolus') or step ('continuous') response shifted to
+        start at time, on the current superposition grid, to y. On an evenly spaced grid,
+        a dose at one of its points shifts one response, evaluated once from the start
+        of the grid, by whole steps. Responses to other dose times are evaluated for the
+        dose and the last MAX_UNIT_RESPONSES of them are kept between solves.
+        """
+        grid = self._unit_grid
+        if time > grid[-1]:
+            return
+        response = self.impulse_response if kind == 'bolus' else self.step_response
+        if self._unit_step is not None:
+            index = (time - grid[0]) / self._unit_step
+            shift = int(round(index))
+            if abs(index - shift) < 1e-9 and 0 <= shift < len(grid):
+                if kind not in self._unit_bases:
+                    self._unit_bases[kind] = response(grid - grid[0])
+                y[:, shift:] += scale * self._unit_bases[kind][:, :len(grid) - shift]
+                return
+
+        key = (kind, time)
+        if key in self._unit_responses:
+            self._unit_responses.move_to_end(key)
+        else:
+            self._unit_responses[key] = response(grid - time)
+            while len(self._unit_responses) > MAX_UNIT_RESPONSES:
+                self._unit_responses.popitem(last=False)
+        y += scale * self._unit_responses[key]
+
+    def _solve_superposition(self, y0, t_eval):
+        """
+        Solves the linear system as the free response to y0 plus the sum of scaled, shifted
+        unit responses, one per instantaneous dose and two (on and off) per continuous
+        infusion of the compiled dose schedule. Unit responses are kept as long as the
+        model and t_eval stay the same (see _add_unit_response), so changing the dose
+        amount or adding dose times on an evenly spaced t_eval costs almost nothing.
+
+        :param y0: initial drug quantities
+        :param t_eval: sorted time points at which the solution is stored
+        :return: SolveResult with the same fields as solve_ivp's result
+        """
+        if isinstance(self.protocol, SampledProtocol):
+            raise ValueError("Use method='fft' to solve with a SampledProtocol")
+        propagator = self.linear_propagator()
+        t_eval = np.asarray(t_eval, dtype=float)
+        if self._unit_grid is None or not np.array_equal(self._unit_grid, t_eval):
+            self._unit_grid = t_eval.copy()
+            steps = np.diff(t_eval)
+            evenly = len(steps) > 0 and steps[0] > 0 and np.allclose(steps, steps[0], rtol=1e-9, atol=0)
+            self._unit_step = steps[0] if evenly else None
+            self._unit_bases = {}
+            self._unit_responses.clear()
+
+        schedule = self.protocol.compile()
+        y = propagator.step(y0, 0, t_eval - t_eval[0])
+        for dose_time, amount in zip(schedule.bolus_times, schedule.bolus_amounts):
+            if t_eval[0] <= dose_time <= t_eval[-1]:
+                self._add_unit_response(y, amount, 'bolus', dose_time)
+        for start, end, rate in zip(schedule.infusion_starts, schedule.infusion_ends,
+                                    schedule.infusion_rates):
+            start = max(start, t_eval[0])
+            if start < end:
+                self._add_unit_response(y, rate, 'continuous', start)
+                self._add_unit_response(y, -rate, 'continuous', end)
+
+        result = self._empty_result(t_eval, 'Superposition of unit responses.')
+        result.y = y
+        return result
+
+    def _solve_fft(self, y0, t_eval):
+        """
+        Solves the linear system for a SampledProtocol by convolving the dose rate with
+        the discretised impulse response using FFTs, which costs O(N log N) for N samples.
+        The state is computed on a grid with the protocol's sampling interval starting
+        at t_eval[0], on which the rate is held constant, and interpolated linearly onto
+        t_eval. The result is exact at grid points when the protocol's samples line up
+        with the grid; otherwise the rate is averaged over each grid interval.
+
+        :param y0: initial drug quantities
+        :param t_eval: sorted time points at which the solution is stored
+        :return: SolveResult with the same fields as solve_ivp's result
+        """
+        if not isinstance(self.protocol, SampledProtocol):
+            raise ValueError("method='fft' needs a SampledProtocol")
+        import scipy.signal
+
+        propagator = self.linear_propagator()
+        t_eval = np.asarray(t_eval, dtype=float)
+        dt = self.protocol.dt
+        n_steps = max(1, int(np.ceil((t_eval[-1] - t_eval[0]) / dt - 1e-9)))
+        grid = t_eval[0] + dt * np.arange(n_steps + 1)
+
+        # mean dose rate over each grid interval
+        rates = np.diff(self.protocol.cumulative_dose(grid)) / dt
+        # kernel[:, m] = exp(A m dt) times the response to a unit rate over one interval
+        one_interval = propagator.step(np.zeros(len(y0)), 1, dt)[:, 0]
+        kernel = propagator.step(one_interval, 0, dt * np.arange(n_steps))
+
+        y_grid = propagator.step(y0, 0, grid - grid[0])
+        y_grid[:, 1:] += scipy.signal.fftconvolve(kernel, rates[np.newaxis, :], axes=1)[:, :n_steps]
+
+        y = np.array([np.interp(t_eval, grid, y_c) for y_c in y_grid])
+        result = self._empty_result(t_eval, 'Convolution of the sampled dose rate.')
+        result.y = y
+        return result
+
+    @staticmethod
+    def _empty_result(t_eval, message=None):
+        """
+        Bunch object with the fields of solve_ivp's result, for y to be filled in.
+        """
+        return SolveResult(
+            t=np.asarray(t_eval), y=None, sol=None, t_events=None, y_events=None,
+            nfev=0, njev=0, nlu=0, status=0, message=message, success=True, resumed_from=None)
+
+    def _exact_advance(self, log=None, propagator=None):
+        """
+        Advance function for integrate_segments that uses the exact propagator, or
+        another one with the same step method.
+        Crossings of the events in the optional EventLog are found by root finding on
+        the exact solution, and segments after a terminal crossing are left as NaN.
+        """
+        if propagator is None:
+            propagator = self.linear_propagator()
+
+        def advance(state, rate, start, end, t):
+            if log is not None:
+                if log.terminated:
+                    return np.full(np.shape(state) + (len(t),), np.nan), np.full(np.shape(state), np.nan)
+                log.check_jump(start, state)
+                log.locate(lambda s: propagator.step(state, rate, s - start), start, end, t)
+            x = propagator.step(state, rate, np.append(t, end) - start)
+            if log is not None:
+                log.done(end, x[..., -1])
+            return x[..., :-1], x[..., -1]
+        return advance
+
+    def _numerical_advance(self, method, result, log=None, rate_matrix=None, input_vector=None,
+                           tolerances=None):
+        """
+        Advance function for integrate_segments that integrates each segment with a
+        separate call to solve_ivp, so the solver never steps across a discontinuity in
+        the dose. Evaluation counts and the solver status are accumulated in result.
+        The events of the optional EventLog are handed to solve_ivp, and segments after
+        a terminal crossing are left as NaN. A rate matrix and input vector may be given
+        to integrate another linear system than the model's, and tolerances as a dict of
+        solve_ivp's rtol and atol.
+        """
+        import scipy.integrate
+
+        system, options = self._solver_options(method, result, tolerances, rate_matrix,
+                                               input_vector)
+        if log is not None:
+            options['events'] = log.events
+
+        def advance(state, rate, start, end, t):
+            x = np.full((len(state), len(t) + 1), np.nan)
+            if log is not None and _stopped_before(log, start, state, x):
+                return x[:, :-1], x[:, -1]
+            if result.success:
+                steps = result.n_steps
+                sol = scipy.integrate.solve_ivp(
+                    fun=lambda t, y: system(t, y, rate),
+                    t_span=[start, end], y0=state, t_eval=np.append(t, end), **options)
+                x[:, :sol.y.shape[1]] = sol.y
+                _record_segment(method, result, sol, steps)
+                if log is not None:
+                    log.record_solve_ivp(sol)
+                    log.done(end, x[:, -1])
+            return x[:, :-1], x[:, -1]
+        return advance
+
+    def _solver_options(self, method, result, tolerances=None, rate_matrix=None,
+                        input_vector=None):
+        """
+        Right-hand side and solve_ivp options for _numerical_advance: the solver, which
+        counts its steps in result (see _counting_solver), the tolerances and, for
+        implicit methods, the exact Jacobian, made dense for LSODA.
+
+        :return: system(t, y, dose_rate), dict of keyword arguments of solve_ivp
+        """
+        import scipy.integrate
+
+        if rate_matrix is None:
+            system, jacobian = self.system_of_equations, self.jacobian
+        else:
+            def system(t, y, dose_rate):
+                return rate_matrix @ y + input_vector * dose_rate
+
+            def jacobian(t, y):
+                return rate_matrix
+
+        options = dict(tolerances or {})
+        if method == 'LSODA':
+            # LSODA only takes dense Jacobians, and scipy's wrapper only a callable one;
+            # the others factorise sparse ones directly
+            matrix = jacobian(None, None)
+            dense = matrix.toarray() if is_sparse(matrix) else matrix
+            options['jac'] = lambda t, y: dense
+        elif method in IMPLICIT_METHODS:
+            options['jac'] = jacobian(None, None)
+
+        result.n_steps = 0
+        result.n_rejected = 0 if method in RK_STAGES else None
+        if isinstance(method, str) and hasattr(scipy.integrate, method):
+            options['method'] = _counting_solver(method, result)
+        else:
+            options['method'] = method
+        return system, options
+
+    def _solve_exact(self, y0, t_eval, events=None, previous=None):
+        """
+        Solves the linear system exactly. The rate matrix is decomposed once and the
+        state is advanced from one dosing event to the next.
+
+        :param y0: initial drug quantities
+        :param t_eval: sorted time points at which the solution is stored
+        :param events: optional list of ThresholdEvent objects
+        :param previous: checkpoints of the previous solve to resume from, if any
+        :return: SolveResult with the same fields as solve_ivp's result
+        """
+        result = self._empty_result(t_eval, 'Exact solution computed.')
+        if not events:
+            result.y, result.resumed_from = self._integrate(y0, t_eval, self._exact_advance(),
+                                                            ('exact',), result, previous)
+            return result
+        log = EventLog(events, t_eval[0], y0)
+        result.y = integrate_segments(self.protocol, self.model.dosing_compartment(), y0, t_eval,
+                                      self._exact_advance(log))
+        log.apply(result)
+        return result
+
+    def _solve_numerical(self, y0, t_eval, method, events=None, tolerances=None, previous=None):
+        """
+        Integrates each smooth segment between dosing events separately with solve_ivp.
+
+        :param y0: initial drug quantities
+        :param t_eval: sorted time points at which the solution is stored
+        :param method: solve_ivp method
+        :param events: optional list of ThresholdEvent objects
+        :param tolerances: optional dict of solve_ivp's rtol and atol
+        :param previous: checkpoints of the previous solve to resume from, if any
+        :return: SolveResult with the same fields as solve_ivp's result
+        """
+        result = self._empty_result(t_eval)
+        if not events:
+            advance = self._numerical_advance(method, result, tolerances=tolerances)
+            key = (method, tuple(sorted((tolerances or {}).items())))
+            result.y, result.resumed_from = self._integrate(y0, t_eval, advance, key, result,
+                                                            previous)
+            return result
+        log = EventLog(events, t_eval[0], y0)
+        result.y = integrate_segments(self.protocol, self.model.dosing_compartment(), y0, t_eval,
+                                      self._numerical_advance(method, result, log,
+                                                              tolerances=tolerances))
+        log.apply(result)
+        return result
+
+    def _integrate(self, y0, t_eval, advance, key, result, previous=None):
+        """
+        Runs integrate_segments, resuming from the checkpoints of a previous solve where
+        possible. The states at the start of every segment are kept in self._checkpoints,
+        together with the segments and a reference to the result, whose trajectory is not
+        copied. If the model, y0, t_eval and method of the previous solve are unchanged,
+        its trajectory up to the first segment that differs (e.g. the first dose added or
+        changed by a protocol edit) is reused, and only the rest is recomputed from the
+        checkpoint at its start. Any model edit invalidates everything from t_eval[0].
+        Each segment is advanced on its own from the state at its start, so a resumed
+        solution is identical to a full one.
+
+        :param y0: initial drug quantities
+        :param t_eval: sorted time points at which the solution is stored
+        :param advance: advance function for integrate_segments
+        :param key: description of the method and its options
+        :param result: SolveResult of the solve, whose success decides whether the
+                       checkpoints are kept
+        :param previous: self._checkpoints of the previous solve, None for a full solve
+        :return: (n, len(t_eval)) numpy array, time from which the trajectory was
+                 recomputed (None for a full solve)
+        """
+        t_eval = np.asarray(t_eval, dtype=float)
+        dosing = self.model.dosing_compartment()
+        segments = self.protocol.segments(t_eval[0], t_eval[-1])
+        key = (self.model.to_dict(), key)
+
+        first = 0
+        if (previous is not None and previous['key'] == key
+                and np.array_equal(previous['t_eval'], t_eval) and np.array_equal(previous['y0'], y0)):
+            for old, new in zip(previous['segments'], segments):
+                if old != new:
+                    break
+                first += 1
+
+        if first == 0 or first > len(previous['checkpoints']):
+            checkpoints = []
+            y = integrate_segments(self.protocol, dosing, y0, t_eval, advance, segments=segments,
+                                   checkpoints=checkpoints)
+            resumed_from = None
+        else:
+            y = np.array(previous['result'].y)
+            checkpoints = previous['checkpoints'][:first]
+            resumed_from = t_eval[-1]
+            if first < len(segments):
+                resumed_from = segments[first][0]
+                lo = np.searchsorted(t_eval, resumed_from, side='left')
+                # the recomputed span starts exactly at the checkpoint
+                span = t_eval[lo:]
+                if span[0] != resumed_from:
+                    span = np.append(resumed_from, span)
+                tail = integrate_segments(self.protocol, dosing, previous['checkpoints'][first], span,
+                                          advance, segments=segments[first:], checkpoints=checkpoints)
+                y[:, lo:] = tail[:, len(span) - (len(t_eval) - lo):]
+
+        if result.success:
+            self._checkpoints = {'key': key, 't_eval': t_eval.copy(), 'y0': np.array(y0, dtype=float),
+                                 'segments': segments, 'checkpoints': checkpoints, 'result': result}
+        return y, resumed_from
 
     def plot(self, name):
         """
@@ -116,16 +884,12 @@ class Solution:
         :param name: the name of the model in question, e.g. IV, 2 peripheral compartments
         :return: ---
         """
+        import matplotlib.pylab as plt
+
         _ = plt.figure()
 
-        for i in range(0, self.solution.y.shape[0]):
-            if i == 0:
-                plt.plot(self.solution.t, self.solution.y[i, :], label=name + " Central Compartment")
-            elif self.model.subcutaneous_compartment and i == self.solution.y.shape[0] - 1:
-                plt.plot(self.solution.t, self.solution.y[i, :], label=name + " Subcutaneous Compartment")
-            else:
-                plt.plot(self.solution.t, self.solution.y[i, :],
-                         label=name + " " + self.model.peripheral_compartments[i - 1]["name"])
+        for compartment, y in zip(self.model.compartment_names(), self.solution.y):
+            plt.plot(self.solution.t, y, label=name + " " + compartment)
         plt.legend()
         plt.ylabel('drug mass [ng]')
         plt.xlabel('time [h]')
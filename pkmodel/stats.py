@@ -0,0 +1,151 @@
+#
+# SolveStats class
+#
+
+import contextlib
+
+# callbacks called with the SolveStats of every finished solve
+_hooks = []
+
+# number of right-hand side evaluations per attempted step of the explicit
+# Runge-Kutta methods whose steps can be counted from nfev (see SolveStats.n_rejected)
+RK_STAGES = {'RK23': 3, 'RK45': 6}
+
+
+def add_hook(callback):
+    """
+    Registers a callback that is called with the SolveStats of every finished
+    Solution.solve, e.g. to forward them to a metrics backend.
+
+    :param callback: function taking a SolveStats
+    :return: callback, so that add_hook can be used as a decorator
+    """
+    _hooks.append(callback)
+    return callback
+
+
+def remove_hook(callback):
+    """
+    Unregisters a callback added with add_hook.
+
+    :param callback: function passed to add_hook
+    """
+    _hooks.remove(callback)
+
+
+def emit(stats):
+    """
+    Calls every registered hook with stats.
+
+    :param stats: SolveStats of a finished solve
+    """
+    for callback in list(_hooks):
+        callback(stats)
+
+
+class SolveStats:
+    """Record of the work done by one call to Solution.solve. Counts that do not apply to
+    the method used (e.g. step counts of the exact solver) are None.
+    """
+
+    FIELDS = ('method', 'n_compartments', 'n_times', 'cache_hit', 'resumed_from', 'nfev', 'njev',
+              'nlu', 'n_steps', 'n_rejected', 'compile_time', 'integrate_time', 'postprocess_time')
+
+    def __init__(self, method, n_compartments, n_times):
+        """
+        :param method: method actually used to solve, after resolving 'auto'
+        :param n_compartments: number of compartments of the model
+        :param n_times: number of output time points
+        :arg cache_hit: whether the solution was loaded from a SolutionCache
+        :arg resumed_from: time from which the solution was recomputed, reusing the
+                           previous solve before it; None for a full solve
+        :arg nfev: number of right-hand side evaluations
+        :arg njev: number of Jacobian evaluations
+        :arg nlu: number of LU decompositions
+        :arg n_steps: number of accepted solver steps, solve_ivp methods only
+        :arg n_rejected: number of rejected steps, for RK23 and RK45 only, where it
+                         follows exactly from nfev and n_steps
+        :arg compile_time: wall time [s] spent resolving the method, assembling the rate
+                           matrix and decomposing it
+        :arg integrate_time: wall time [s] spent advancing the solution
+        :arg postprocess_time: wall time [s] spent on events, caching and bookkeeping
+        """
+        self.method = method
+        self.n_compartments = n_compartments
+        self.n_times = n_times
+        self.cache_hit = False
+        self.resumed_from = None
+        self.nfev = 0
+        self.njev = 0
+        self.nlu = 0
+        self.n_steps = None
+        self.n_rejected = None
+        self.compile_time = 0.0
+        self.integrate_time = 0.0
+        self.postprocess_time = 0.0
+
+    @property
+    def total_time(self):
+        return self.compile_time + self.integrate_time + self.postprocess_time
+
+    def to_dict(self):
+        """
+        Describes the record as plain python types, e.g. for logging as JSON.
+
+        :return: dict
+        """
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data['total_time'] = self.total_time
+        return data
+
+    def __repr__(self):
+        return 'SolveStats({})'.format(', '.join(
+            '{}={!r}'.format(key, value) for key, value in self.to_dict().items()))
+
+
+class StatsCollector:
+    """Keeps the SolveStats of every solve finished while it is registered as a hook
+    (see collect_stats), and aggregates them.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, stats):
+        self.records.append(stats)
+
+    def summary(self):
+        """
+        Totals of the counts and wall times over all records, with the number of solves
+        and cache hits and the slowest solve.
+
+        :return: dict
+        """
+        summary = {'n_solves': len(self.records),
+                   'cache_hits': sum(stats.cache_hit for stats in self.records)}
+        for field in ('nfev', 'njev', 'nlu', 'n_steps', 'n_rejected', 'compile_time',
+                      'integrate_time', 'postprocess_time', 'total_time'):
+            summary[field] = sum(getattr(stats, field) or 0 for stats in self.records)
+        summary['max_time'] = max((stats.total_time for stats in self.records), default=0.0)
+        summary['by_method'] = {}
+        for stats in self.records:
+            summary['by_method'][stats.method] = summary['by_method'].get(stats.method, 0) + 1
+        return summary
+
+
+@contextlib.contextmanager
+def collect_stats():
+    """
+    Context manager collecting the SolveStats of every solve run inside it:
+
+        with collect_stats() as collector:
+            ...
+        collector.summary()
+
+    :return: StatsCollector
+    """
+    collector = add_hook(StatsCollector())
+    try:
+        yield collector
+    finally:
+        remove_hook(collector)
@@ -0,0 +1,144 @@
+#
+# PeriodicDosing class
+#
+
+import numpy as np
+from pkmodel.linear import make_propagator, solve_linear
+
+
+class PeriodicDosing:
+    """A dose repeated at a fixed interval, given either instantaneously at the start
+    of every cycle or as a continuous infusion over the first part of every cycle.
+    Since the model is linear, one cycle is an affine map x -> Phi x + c of the state
+    at the start of a cycle, so the periodic steady state and any individual cycle
+    are computed directly, without integrating through the cycles before them.
+    """
+
+    def __init__(self, model, interval, dose_amount=1, infusion_duration=0):
+        """
+        :param model: Model object
+        :param interval: time between the starts of two doses [h]
+        :param dose_amount: total amount given per cycle [ng]
+        :param infusion_duration: 0 for an instantaneous dose, otherwise the time over
+                                  which each dose is infused at a constant rate [h]
+        """
+        if not interval > 0:
+            raise ValueError("The dosing interval must be positive")
+        if not 0 <= infusion_duration <= interval:
+            raise ValueError("The infusion must fit into the dosing interval")
+        self.model = model
+        self.interval = interval
+        self.dose_amount = dose_amount
+        self.infusion_duration = infusion_duration
+        self.propagator = make_propagator(model.rate_matrix(), model.input_vector())
+
+        n = model.number_of_compartments
+        # the cycle map, built from the responses to zero and to unit start states
+        self.cycle_input = self._end_of_cycle(np.zeros(n))
+        self.cycle_matrix = np.column_stack(
+            [self._end_of_cycle(e) - self.cycle_input for e in np.eye(n)])
+        self.steady_state = np.linalg.solve(np.eye(n) - self.cycle_matrix, self.cycle_input)
+
+    def _end_of_cycle(self, x):
+        """
+        State at the end of one cycle started in state x (before the dose).
+        """
+        return self.within_cycle(x, self.interval)[:, 0]
+
+    def within_cycle(self, x, t):
+        """
+        Trajectory through one cycle started in state x, before that cycle's dose.
+
+        :param x: (n,) state at the start of the cycle
+        :param t: times since the start of the cycle, 0 <= t <= interval
+        :return: (n, len(t)) numpy array
+        """
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        b = self.propagator.input_vector
+        if self.infusion_duration == 0:
+            return self.propagator.step(x + self.dose_amount * b, 0, t)
+
+        rate = self.dose_amount / self.infusion_duration
+        y = np.empty((len(x), len(t)))
+        during = t < self.infusion_duration
+        y[:, during] = self.propagator.step(x, rate, t[during])
+        x_off = self.propagator.step(x, rate, self.infusion_duration)[:, 0]
+        y[:, ~during] = self.propagator.step(x_off, 0, t[~during] - self.infusion_duration)
+        return y
+
+    def start_of_cycle(self, k, y0=None):
+        """
+        State at the start of cycle k (k = 0 is the first dose), before its dose:
+        x_k = x_ss + Phi^k (y0 - x_ss), with Phi^k = exp(A k interval).
+
+        :param k: cycle number
+        :param y0: initial drug quantities, zero by default
+        :return: (n,) numpy array
+        """
+        y0 = np.zeros(len(self.steady_state)) if y0 is None else np.asarray(y0, dtype=float)
+        return self.steady_state + self.propagator.step(
+            y0 - self.steady_state, 0, k * self.interval)[:, 0]
+
+    def cycle(self, k, t=None, y0=None):
+        """
+        Trajectory through cycle k, without integrating any of the cycles before it.
+
+        :param k: cycle number (0 is the first dose), or None for the steady-state cycle
+        :param t: times since the start of the cycle, defaults to 100 points
+        :param y0: initial drug quantities, zero by default
+        :return: (n, len(t)) numpy array
+        """
+        if t is None:
+            t = np.linspace(0, self.interval, 100)
+        x = self.steady_state if k is None else self.start_of_cycle(k, y0)
+        return self.within_cycle(x, t)
+
+    def cycle_auc(self, x):
+        """
+        Exact area under the curve of every compartment over one cycle started in x.
+        Integrating dx/dt = A x + b u over the cycle gives A AUC = x_end - x - b dose.
+
+        :param x: (n,) state at the start of the cycle
+        :return: (n,) numpy array [ng h]
+        """
+        change = self._end_of_cycle(x) - x - self.dose_amount * self.propagator.input_vector
+        return solve_linear(self.propagator.rate_matrix, change)
+
+    def accumulation_ratio(self, kind='auc'):
+        """
+        Ratio of steady-state to first-dose exposure for every compartment.
+
+        :param kind: 'auc' to compare the AUC over a cycle, or 'trough' to compare the
+                     drug quantity at the end of a cycle
+        :return: (n,) numpy array
+        """
+        first = np.zeros(len(self.steady_state))
+        if kind == 'auc':
+            return self.cycle_auc(self.steady_state) / self.cycle_auc(first)
+        if kind == 'trough':
+            return self.steady_state / self._end_of_cycle(first)
+        raise ValueError("kind must be 'auc' or 'trough'")
+
+    def time_to_steady_state(self, fraction=0.9, compartment=0, max_cycles=10 ** 6):
+        """
+        Time until the trough (pre-dose) drug quantity first reaches fraction of its
+        steady-state value, starting from no drug. Cycles are checked in growing blocks,
+        each evaluated at once.
+
+        :param fraction: fraction of the steady state, between 0 and 1
+        :param compartment: index of the compartment that is checked
+        :param max_cycles: number of cycles after which the search gives up
+        :return: time [h], a whole number of dosing intervals
+        """
+        if not 0 < fraction < 1:
+            raise ValueError("fraction must be between 0 and 1")
+        target = fraction * self.steady_state[compartment]
+        start, block = 0, 64
+        while start < max_cycles:
+            k = np.arange(start, min(start + block, max_cycles))
+            remaining = self.propagator.step(self.steady_state, 0, k * self.interval)
+            reached = np.nonzero(self.steady_state[compartment] - remaining[compartment] >= target)[0]
+            if len(reached):
+                return k[reached[0]] * self.interval
+            start, block = start + block, 2 * block
+        raise RuntimeError("Steady state not reached within {} cycles".format(max_cycles))
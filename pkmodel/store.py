@@ -0,0 +1,219 @@
+#
+# ResultStore class
+#
+
+import json
+import numbers
+import os
+import struct
+
+import numpy as np
+
+# every column file starts with a fixed-size .npy header, so that its shape can be
+# rewritten in place when rows are appended
+_HEADER_SIZE = 128
+_METADATA = "metadata.json"
+
+
+def _write_header(f, shape):
+    """
+    Writes a version 1.0 .npy header for a C-ordered float64 array of the given shape,
+    padded to _HEADER_SIZE bytes.
+    """
+    magic = np.lib.format.magic(1, 0)
+    header = "{{'descr': '<f8', 'fortran_order': False, 'shape': {}, }}".format(tuple(shape))
+    header_length = _HEADER_SIZE - len(magic) - 2
+    f.seek(0)
+    f.write(magic + struct.pack('<H', header_length)
+            + (header.ljust(header_length - 1) + '\n').encode('latin1'))
+
+
+def _read_shape(path):
+    """
+    Reads the shape from the header of a .npy file without touching its data.
+    """
+    with open(path, "rb") as f:
+        np.lib.format.read_magic(f)
+        return np.lib.format.read_array_header_1_0(f)[0]
+
+
+class ResultStore:
+    """A solution stored on disk as memory-mapped .npy columns: the time axis, and one
+    array per compartment with time as the first axis (followed by any batch axes,
+    e.g. patients). A JSON sidecar describes the model, the dosing protocol and the
+    compartments. Rows are appended to the end of every column, so streamed blocks
+    can be written as they arrive, and columns are read back as read-only memory maps
+    without loading them.
+    """
+
+    def __init__(self, directory):
+        """
+        Opens an existing store. Use create to make a new one.
+
+        :param directory: directory holding the store
+        """
+        self.directory = directory
+        with open(os.path.join(directory, _METADATA)) as f:
+            self.metadata = json.load(f)
+
+    @classmethod
+    def create(cls, directory, model=None, protocol=None, compartment_names=None,
+               batch_shape=()):
+        """
+        Creates an empty store.
+
+        :param directory: directory for the store, created if needed; must not hold a store
+        :param model: Model, CompartmentNetwork or PopulationSolution described in the metadata
+        :param protocol: dosing protocol described in the metadata
+        :param compartment_names: names of the compartments, taken from model by default
+        :param batch_shape: shape of the batch axes of every column, e.g. (n_patients,)
+        :return: ResultStore
+        """
+        if compartment_names is None:
+            compartment_names = model.compartment_names()
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, _METADATA)):
+            raise FileExistsError("{} already holds a result store".format(directory))
+
+        metadata = {
+            "compartments": list(compartment_names),
+            "batch_shape": list(batch_shape),
+            "model": None if model is None else
+            {"type": type(model).__name__, "data": model.to_dict()},
+            "protocol": None if protocol is None else
+            {"type": type(protocol).__name__, "data": protocol.to_dict()}}
+
+        for name, shape in [("t", (0,))] + [(cls._column_file(i), (0,) + tuple(batch_shape))
+                                            for i in range(len(compartment_names))]:
+            with open(os.path.join(directory, name + ".npy"), "wb") as f:
+                _write_header(f, shape)
+        with open(os.path.join(directory, _METADATA), "w") as f:
+            json.dump(metadata, f, indent=2, default=float)
+        return cls(directory)
+
+    @classmethod
+    def save(cls, directory, solution):
+        """
+        Stores the result of Solution.solve.
+
+        :param directory: directory for the store
+        :param solution: Solution object that has been solved
+        :return: ResultStore
+        """
+        store = cls.create(directory, solution.model, solution.protocol)
+        store.append(solution.solution.t, solution.solution.y)
+        return store
+
+    @staticmethod
+    def _column_file(index):
+        return "compartment_{}".format(index)
+
+    @property
+    def compartments(self):
+        return self.metadata["compartments"]
+
+    def append(self, t, y):
+        """
+        Appends a block of the solution to every column. The data of all columns is
+        written before any header is updated, and every column is read up to the length
+        of the shortest one, so an interrupted append leaves the store readable; the
+        next append overwrites whatever it left behind.
+
+        :param t: (m,) time points
+        :param y: (n_compartments, m) or (*batch_shape, n_compartments, m) drug quantities
+        """
+        t = np.asarray(t, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        batch_shape = tuple(self.metadata["batch_shape"])
+        if y.shape != batch_shape + (len(self.compartments), len(t)):
+            raise ValueError("Expected a block of shape {}, got {}".format(
+                batch_shape + (len(self.compartments), len(t)), y.shape))
+
+        blocks = [t] + [np.moveaxis(y[..., i, :], -1, 0) for i in range(len(self.compartments))]
+        n = self._length()
+        for name, block in zip(self._columns(), blocks):
+            with open(self._path(name), "r+b") as f:
+                f.seek(_HEADER_SIZE + n * block.itemsize * int(np.prod(block.shape[1:])))
+                f.write(np.ascontiguousarray(block).tobytes())
+                f.truncate()
+                f.flush()
+        for name, block in zip(self._columns(), blocks):
+            with open(self._path(name), "r+b") as f:
+                _write_header(f, (n + len(t),) + block.shape[1:])
+
+    def extend(self, blocks):
+        """
+        Appends every (t, y) block of an iterable, e.g. Solution.iter_solve.
+
+        :param blocks: iterable of (t, y) pairs as accepted by append
+        :return: the store
+        """
+        for t, y in blocks:
+            self.append(t, y)
+        return self
+
+    @property
+    def t(self):
+        """
+        Read-only memory map of the time axis.
+        """
+        return self._load("t")
+
+    def column(self, compartment):
+        """
+        Read-only memory map of one compartment, of shape (n_times, *batch_shape).
+
+        :param compartment: index or name of the compartment
+        :return: numpy memmap
+        """
+        if not isinstance(compartment, numbers.Integral):
+            compartment = self.compartments.index(compartment)
+        return self._load(self._column_file(compartment))
+
+    def _columns(self):
+        return ["t"] + [self._column_file(i) for i in range(len(self.compartments))]
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".npy")
+
+    def _length(self):
+        """
+        Number of complete rows: the shortest column, since an interrupted append may
+        have updated only some of the headers.
+        """
+        return min(_read_shape(self._path(name))[0] for name in self._columns())
+
+    def _load(self, name):
+        shape = _read_shape(self._path(name))
+        n = self._length()
+        if n == 0:
+            # an empty region of a file cannot be memory-mapped
+            return np.empty((0,) + shape[1:])
+        return np.load(self._path(name), mmap_mode="r")[:n]
+
+    def model(self):
+        """
+        Rebuilds the model described in the metadata.
+
+        :return: Model, CompartmentNetwork or PopulationSolution, or None
+        """
+        from pkmodel.model import Model
+        from pkmodel.network import CompartmentNetwork
+        from pkmodel.population import PopulationSolution
+        return self._rebuild(self.metadata["model"], (Model, CompartmentNetwork, PopulationSolution))
+
+    def protocol(self):
+        """
+        Rebuilds the dosing protocol described in the metadata.
+
+        :return: Protocol, DoseSchedule or SampledProtocol, or None
+        """
+        from pkmodel.protocol import DoseSchedule, Protocol, SampledProtocol
+        return self._rebuild(self.metadata["protocol"], (Protocol, DoseSchedule, SampledProtocol))
+
+    @staticmethod
+    def _rebuild(description, classes):
+        if description is None:
+            return None
+        cls = {c.__name__: c for c in classes}[description["type"]]
+        return cls.from_dict(description["data"])
@@ -0,0 +1,174 @@
+#
+# ParameterSweep class
+#
+
+import copy
+import itertools
+
+import numpy as np
+from pkmodel.solution import Solution
+
+
+def _solve_chunk(shm_name, shape, start, scenarios, y0, t_eval, method):
+    """
+    Worker task: solves a chunk of scenarios and writes each trajectory straight into
+    the shared result array, at the row of its scenario index.
+    """
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        results = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        for i, (model, protocol) in enumerate(scenarios, start=start):
+            _solve_into(results[i], model, protocol, y0, t_eval, method)
+        del results
+    finally:
+        shm.close()
+
+
+def _solve_rows(shape, scenarios, y0, t_eval, method):
+    """
+    Worker task without shared memory: solves a chunk of scenarios and returns their
+    rows of the result array, which are pickled back to the parent process.
+    """
+    results = np.full((len(scenarios),) + tuple(shape[1:]), np.nan)
+    for i, (model, protocol) in enumerate(scenarios):
+        _solve_into(results[i], model, protocol, y0, t_eval, method)
+    return results
+
+
+def _shared_memory():
+    """
+    multiprocessing.shared_memory, which is Python 3.8+, or None.
+    """
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        return None
+    return shared_memory
+
+
+def _solve_into(out, model, protocol, y0, t_eval, method):
+    """
+    Solves one scenario and copies the trajectory into out, a
+    (max_compartments, n_times) array already padded with NaN.
+    """
+    solution = Solution(model, protocol)
+    if y0 is not None:
+        y0 = y0[:model.number_of_compartments]
+    solution.solve(y0=y0, t_eval=t_eval, method=method)
+    out[:model.number_of_compartments] = solution.solution.y
+
+
+class ParameterSweep:
+    """Solves many (model, protocol) scenarios, spreading chunks of them over a pool
+    of worker processes. Workers write their trajectories into a shared memory array,
+    so results are never pickled back to the parent process (before Python 3.8, which
+    has no shared memory, each chunk's results are returned to it instead).
+    """
+
+    def __init__(self, scenarios, t_eval=None, method='exact', chunk_size=64,
+                 max_workers=None):
+        """
+        :param scenarios: sequence of (Model, Protocol) pairs
+        :param t_eval: sorted time points shared by all scenarios,
+                       defaults to 1000 points over 1 hour
+        :param method: solve method passed to Solution.solve
+        :param chunk_size: number of scenarios handed to a worker at a time
+        :param max_workers: number of worker processes, defaults to the number of CPUs;
+                            1 solves every scenario in this process
+        :arg results: (n_scenarios, max_compartments, n_times) array, set by run.
+                      Rows of models with fewer compartments are padded with NaN
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.scenarios = list(scenarios)
+        self.t_eval = np.linspace(0, 1, 1000) if t_eval is None else np.asarray(t_eval)
+        self.method = method
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.results = None
+
+    @classmethod
+    def grid(cls, model, protocol, **axes):
+        """
+        Builds the full factorial grid over model and protocol attributes, e.g.
+        ParameterSweep.grid(model, protocol, clearance_rate=[1, 2], dose_amount=[1, 5]).
+        Scenarios are ordered like itertools.product over the axes, in the order given.
+
+        :param model: template Model, copied for every scenario
+        :param protocol: template Protocol, copied for every scenario
+        :param axes: attribute name of Model or Protocol -> sequence of values.
+                     The keywords t_eval, method, chunk_size and max_workers are
+                     passed on to the constructor instead
+        :return: ParameterSweep
+        """
+        options = {key: axes.pop(key) for key in ('t_eval', 'method', 'chunk_size', 'max_workers')
+                   if key in axes}
+        for name in axes:
+            if not (hasattr(model, name) or hasattr(protocol, name)):
+                raise AttributeError("Neither Model nor Protocol has an attribute {}".format(name))
+
+        scenarios = []
+        for values in itertools.product(*axes.values()):
+            m, p = copy.deepcopy(model), copy.deepcopy(protocol)
+            for name, value in zip(axes, values):
+                setattr(m if hasattr(m, name) else p, name, value)
+            scenarios.append((m, p))
+        return cls(scenarios, **options)
+
+    def run(self, y0=None):
+        """
+        Solves every scenario. Results keep the order of the scenarios regardless of
+        which worker solved them or when.
+
+        :param y0: initial drug quantities shared by all scenarios (truncated to each
+                   model's number of compartments), zero by default
+        :return: (n_scenarios, max_compartments, n_times) numpy array, also stored in
+                 self.results
+        """
+        n_compartments = max([model.number_of_compartments for model, _ in self.scenarios],
+                             default=0)
+        shape = (len(self.scenarios), n_compartments, len(self.t_eval))
+
+        if self.max_workers == 1:
+            self.results = np.full(shape, np.nan)
+            for i, (model, protocol) in enumerate(self.scenarios):
+                _solve_into(self.results[i], model, protocol, y0, self.t_eval, self.method)
+            return self.results
+
+        # the process pool is only set up, and imported, when workers are used
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunks = range(0, len(self.scenarios), self.chunk_size)
+        shared_memory = _shared_memory()
+        if shared_memory is None:
+            self.results = np.full(shape, np.nan)
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(_solve_rows, shape,
+                                           self.scenarios[start:start + self.chunk_size],
+                                           y0, self.t_eval, self.method)
+                           for start in chunks]
+                for start, future in zip(chunks, futures):
+                    rows = future.result()
+                    self.results[start:start + len(rows)] = rows
+            return self.results
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, 8 * int(np.prod(shape))))
+        try:
+            shared = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            shared[:] = np.nan
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(_solve_chunk, shm.name, shape, start,
+                                    self.scenarios[start:start + self.chunk_size],
+                                    y0, self.t_eval, self.method)
+                    for start in chunks]
+                for future in futures:
+                    future.result()
+            self.results = shared.copy()
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+        return self.results
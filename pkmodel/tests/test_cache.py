@@ -0,0 +1,72 @@
+from unittest import TestCase
+import tempfile
+import numpy as np
+import numpy.testing as npt
+
+
+class SolutionCacheTest(TestCase):
+    """
+    Tests the :class:`SolutionCache` class.
+    """
+    def _solution(self, dose_amount=1.0):
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        model = Model()
+        model.add_peripheral_compartment(vol_p=2.0)
+        return Solution(model, Protocol(dose_amount=dose_amount))
+
+    def test_hitsAndMisses(self):
+        """
+        Checks that repeated solves are answered by the cache, and that changing
+        anything that determines the solution is a miss
+        """
+        from pkmodel.cache import SolutionCache
+
+        cache = SolutionCache()
+        solution = self._solution()
+        solution.solve(method='exact', cache=cache)
+        first = solution.solution.y
+        solution.solve(method='exact', cache=cache)
+        npt.assert_array_equal(solution.solution.y, first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        self._solution(dose_amount=2.0).solve(method='exact', cache=cache)
+        solution.solve(method='RK45', cache=cache)
+        solution.solve(t_eval=np.linspace(0, 2, 10), method='exact', cache=cache)
+        solution.model.add_peripheral_compartment()
+        solution.solve(method='exact', cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 5))
+        self.assertEqual(cache.stats()['size'], 5)
+
+    def test_lruEviction(self):
+        """
+        Checks that only the most recently used solutions stay in memory
+        """
+        from pkmodel.cache import SolutionCache
+
+        cache = SolutionCache(maxsize=2)
+        for dose_amount in (1.0, 2.0, 1.0, 3.0):
+            self._solution(dose_amount).solve(method='exact', cache=cache)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        self._solution(1.0).solve(method='exact', cache=cache)
+        self._solution(2.0).solve(method='exact', cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_diskStore(self):
+        """
+        Checks that a new cache on the same directory finds earlier solutions
+        """
+        from pkmodel.cache import SolutionCache
+
+        with tempfile.TemporaryDirectory() as directory:
+            solution = self._solution()
+            solution.solve(method='exact', cache=SolutionCache(directory=directory))
+
+            cache = SolutionCache(maxsize=0, directory=directory)
+            reloaded = self._solution()
+            reloaded.solve(method='exact', cache=cache)
+            npt.assert_array_equal(reloaded.solution.y, solution.solution.y)
+            self.assertEqual(cache.stats()['disk_hits'], 1)
@@ -0,0 +1,74 @@
+from unittest import TestCase
+import numpy as np
+import numpy.testing as npt
+from parameterized import parameterized
+
+
+class ThresholdEventTest(TestCase):
+    """
+    Tests the :class:`ThresholdEvent` class and events in :class:`Solution`.
+    """
+    @parameterized.expand([('exact', 1e-10), ('RK45', 1e-2), ('Radau', 1e-2), ('LSODA', 1e-2)])
+    def test_crossingTimes(self, method, tolerance):
+        """
+        Checks the crossing times of a bolus into the central compartment, q = exp(-t),
+        including the upward crossing caused by the dose itself
+        """
+        from pkmodel.events import ThresholdEvent
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        solution = Solution(Model(), Protocol())
+        events = [ThresholdEvent(0, 0.5, direction=1), ThresholdEvent(0, 0.2, direction=-1),
+                  ThresholdEvent(0, 2)]
+        solution.solve(t_eval=np.linspace(0, 2, 101), method=method, events=events)
+
+        self.assertEqual(solution.solution.status, 0)
+        self.assertEqual(solution.solution.y.shape, (1, 101))
+        npt.assert_allclose(solution.solution.t_events[0], [0])
+        npt.assert_allclose(solution.solution.t_events[1], [np.log(5)], atol=tolerance)
+        self.assertEqual(len(solution.solution.t_events[2]), 0)
+        npt.assert_allclose(solution.solution.y_events[1], [[0.2]], atol=tolerance)
+
+    @parameterized.expand([('exact', 1e-9), ('RK45', 1e-3), ('BDF', 1e-3)])
+    def test_terminalEventStopsSolve(self, method, tolerance):
+        """
+        Checks that a terminal event ends the solution at the first crossing, during
+        absorption from the subcutaneous compartment
+        """
+        from pkmodel.events import ThresholdEvent
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        model = Model(clearance_rate=1, vol_c=2)
+        model.add_subcutaneous_compartment(absorption_rate=3)
+        model.add_peripheral_compartment(vol_p=2, q_p=1)
+        protocol = Protocol(dose_times=[0, 2, 4])
+        t = np.linspace(0, 6, 601)
+
+        reference = Solution(model, protocol)
+        reference.solve(t_eval=t, method='exact')
+        first = np.argmax(reference.solution.y[0] >= 0.6)
+
+        solution = Solution(model, protocol)
+        solution.solve(t_eval=t, method=method, events=[ThresholdEvent(0, 0.6, terminal=True)])
+        self.assertEqual(solution.solution.status, 1)
+        self.assertEqual(len(solution.solution.t_events[0]), 1)
+        t_event = solution.solution.t_events[0][0]
+        self.assertTrue(t[first - 1] < t_event <= t[first])
+        self.assertTrue(np.all(solution.solution.t <= t_event))
+        npt.assert_allclose(solution.solution.y_events[0][0, 0], 0.6, atol=tolerance)
+        npt.assert_allclose(solution.solution.y, reference.solution.y[:, :len(solution.solution.t)],
+                            atol=tolerance)
+
+    def test_eventsNeedSegmentedMethod(self):
+        """
+        Checks that superposition and fft solves reject events
+        """
+        from pkmodel.events import ThresholdEvent
+        from pkmodel.solution import Solution
+
+        with self.assertRaises(ValueError):
+            Solution().solve(method='superposition', events=[ThresholdEvent(0, 1)])
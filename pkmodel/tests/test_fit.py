@@ -0,0 +1,88 @@
+from unittest import TestCase
+import numpy as np
+import numpy.testing as npt
+
+
+def observations(clearance_rate, vol_c, times):
+    """
+    Central concentrations of a two compartment IV model dosed at 0 and 6 hours.
+    """
+    from pkmodel.model import Model
+    from pkmodel.protocol import Protocol
+    from pkmodel.solution import Solution
+
+    model = Model(clearance_rate=clearance_rate, vol_c=vol_c)
+    model.add_peripheral_compartment(vol_p=2.0, q_p=0.8)
+    protocol = Protocol(dose_amount=10, dose_times=[0, 6])
+    solution = Solution(model, protocol)
+    solution.solve(t_eval=np.append(0, times), method='exact')
+    return model, protocol, solution.solution.y[0, 1:] / vol_c
+
+
+class ModelFitTest(TestCase):
+    """
+    Tests the :class:`ModelFit` class and :func:`fit_many`.
+    """
+    def test_recoversParameters(self):
+        """
+        Checks that noise-free data gives back the parameters that generated it,
+        with repeated observation times and the other parameters held fixed
+        """
+        from pkmodel.fit import ModelFit
+        from pkmodel.model import Model
+
+        times = np.array([0.5, 1, 1, 2, 4, 6, 7, 9, 12])
+        _, protocol, concentrations = observations(1.5, 3.0, times)
+        guess = Model(clearance_rate=1, vol_c=1)
+        guess.add_peripheral_compartment(vol_p=2.0, q_p=0.8)
+
+        fit = ModelFit(guess, protocol, times, concentrations, parameters=['clearance_rate', 'vol_c'])
+        result = fit.fit()
+        self.assertTrue(result.success)
+        npt.assert_allclose(result.x, [1.5, 3.0], rtol=1e-6)
+        self.assertEqual(result.model.vol_c, result.parameters['vol_c'])
+        self.assertEqual(result.model.peripheral_compartments[0]['q_p'], 0.8)
+
+    def test_jacobianMatchesFiniteDifferences(self):
+        """
+        Checks the exact Jacobian of the weighted residuals for every parameter
+        """
+        from pkmodel.fit import ModelFit
+
+        times = np.array([0.5, 2, 5, 8])
+        model, protocol, concentrations = observations(1.5, 3.0, times)
+        fit = ModelFit(model, protocol, times, concentrations, sigma=[1, 2, 1, 0.5])
+        x = np.array([1.2, 2.5, 1.8, 1.1])
+        jacobian = fit.jacobian(x)
+        self.assertEqual(jacobian.shape, (4, 4))
+        for k in range(4):
+            step = np.zeros(4)
+            step[k] = 1e-6
+            npt.assert_allclose(jacobian[:, k],
+                                (fit.residuals(x + step) - fit.residuals(x - step)) / 2e-6, atol=1e-7)
+
+    def test_fitMany(self):
+        """
+        Checks that fitting patients in worker processes keeps their order
+        """
+        from pkmodel.fit import ModelFit, fit_many
+
+        times = np.array([0.5, 1, 2, 4, 7, 9, 12])
+        fits = []
+        for clearance_rate in [1.0, 2.0, 3.0]:
+            model, protocol, concentrations = observations(clearance_rate, 3.0, times)
+            fits.append(ModelFit(model, protocol, times, concentrations, parameters=['clearance_rate']))
+        for max_workers in [1, 2]:
+            results = fit_many(fits, max_workers=max_workers, x0=[1.5])
+            npt.assert_allclose([result.x[0] for result in results], [1.0, 2.0, 3.0], rtol=1e-6)
+
+    def test_unknownParameter(self):
+        """
+        Checks that parameters the model does not have are rejected
+        """
+        from pkmodel.fit import ModelFit
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+
+        with self.assertRaises(ValueError):
+            ModelFit(Model(), Protocol(), [1.0], [0.5], parameters=['absorption_rate'])
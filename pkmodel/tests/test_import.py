@@ -0,0 +1,54 @@
+from unittest import TestCase
+import json
+import os
+import subprocess
+import sys
+
+# wall time allowed for ``import pkmodel`` in a fresh interpreter [s]
+IMPORT_BUDGET = 1.0
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import pkmodel
+seconds = time.perf_counter() - start
+loaded = sorted({name.split('.')[0] + ('.' + name.split('.')[1] if '.' in name else '')
+                 for name in sys.modules if name.startswith(('scipy.', 'matplotlib', 'concurrent'))})
+solution = pkmodel.Solution()
+solution.solve(method='exact')
+exact = sorted(name for name in ('scipy.integrate', 'scipy.optimize', 'scipy.signal', 'matplotlib')
+               if name in sys.modules)
+print(json.dumps({'seconds': seconds, 'loaded': loaded, 'exact': exact}))
+"""
+
+
+class ImportTest(TestCase):
+    """
+    Tests that importing pkmodel stays cheap and headless.
+    """
+    def test_importBudget(self):
+        """
+        Checks in a fresh interpreter that import pkmodel loads neither matplotlib nor the
+        heavy scipy subpackages, that an exact solve does not need them either, and that
+        the import fits in the time budget
+        """
+        # run next to the package, so that it is found whether or not it is installed
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.run([sys.executable, '-c', MEASURE], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True,
+                                cwd=root).stdout
+        result = json.loads(output.splitlines()[-1])
+        self.assertEqual(result['loaded'], [])
+        self.assertEqual(result['exact'], [])
+        self.assertLess(result['seconds'], IMPORT_BUDGET)
+
+    def test_defaultArgumentsAreNotShared(self):
+        """
+        Checks that every Solution gets its own default model and protocol
+        """
+        from pkmodel.solution import Solution
+
+        first, second = Solution(), Solution()
+        self.assertIsNot(first.model, second.model)
+        self.assertIsNot(first.protocol, second.protocol)
+        self.assertEqual(first.model.number_of_compartments, 1)
@@ -0,0 +1,79 @@
+from unittest import TestCase
+import numpy as np
+import numpy.testing as npt
+
+
+class ExposureMetricsTest(TestCase):
+    """
+    Tests the :class:`ExposureMetrics` class.
+    """
+    def test_oneCompartmentBolus(self):
+        """
+        Compares the metrics of a single instantaneous dose with their closed forms
+        """
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        CL, V_c, X = 2.0, 1.0, 4.0
+        k = CL / V_c
+        solution = Solution(Model(clearance_rate=CL, vol_c=V_c), Protocol(dose_amount=X))
+        result = solution.metrics(t_eval=np.linspace(0, 2, 4001), chunk=333,
+                                  toxicity_threshold=2.0, therapeutic_window=(0.5, 1.0))
+
+        npt.assert_allclose(result['auc_exact'], [X / k * (1 - np.exp(-2 * k))], rtol=1e-12)
+        npt.assert_allclose(result['auc'], result['auc_exact'], rtol=1e-5)
+        npt.assert_allclose(result['cmax'], [X])
+        npt.assert_allclose(result['tmax'], [0])
+        npt.assert_allclose(result['cmin'], [X * np.exp(-2 * k)])
+        npt.assert_allclose(result['tmin'], [2])
+        npt.assert_allclose(result['time_above_threshold'], [np.log(X / 2.0) / k], rtol=1e-5)
+        npt.assert_allclose(result['time_in_window'], [np.log(1.0 / 0.5) / k], rtol=1e-5)
+        self.assertEqual(result['duration'], 2)
+
+    def test_blocksMatchSinglePass(self):
+        """
+        Checks that feeding the solution in blocks gives the same metrics as all at once
+        """
+        from pkmodel.metrics import ExposureMetrics
+
+        rng = np.random.default_rng(0)
+        t = np.sort(rng.uniform(0, 10, 500))
+        y = rng.uniform(0, 3, (4, 2, 500))
+
+        single = ExposureMetrics(toxicity_threshold=2.0, therapeutic_window=(1.0, 2.5))
+        single.update(t, y)
+        blocks = ExposureMetrics(toxicity_threshold=2.0, therapeutic_window=(1.0, 2.5))
+        for i in range(0, 500, 37):
+            blocks.update(t[i:i + 37], y[..., i:i + 37])
+
+        for key, value in single.result().items():
+            npt.assert_allclose(blocks.result()[key], value)
+        npt.assert_allclose(single.result()['cmax'], y.max(axis=-1))
+        npt.assert_allclose(single.result()['auc'], np.trapezoid(y, t) if hasattr(np, 'trapezoid')
+                            else np.trapz(y, t))
+
+    def test_population(self):
+        """
+        Checks that population metrics match those of each patient
+        """
+        from pkmodel.model import Model
+        from pkmodel.population import PopulationSolution
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        models = []
+        for clearance_rate in (1.0, 2.0, 3.0):
+            model = Model(clearance_rate=clearance_rate)
+            model.add_peripheral_compartment(vol_p=2.0)
+            models.append(model)
+        protocol = Protocol(dose_times=[0, 0.5])
+        protocol.make_continuous(0.2, 0.4)
+
+        result = PopulationSolution.from_models(models, protocol).metrics(
+            chunk=100, toxicity_threshold=0.5)
+        self.assertEqual(result['auc'].shape, (3, 2))
+        for i, model in enumerate(models):
+            individual = Solution(model, protocol).metrics(toxicity_threshold=0.5)
+            for key in ('auc', 'auc_exact', 'cmax', 'time_above_threshold'):
+                npt.assert_allclose(result[key][i], individual[key], rtol=1e-10)
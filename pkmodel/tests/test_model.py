@@ -124,3 +124,55 @@ class ModelTest(unittest.TestCase):
             pk.Model(clearance_rate=input)
         with self.assertRaises(expected):
             pk.Model(vol_c=input)
+
+    def test_rate_matrix_conserves_mass(self):
+        '''
+        Drug only leaves the system through clearance from the central compartment,
+        so the columns of the rate matrix sum to zero except for the central one
+        '''
+        test_model = pk.Model(clearance_rate=2, vol_c=4)
+        test_model.add_peripheral_compartment(vol_p=2, q_p=3)
+        test_model.add_peripheral_compartment(vol_p=5, q_p=1)
+        test_model.add_subcutaneous_compartment(absorption_rate=7)
+
+        column_sums = test_model.rate_matrix().sum(axis=0)
+        assert(abs(column_sums[0] + 2 / 4) < 1e-12)
+        assert(all(abs(column_sums[1:]) < 1e-12))
+        assert(test_model.dosing_compartment() == 3)
+        assert(list(test_model.input_vector()) == [0, 0, 0, 1])
+
+    def test_dict_round_trip(self):
+        '''
+        Test that a model rebuilt from to_dict has the same parameters and layout
+        '''
+        test_model = pk.Model(clearance_rate=2, vol_c=4)
+        test_model.add_peripheral_compartment(pc_name="Fat", vol_p=2, q_p=3)
+        test_model.add_subcutaneous_compartment(absorption_rate=7)
+
+        rebuilt = pk.Model.from_dict(test_model.to_dict())
+        assert(rebuilt.to_dict() == test_model.to_dict())
+        assert(rebuilt.number_of_compartments == 3)
+
+    def test_rate_matrix_derivatives(self):
+        '''
+        Test the rate matrix derivatives against central finite differences
+        '''
+        import numpy as np
+
+        def build(p):
+            model = pk.Model(clearance_rate=p[0], vol_c=p[1])
+            model.add_peripheral_compartment(vol_p=p[2], q_p=p[3])
+            model.add_peripheral_compartment(vol_p=p[4], q_p=p[5])
+            model.add_subcutaneous_compartment(absorption_rate=p[6])
+            return model
+
+        p = np.array([2.0, 4.0, 2.0, 3.0, 5.0, 1.0, 7.0])
+        test_model = build(p)
+        assert(test_model.parameter_names() == ["clearance_rate", "vol_c", "vol_p_1", "q_p_1",
+                                                "vol_p_2", "q_p_2", "absorption_rate"])
+        dA = test_model.rate_matrix_derivatives()
+        for k in range(len(p)):
+            step = np.zeros(len(p))
+            step[k] = 1e-6
+            fd = (build(p + step).rate_matrix() - build(p - step).rate_matrix()) / 2e-6
+            assert(np.allclose(dA[k], fd, atol=1e-8))
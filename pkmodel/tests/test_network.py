@@ -0,0 +1,212 @@
+from unittest import TestCase
+import numpy as np
+import numpy.testing as npt
+from parameterized import parameterized
+
+
+def build_model(sc=True):
+    from pkmodel.model import Model
+
+    model = Model(clearance_rate=1.2, vol_c=2.0)
+    model.add_peripheral_compartment(vol_p=1.5, q_p=0.7)
+    model.add_peripheral_compartment(vol_p=3.0, q_p=0.4)
+    if sc:
+        model.add_subcutaneous_compartment(absorption_rate=1.1)
+    return model
+
+
+def build_chain(n):
+    """
+    Chain of n compartments, each draining into the next and back, with elimination from
+    every tenth compartment.
+    """
+    from pkmodel.network import CompartmentNetwork
+
+    network = CompartmentNetwork()
+    for i in range(n):
+        network.add_compartment(volume=1 + i % 3)
+    for i in range(n - 1):
+        network.add_transfer(i, i + 1, rate=2.0)
+        network.add_transfer(i + 1, i, rate=0.5)
+    for i in range(0, n, 10):
+        network.add_elimination(i, rate=0.3)
+    return network
+
+
+class CompartmentNetworkTest(TestCase):
+    """
+    Tests the :class:`CompartmentNetwork` class.
+    """
+    @parameterized.expand([(True,), (False,)])
+    def test_fromModel(self, sc):
+        """
+        Checks that a network built from a Model has the same rate matrix and input
+        """
+        from pkmodel.network import CompartmentNetwork
+
+        model = build_model(sc)
+        network = CompartmentNetwork.from_model(model)
+        npt.assert_allclose(network.rate_matrix().toarray(), model.rate_matrix(), atol=1e-15)
+        npt.assert_array_equal(network.input_vector(), model.input_vector())
+        self.assertEqual(network.compartment_names(), model.compartment_names())
+
+    @parameterized.expand([('exact',), ('RK45',), ('BDF',), ('LSODA',), ('auto',)])
+    def test_solveLikeModel(self, method):
+        """
+        Checks that Solution solves a network like the model it was built from, with
+        the same method
+        """
+        from pkmodel.network import CompartmentNetwork
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        protocol = Protocol(dose_times=[0, 0.7, 1.3])
+        protocol.make_continuous(0.2, 0.9)
+        t = np.linspace(0, 3, 301)
+        model = build_model()
+
+        reference = Solution(model, protocol)
+        reference.solve(t_eval=t, method=method)
+        solution = Solution(CompartmentNetwork.from_model(model), protocol)
+        solution.solve(t_eval=t, method=method)
+        npt.assert_allclose(solution.solution.y, reference.solution.y, rtol=1e-6, atol=1e-9)
+
+    def test_largeNetwork(self):
+        """
+        Checks an exact solve of a few hundred compartments against dense matrix exponentials
+        """
+        import scipy.linalg
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        network = build_chain(300)
+        network.set_dosing_compartment(5)
+        protocol = Protocol(dose_times=[0])
+        t = np.linspace(0, 2, 21)
+
+        solution = Solution(network, protocol)
+        solution.solve(t_eval=t, method='exact')
+
+        A = network.rate_matrix().toarray()
+        y0 = np.zeros(300)
+        y0[5] = protocol.dose_amount
+        expected = np.stack([scipy.linalg.expm(A * ti) @ y0 for ti in t], axis=1)
+        npt.assert_allclose(solution.solution.y, expected, rtol=1e-6, atol=1e-10)
+        # the drug is conserved but for what was eliminated
+        self.assertLess(solution.solution.y[:, -1].sum(), protocol.dose_amount)
+
+    def test_chooseMethod(self):
+        """
+        Checks that the spectrum estimate of a large sparse network finds it as stiff as
+        the dense eigenvalues do
+        """
+        from pkmodel.solution import IMPLICIT_METHODS, choose_method
+
+        rate_matrix = build_chain(600).rate_matrix()
+        dense = choose_method(rate_matrix, 500, dense_limit=1000)
+        sparse = choose_method(rate_matrix, 500, dense_limit=100)
+        self.assertIn(dense['method'], IMPLICIT_METHODS)
+        self.assertIn(sparse['method'], IMPLICIT_METHODS)
+        self.assertAlmostEqual(sparse['slowest_rate'] / dense['slowest_rate'], 1, places=6)
+        self.assertGreaterEqual(sparse['fastest_rate'], dense['fastest_rate'])
+        self.assertEqual(choose_method(rate_matrix, 1e-3, dense_limit=100)['method'], 'RK45')
+
+    def test_rateMatrix(self):
+        """
+        Checks the rate matrix of transfers between any compartments
+        """
+        from pkmodel.network import CompartmentNetwork
+
+        network = CompartmentNetwork()
+        network.add_compartment("plasma", volume=2)
+        network.add_compartment("liver")
+        network.add_compartment("gut")
+        network.add_exchange("plasma", "liver", q=4)
+        network.add_transfer("gut", "liver", rate=1.5)
+        network.add_transfer("liver", "gut", rate=0.5)
+        network.add_elimination("liver", clearance=0.2)
+        network.set_dosing_compartment("gut")
+
+        npt.assert_allclose(network.rate_matrix().toarray(), [
+            [-2.0, 4.0, 0.0],
+            [2.0, -4.7, 1.5],
+            [0.0, 0.5, -1.5]])
+        npt.assert_array_equal(network.input_vector(), [0, 0, 1])
+
+        copy = CompartmentNetwork.from_dict(network.to_dict())
+        npt.assert_allclose(copy.rate_matrix().toarray(), network.rate_matrix().toarray())
+        self.assertEqual(copy.dosing_compartment(), 2)
+
+    def test_steadyState(self):
+        """
+        Checks that periodic dosing works on a sparse network
+        """
+        from pkmodel.network import CompartmentNetwork
+        from pkmodel.steady_state import PeriodicDosing
+
+        model = build_model()
+        reference = PeriodicDosing(model, 0.5, dose_amount=2, infusion_duration=0.1)
+        periodic = PeriodicDosing(CompartmentNetwork.from_model(model), 0.5, dose_amount=2,
+                                  infusion_duration=0.1)
+        npt.assert_allclose(periodic.steady_state, reference.steady_state, rtol=1e-8)
+        npt.assert_allclose(periodic.cycle_auc(periodic.steady_state),
+                            reference.cycle_auc(reference.steady_state), rtol=1e-8)
+
+    def test_storeAndRestrictions(self):
+        """
+        Checks that a stored network solution rebuilds its network, and that features
+        needing a Model reject networks clearly
+        """
+        import asyncio
+        import os
+        import tempfile
+        from pkmodel.network import CompartmentNetwork
+        from pkmodel.protocol import Protocol
+        from pkmodel.service import SimulationService
+        from pkmodel.solution import Solution
+        from pkmodel.store import ResultStore
+
+        network = CompartmentNetwork.from_model(build_model())
+        solution = Solution(network, Protocol())
+        solution.solve(t_eval=np.linspace(0, 1, 11), method='exact')
+        with tempfile.TemporaryDirectory() as directory:
+            ResultStore.save(os.path.join(directory, "run"), solution)
+            rebuilt = ResultStore(os.path.join(directory, "run")).model()
+            self.assertIsInstance(rebuilt, CompartmentNetwork)
+            self.assertEqual(rebuilt.to_dict(), network.to_dict())
+
+        with self.assertRaises(TypeError):
+            solution.sensitivities(t_eval=np.linspace(0, 1, 11))
+
+        async def solve():
+            async with SimulationService() as service:
+                await service.solve(network)
+        loop = asyncio.new_event_loop()
+        try:
+            with self.assertRaises(TypeError):
+                loop.run_until_complete(solve())
+        finally:
+            loop.close()
+
+    def test_errors(self):
+        """
+        Checks that invalid networks are rejected
+        """
+        from pkmodel.network import CompartmentNetwork
+
+        network = CompartmentNetwork()
+        network.add_compartment("plasma")
+        with self.assertRaises(ValueError):
+            network.add_compartment("plasma")
+        with self.assertRaises(ValueError):
+            network.add_compartment(volume=0)
+        with self.assertRaises(KeyError):
+            network.add_transfer("plasma", "liver", rate=1)
+        with self.assertRaises(IndexError):
+            network.set_dosing_compartment(3)
+        with self.assertRaises(ValueError):
+            network.add_transfer("plasma", "plasma", rate=1)
+        with self.assertRaises(ValueError):
+            network.add_elimination("plasma")
+        with self.assertRaises(ValueError):
+            network.add_elimination("plasma", rate=-1)
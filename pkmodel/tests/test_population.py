@@ -0,0 +1,87 @@
+from unittest import TestCase
+import numpy as np
+import numpy.testing as npt
+from parameterized import parameterized
+
+
+class PopulationSolutionTest(TestCase):
+    """
+    Tests the :class:`PopulationSolution` class.
+    """
+    @parameterized.expand([
+        ('iv', False, 0),
+        ('iv_peripheral', False, 2),
+        ('sc_peripheral', True, 3)
+    ])
+    def test_matchesIndividualSolutions(self, name, subcutaneous, n_peripheral):
+        """
+        Checks that every patient of a population gets the same result as
+        solving their own model separately
+        """
+        from pkmodel.model import Model
+        from pkmodel.population import PopulationSolution
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        rng = np.random.default_rng(1)
+        models = []
+        for _ in range(7):
+            model = Model(clearance_rate=rng.uniform(0.5, 2), vol_c=rng.uniform(0.5, 2))
+            if subcutaneous:
+                model.add_subcutaneous_compartment(absorption_rate=rng.uniform(1, 5))
+            for _ in range(n_peripheral):
+                model.add_peripheral_compartment(vol_p=rng.uniform(0.5, 2), q_p=rng.uniform(0.5, 2))
+            models.append(model)
+        protocol = Protocol(dose_times=[0, 0.3])
+        protocol.make_continuous(0.5, 0.8)
+        t = np.linspace(0, 1, 51)
+
+        population = PopulationSolution.from_models(models, protocol)
+        y = population.solve(t_eval=t)
+
+        self.assertEqual(y.shape, (7, models[0].number_of_compartments, 51))
+        for i, model in enumerate(models):
+            solution = Solution(model, protocol)
+            solution.solve(t_eval=t, method='exact')
+            npt.assert_allclose(y[i], solution.solution.y, rtol=1e-10, atol=1e-12)
+
+    def test_parameterArrays(self):
+        """
+        Checks that parameters given as arrays build the expected layout
+        """
+        from pkmodel.population import PopulationSolution
+
+        population = PopulationSolution(
+            clearance_rate=np.ones(4), vol_c=np.full(4, 2.0), absorption_rate=np.full(4, 3.0),
+            vol_p=np.ones((4, 2)), q_p=np.ones((4, 2)))
+        self.assertEqual(population.number_of_compartments, 4)
+        self.assertEqual(population.rate_matrix().shape, (4, 4, 4))
+        self.assertEqual(population.solve(y0=np.ones((4, 4))).shape, (4, 4, 1000))
+
+        # 1-D peripheral parameters are shared by all patients
+        shared = PopulationSolution(clearance_rate=np.ones(2), vol_c=np.full(2, 2.0),
+                                    vol_p=[1.0, 2.0], q_p=[0.5, 0.7])
+        self.assertEqual(shared.number_of_peripheral_compartments, 2)
+        npt.assert_array_equal(shared.vol_p, [[1.0, 2.0], [1.0, 2.0]])
+        npt.assert_array_equal(shared.q_p, [[0.5, 0.7], [0.5, 0.7]])
+
+    def test_invalidInput(self):
+        """
+        Checks that mismatched topologies and non-positive parameters are rejected
+        """
+        from pkmodel.model import Model
+        from pkmodel.population import PopulationSolution
+
+        sc_model = Model()
+        sc_model.add_subcutaneous_compartment()
+        with self.assertRaises(ValueError):
+            PopulationSolution.from_models([Model(), sc_model])
+        with self.assertRaises(ValueError):
+            PopulationSolution(clearance_rate=[1.0, -1.0], vol_c=[1.0, 1.0])
+        with self.assertRaises(ValueError):
+            PopulationSolution(clearance_rate=[1.0, 1.0], vol_c=[1.0, 1.0, 1.0])
+        with self.assertRaises(ValueError):
+            PopulationSolution(clearance_rate=[1.0, 1.0], vol_c=[1.0, 1.0], vol_p=[1.0])
+        with self.assertRaises(ValueError):
+            PopulationSolution(clearance_rate=[1.0, 1.0], vol_c=[1.0, 1.0],
+                               vol_p=np.ones((3, 1)), q_p=np.ones((3, 1)))
@@ -13,3 +13,111 @@ class ProtocolTest(unittest.TestCase):
         protocol = pk.Protocol()
         self.assertEqual(protocol.dose_amount, 1)
 
+    def test_dict_round_trip(self):
+        """
+        Tests that a protocol rebuilt from to_dict doses identically.
+        """
+        protocol = pk.Protocol(dose_amount=3, dose_times=[2, 1])
+        protocol.make_continuous(0.5, 1.5)
+        rebuilt = pk.Protocol.from_dict(protocol.to_dict())
+        self.assertEqual(rebuilt.to_dict(), protocol.to_dict())
+        self.assertEqual(rebuilt.segments(0, 3), protocol.segments(0, 3))
+
+    def test_sampled_protocol(self):
+        """
+        Tests the zero-order hold dose rate and cumulative dose of a
+        SampledProtocol.
+        """
+        protocol = pk.SampledProtocol([1.0, 3.0, 2.0], dt=0.5, t_start=1.0)
+        rates = protocol.dose_rate([0.0, 1.0, 1.49, 1.5, 2.4, 2.5, 3.0])
+        self.assertEqual(list(rates), [0, 1, 1, 3, 2, 0, 0])
+        self.assertEqual(list(protocol.cumulative_dose([0.0, 1.25, 2.0, 5.0])),
+                         [0, 0.25, 2.0, 3.0])
+        self.assertEqual(len(protocol.segments(0, 2)), 4)
+        with self.assertRaises(ValueError):
+            pk.SampledProtocol([1.0, -1.0], dt=1)
+
+    def test_dose_at_time(self):
+        """
+        Tests dose(t) for instantaneous and continuous doses, for single
+        times and arrays of times.
+        """
+        protocol = pk.Protocol(dose_amount=2, dose_times=[0, 1])
+        protocol.make_continuous(0.5, 1.5)
+        self.assertEqual(protocol.dose_at_time(0), 2)
+        self.assertEqual(protocol.dose_at_time(0.2), 0)
+        self.assertEqual(list(protocol.dose_at_time([0.5, 1, 1.5])), [2, 4, 0])
+        self.assertEqual(list(protocol.dose_rate([0, 0.5, 1, 1.5])), [0, 2, 2, 0])
+
+        protocol.change_dose(3)
+        protocol.add_instantaneous(0.2)
+        self.assertEqual(protocol.dose_at_time(0.2), 3)
+        self.assertEqual(protocol.dose_times, [0, 0.2, 1])
+
+    def test_edit_in_place(self):
+        """
+        Tests that editing the lists of a protocol in place changes its doses.
+        """
+        import numpy as np
+
+        protocol = pk.Protocol(dose_amount=2, dose_times=[0, 1])
+        protocol.make_continuous(0.5, 1.5)
+        self.assertEqual(protocol.dose_at_time(2), 0)
+        self.assertEqual(protocol.dose_rate(1.7), 0)
+
+        protocol.dose_times.append(2)
+        protocol.continuous_period[1] = 2
+        self.assertEqual(protocol.dose_at_time(2), 2)
+        self.assertEqual(protocol.dose_rate(1.7), 2)
+        self.assertEqual(len(protocol.segments(0, 3)), 5)
+
+        solution = pk.Solution(pk.Model(), protocol)
+        solution.solve(t_eval=np.linspace(0, 3, 31), method='exact')
+        protocol.dose_times.append(2.5)
+        solution.solve(t_eval=np.linspace(0, 3, 31), method='exact')
+        expected = pk.Solution(pk.Model(), pk.Protocol.from_dict(protocol.to_dict()))
+        expected.solve(t_eval=np.linspace(0, 3, 31), method='exact')
+        np.testing.assert_array_equal(solution.solution.y, expected.solution.y)
+
+    def test_lookup_time(self):
+        """
+        Tests that looking up a dose does not take longer with more doses,
+        and that copies of a protocol track edits of their own lists.
+        """
+        import copy
+        import pickle
+        import timeit
+        import numpy as np
+
+        def lookup_time(n_doses):
+            protocol = pk.Protocol(dose_times=list(np.linspace(0, 100, n_doses)))
+            protocol.make_continuous(10, 20)
+            protocol.compile()
+            return min(timeit.repeat(lambda: protocol.dose_at_time(50.0),
+                                     number=200, repeat=5))
+
+        self.assertLess(lookup_time(50000), 3 * lookup_time(10))
+
+        protocol = pk.Protocol(dose_times=[0, 1])
+        for other in (copy.deepcopy(protocol), pickle.loads(pickle.dumps(protocol))):
+            self.assertEqual(other.dose_at_time(2), 0)
+            other.dose_times.append(2)
+            self.assertEqual(other.dose_at_time(2), 1)
+        self.assertEqual(protocol.dose_at_time(2), 0)
+
+    def test_dose_schedule(self):
+        """
+        Tests per-dose amounts, overlapping infusions and segments of a
+        DoseSchedule.
+        """
+        schedule = pk.DoseSchedule(
+            bolus_times=[2, 1, 1], bolus_amounts=[5, 1, 2],
+            infusion_starts=[0, 0.5], infusion_ends=[1, 3], infusion_rates=[1, 10])
+        self.assertEqual(list(schedule.bolus([0, 1, 2, 3])), [0, 3, 5, 0])
+        self.assertEqual(list(schedule.rate([-1, 0, 0.5, 1, 3])), [0, 1, 11, 10, 0])
+        self.assertEqual(schedule.segments(0.25, 2), [
+            (0.25, 0.5, 0, 1), (0.5, 1, 0, 11), (1, 2, 3, 10), (2, 2, 5, 10)])
+        with self.assertRaises(ValueError):
+            schedule.bolus_times[0] = 0
+        with self.assertRaises(ValueError):
+            pk.DoseSchedule(infusion_starts=[1], infusion_ends=[0])
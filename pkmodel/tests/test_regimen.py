@@ -0,0 +1,131 @@
+from unittest import TestCase, mock
+import numpy as np
+import numpy.testing as npt
+from parameterized import parameterized
+
+
+def build_model():
+    from pkmodel.model import Model
+
+    model = Model(clearance_rate=0.5, vol_c=3.0)
+    model.add_peripheral_compartment(vol_p=2.0, q_p=0.4)
+    model.add_subcutaneous_compartment(absorption_rate=1.2)
+    return model
+
+
+class RegimenOptimiserTest(TestCase):
+    """
+    Tests the :class:`RegimenOptimiser` class.
+    """
+    @parameterized.expand([(0,), (1.5,)])
+    def test_matchesSolve(self, infusion_duration):
+        """
+        Checks the superposed unit responses against solves of the regimen's schedule
+        """
+        from pkmodel.regimen import RegimenOptimiser
+        from pkmodel.solution import Solution
+
+        model = build_model()
+        t = np.linspace(0, 48, 481)
+        optimiser = RegimenOptimiser(model, (0.5, 2.0), t)
+        curves = optimiser.unit_concentrations([3.0, 5.5, 8.0], infusion_duration)
+        for interval, curve in zip([3.0, 5.5, 8.0], curves):
+            solution = Solution(model, optimiser.schedule(2.5, interval, infusion_duration))
+            solution.solve(t_eval=t, method='exact')
+            npt.assert_allclose(2.5 * curve, solution.solution.y[0] / 3.0, rtol=1e-9, atol=1e-12)
+
+    @parameterized.expand([
+        ('late start', np.linspace(5, 53, 481), [3.0, 4.05, 8.0]),
+        ('uneven', np.sort(np.random.default_rng(1).uniform(0, 48, 300)), [3.0, 8.0]),
+    ])
+    def test_gridsAndIntervals(self, name, t, intervals):
+        """
+        Checks the strided and the blocked sums of unit responses against solves
+        """
+        from pkmodel.regimen import RegimenOptimiser
+        from pkmodel.solution import Solution
+        import pkmodel.regimen
+
+        model = build_model()
+        optimiser = RegimenOptimiser(model, (0.5, 2.0), t)
+        for duration in (0, 1.5):
+            curves = optimiser.unit_concentrations(intervals, duration)
+            # blocks of a few doses give the same sums
+            with mock.patch.object(pkmodel.regimen, '_BLOCK', 3 * len(t)):
+                npt.assert_allclose(optimiser.unit_concentrations(intervals, duration),
+                                    curves, rtol=1e-12)
+            for interval, curve in zip(intervals, curves):
+                # doses are given from time 0, before t_eval starts
+                solution = Solution(model, optimiser.schedule(1.0, interval, duration))
+                solution.solve(t_eval=np.append(0, t), method='exact')
+                npt.assert_allclose(curve, solution.solution.y[0, 1:] / 3.0, rtol=1e-9,
+                                    atol=1e-12)
+
+    def test_search(self):
+        """
+        Checks that the search respects the constraints and ranks the candidates
+        """
+        from pkmodel.regimen import RegimenOptimiser
+
+        t = np.linspace(0, 72, 721)
+        optimiser = RegimenOptimiser(build_model(), (0.5, 2.0), t, max_single_dose=8,
+                                     max_daily_dose=30)
+        result = optimiser.search(np.linspace(0.5, 10, 20), np.arange(2, 25, 2.0),
+                                  infusion_durations=[0, 1, 4])
+
+        self.assertTrue(np.all(result["amount"] <= 8))
+        self.assertTrue(np.all(result["daily_dose"] <= 30))
+        self.assertTrue(np.all(result["infusion_duration"] <= result["interval"]))
+        self.assertTrue(np.all(np.diff(result["time_in_window"]) <= 0))
+        self.assertEqual(len(result["amount"]), len(result["time_in_window"]))
+        self.assertGreater(result["time_in_window"][0], 0.9)
+        npt.assert_allclose(optimiser.daily_dose(3, 5), 15)
+        npt.assert_allclose(optimiser.daily_dose(3, 100), 3)
+
+        # the best candidate's schedule scores the same when solved directly
+        best = result["best"]
+        curve = optimiser.unit_concentrations([result["interval"][0]],
+                                              result["infusion_duration"][0])[0]
+        npt.assert_allclose(optimiser.time_in_window(result["amount"][0] * curve),
+                            result["time_in_window"][0])
+        self.assertAlmostEqual(best.total_dose(0, 24), result["daily_dose"][0])
+
+    def test_errors(self):
+        """
+        Checks that invalid windows and unsatisfiable searches are rejected
+        """
+        from pkmodel.regimen import RegimenOptimiser
+
+        t = np.linspace(0, 24, 101)
+        with self.assertRaises(ValueError):
+            RegimenOptimiser(build_model(), (2, 1), t)
+        optimiser = RegimenOptimiser(build_model(), (0.5, 2.0), t, max_single_dose=1)
+        with self.assertRaises(ValueError):
+            optimiser.search([2, 3], [6])
+        with self.assertRaises(ValueError):
+            optimiser.search([1], [0])
+
+    @parameterized.expand([(0,), (1.5,)])
+    def test_network(self, infusion_duration):
+        """
+        Checks that a sparse network needs the volume and is evaluated on the grid of t_eval
+        """
+        from pkmodel.network import CompartmentNetwork
+        from pkmodel.regimen import RegimenOptimiser
+
+        model = build_model()
+        network = CompartmentNetwork.from_model(model)
+        t = np.linspace(0, 48, 481)
+        with self.assertRaises(ValueError):
+            RegimenOptimiser(network, (0.5, 2.0), t)
+        sparse = RegimenOptimiser(network, (0.5, 2.0), t, volume=3.0)
+        dense = RegimenOptimiser(model, (0.5, 2.0), t)
+
+        # exact for intervals on the grid, interpolated between its points otherwise
+        intervals = [3.0, 8.0]
+        npt.assert_allclose(sparse.unit_concentrations(intervals, infusion_duration),
+                            dense.unit_concentrations(intervals, infusion_duration),
+                            rtol=1e-7, atol=1e-12)
+        npt.assert_allclose(sparse.unit_concentrations([5.55], infusion_duration),
+                            dense.unit_concentrations([5.55], infusion_duration),
+                            rtol=0, atol=1e-3)
@@ -0,0 +1,62 @@
+from unittest import TestCase
+import numpy as np
+import numpy.testing as npt
+from parameterized import parameterized
+
+
+def build_model(p):
+    from pkmodel.model import Model
+
+    model = Model(clearance_rate=p[0], vol_c=p[1])
+    model.add_peripheral_compartment(vol_p=p[2], q_p=p[3])
+    model.add_subcutaneous_compartment(absorption_rate=p[4])
+    return model
+
+
+class SensitivityTest(TestCase):
+    """
+    Tests forward sensitivities, :class:`SensitivityPropagator` and
+    :meth:`Solution.sensitivities`.
+    """
+    @parameterized.expand([('exact', 1e-7), ('LSODA', 1e-2), ('Radau', 1e-2)])
+    def test_matchesFiniteDifferences(self, method, tolerance):
+        """
+        Checks the sensitivities against central finite differences of exact solves,
+        across instantaneous and continuous doses
+        """
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        p = np.array([1.2, 2.0, 1.5, 0.7, 1.0])
+        protocol = Protocol(dose_times=[0, 0.7, 1.3])
+        protocol.make_continuous(0.2, 0.9)
+        t = np.linspace(0, 3, 301)
+
+        solution = Solution(build_model(p), protocol)
+        sensitivities = solution.sensitivities(t_eval=t, method=method)
+        self.assertEqual(sensitivities.shape, (5, 3, 301))
+
+        reference = Solution(build_model(p), protocol)
+        reference.solve(t_eval=t, method='exact')
+        npt.assert_allclose(solution.solution.y, reference.solution.y, atol=tolerance)
+
+        for k in range(len(p)):
+            step = np.zeros(len(p))
+            step[k] = 1e-6
+            up = Solution(build_model(p + step), protocol)
+            up.solve(t_eval=t, method='exact')
+            down = Solution(build_model(p - step), protocol)
+            down.solve(t_eval=t, method='exact')
+            npt.assert_allclose(sensitivities[k], (up.solution.y - down.solution.y) / 2e-6,
+                                atol=tolerance)
+
+    def test_exponentialsAreShared(self):
+        """
+        Checks that evenly spaced time points reuse the same matrix exponentials
+        """
+        from pkmodel.sensitivity import SensitivityPropagator
+
+        propagator = SensitivityPropagator(build_model([1, 1, 1, 1, 1]))
+        z = propagator.step(propagator.initial_state([1, 0, 0]), 0, np.linspace(0, 10, 1001))
+        self.assertEqual(z.shape, (18, 1001))
+        self.assertLessEqual(len(propagator._exponentials), 3)
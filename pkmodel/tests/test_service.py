@@ -0,0 +1,157 @@
+from unittest import TestCase
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+import numpy as np
+import numpy.testing as npt
+
+
+def run(coroutine):
+    """
+    Runs a coroutine on a new event loop (asyncio.run is Python 3.7+).
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def make_models(n):
+    """
+    n models alternating between an IV and an SC layout.
+    """
+    from pkmodel.model import Model
+
+    models = []
+    for i in range(n):
+        model = Model(clearance_rate=1 + 0.1 * i, vol_c=2)
+        if i % 2:
+            model.add_subcutaneous_compartment(absorption_rate=2)
+        models.append(model)
+    return models
+
+
+class SimulationServiceTest(TestCase):
+    """
+    Tests the :class:`SimulationService` and :class:`ServiceClient` classes.
+    """
+    def test_batchesAndGroups(self):
+        """
+        Checks that concurrent requests are gathered into one batch, solved in one group
+        per layout, and that every caller gets its own exact solution
+        """
+        from pkmodel.protocol import Protocol
+        from pkmodel.service import SimulationService
+        from pkmodel.solution import Solution
+
+        models = make_models(20)
+        protocol = Protocol(dose_times=[0, 0.5])
+        t = np.linspace(0, 1, 11)
+
+        async def main():
+            async with SimulationService(max_latency=0.05) as service:
+                ys = await asyncio.gather(*[service.solve(model, protocol, t) for model in models])
+                return ys, service.batches, service.groups
+
+        ys, batches, groups = run(main())
+        self.assertEqual((batches, groups), (1, 2))
+        for model, y in zip(models, ys):
+            solution = Solution(model, protocol)
+            solution.solve(t_eval=t, method='exact')
+            npt.assert_allclose(y, solution.solution.y, rtol=1e-12)
+
+    def test_batchSizeCap(self):
+        """
+        Checks that no batch holds more than max_batch_size requests
+        """
+        from pkmodel.service import SimulationService
+
+        async def main():
+            async with SimulationService(max_batch_size=4, max_latency=0.05) as service:
+                await asyncio.gather(*[service.solve(model) for model in make_models(10)])
+                return service.batches
+
+        self.assertGreaterEqual(run(main()), 3)
+
+    def test_getWithTimeout(self):
+        """
+        Checks that waiting for requests with short timeouts never loses one
+        """
+        from pkmodel.service import SimulationService
+
+        async def main():
+            service = SimulationService()
+            service._queue = asyncio.Queue()
+            self.assertIsNone(await service._get(0.001))
+            got = []
+
+            async def producer():
+                for i in range(200):
+                    await service._queue.put(i)
+                    await asyncio.sleep(0)
+
+            task = asyncio.ensure_future(producer())
+            while len(got) < 200:
+                request = await service._get(1e-5)
+                if request is not None:
+                    got.append(request)
+            await task
+            return got
+
+        self.assertEqual(run(main()), list(range(200)))
+
+        async def many():
+            async with SimulationService(max_batch_size=7, max_latency=1e-6) as service:
+                ys = await asyncio.gather(*[service.solve(model) for model in make_models(100)])
+            return len(ys)
+
+        self.assertEqual(run(many()), 100)
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "needs Unix sockets")
+    def test_unixSocketServer(self):
+        """
+        Checks solves and errors through the JSON-lines server and client
+        """
+        from pkmodel.model import Model
+        from pkmodel.protocol import SampledProtocol
+        from pkmodel.service import ServiceClient, SimulationService
+        from pkmodel.solution import Solution
+
+        model = make_models(2)[1]
+        protocol = SampledProtocol([1, 2, 3], dt=0.1)
+        t = np.linspace(0, 1, 11)
+        path = os.path.join(tempfile.mkdtemp(), 'pkmodel.sock')
+
+        async def main():
+            async with SimulationService() as service:
+                server = await service.serve(path=path)
+                try:
+                    async with ServiceClient(path=path) as client:
+                        y = await client.solve(model, protocol, t, y0=[0, 1])
+                        with self.assertRaises(RuntimeError):
+                            await client.solve(Model(), protocol, t, y0=[1, 2])
+                finally:
+                    server.close()
+                    await server.wait_closed()
+            return y
+
+        y = run(main())
+        solution = Solution(model, protocol)
+        solution.solve(y0=np.array([0.0, 1.0]), t_eval=t, method='exact')
+        npt.assert_allclose(y, solution.solution.y, rtol=1e-12)
+
+    def test_protocolFromDict(self):
+        """
+        Checks that every protocol class is rebuilt from its to_dict
+        """
+        from pkmodel.protocol import DoseSchedule, Protocol, SampledProtocol
+        from pkmodel.service import protocol_from_dict
+
+        for protocol in [Protocol(dose_times=[0, 1]), DoseSchedule(bolus_times=[0, 1]),
+                         SampledProtocol([1, 2], dt=0.5)]:
+            rebuilt = protocol_from_dict(protocol.to_dict())
+            self.assertIs(type(rebuilt), type(protocol))
+            self.assertEqual(rebuilt.to_dict(), protocol.to_dict())
@@ -69,7 +69,9 @@ class SolutionTest(TestCase):
         from pkmodel.solution import Solution
         from pkmodel.model import Model
 
-        solution = Solution(model=MagicMock(spec=Model))
+        model = MagicMock(spec=Model)
+        model.dosing_compartment.return_value = 0
+        solution = Solution(model=model)
         solution.system_of_equations = MagicMock(return_value=1)
 
         if err:
@@ -105,7 +107,7 @@ class SolutionTest(TestCase):
         from pkmodel.solution import Solution
         from pkmodel.protocol import Protocol
 
-        protocol = Protocol()
+        protocol = Protocol(instantaneous=False)
         protocol.make_continuous(0, 4)
         model = Model(clearance_rate=CL, vol_c=V_c)
         model.add_peripheral_compartment(vol_p=V_p1, q_p=Q_p1)
@@ -153,3 +155,364 @@ class SolutionTest(TestCase):
 
         npt.assert_array_equal(solution.solution.y[1], solution.solution.y[2])
         npt.assert_array_equal(solution.solution.y[2], solution.solution.y[3])
+
+    @parameterized.expand([
+        ('model1', 1.0, 1.0, 1.0, 1.0,
+         np.array([0., 0.2, 0.33, 0.42, 0.49]),
+         np.array([0., 0.02, 0.08, 0.14, 0.21])),
+        ('model2', 2.0, 1.0, 1.0, 1.0,
+         np.array([0., 0.18, 0.29, 0.37, 0.44]),
+         np.array([0., 0.04, 0.12, 0.21, 0.29]))
+    ])
+    def test_exactPrototypeResults(self, name, Q_p1, V_c, V_p1, CL, result_c, result_p):
+        """
+        Checks that the exact solver reproduces the prototype results for a continuous dose
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        protocol = Protocol(instantaneous=False)
+        protocol.make_continuous(0, 4)
+        model = Model(clearance_rate=CL, vol_c=V_c)
+        model.add_peripheral_compartment(vol_p=V_p1, q_p=Q_p1)
+
+        solution = Solution(model, protocol)
+        solution.solve(y0=np.array([0.0, 0.0]), t_eval=np.linspace(0, 1, 5), method='exact')
+
+        npt.assert_almost_equal(solution.solution.y[0], result_c, decimal=2)
+        npt.assert_almost_equal(solution.solution.y[1], result_p, decimal=2)
+
+    def test_exactAnalyticOneCompartment(self):
+        """
+        Compares the exact solver with the closed form solution of a single compartment
+        receiving an instantaneous dose followed by a continuous dose
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        CL, V_c, X = 2.0, 3.0, 5.0
+        k = CL / V_c
+        protocol = Protocol(dose_amount=X)
+        protocol.make_continuous(1, 2)
+        solution = Solution(Model(clearance_rate=CL, vol_c=V_c), protocol)
+        t = np.linspace(0, 3, 31)
+        solution.solve(t_eval=t, method='exact')
+
+        expected = X * np.exp(-k * t)
+        during = (t >= 1) & (t < 2)
+        expected[during] += X / k * (1 - np.exp(-k * (t[during] - 1)))
+        after = t >= 2
+        expected[after] += X / k * (1 - np.exp(-k)) * np.exp(-k * (t[after] - 2))
+
+        npt.assert_allclose(solution.solution.y[0], expected, rtol=1e-10)
+
+    def test_exactMatchesIntegrator(self):
+        """
+        Checks that the exact solver agrees with solve_ivp for a subcutaneous model
+        with several peripheral compartments
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        model = Model(clearance_rate=1.5, vol_c=2.0)
+        model.add_subcutaneous_compartment(absorption_rate=3.0)
+        model.add_peripheral_compartment(vol_p=2.0, q_p=3.0)
+        model.add_peripheral_compartment(vol_p=0.5, q_p=0.2)
+        protocol = Protocol(instantaneous=False)
+        protocol.make_continuous(0, 4)
+        t = np.linspace(0, 1, 101)
+
+        exact = Solution(model, protocol)
+        exact.solve(t_eval=t, method='exact')
+        numerical = Solution(model, protocol)
+        numerical.solve(t_eval=t)
+
+        npt.assert_allclose(exact.solution.y, numerical.solution.y, atol=1e-3)
+
+    @parameterized.expand([('BDF',), ('Radau',), ('LSODA',)])
+    def test_implicitMethodsUseJacobian(self, method):
+        """
+        Checks that implicit methods are given the exact Jacobian; BDF and Radau get it
+        as a constant matrix, so they never need to evaluate it
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        model = Model()
+        model.add_subcutaneous_compartment(absorption_rate=50)
+        model.add_peripheral_compartment(vol_p=10, q_p=0.1)
+        protocol = Protocol(instantaneous=False)
+        protocol.make_continuous(0, 4)
+        t = np.linspace(0, 1, 11)
+
+        solution = Solution(model, protocol)
+        solution.solve(t_eval=t, method=method)
+        exact = Solution(model, protocol)
+        exact.solve(t_eval=t, method='exact')
+
+        if method != 'LSODA':
+            self.assertEqual(solution.solution.njev, 0)
+        npt.assert_allclose(solution.jacobian(0, None), model.rate_matrix())
+        npt.assert_allclose(solution.solution.y, exact.solution.y, atol=1e-3)
+
+    @parameterized.expand([('RK45',), ('BDF',)])
+    def test_instantaneousDosesAreJumps(self, method):
+        """
+        Checks that instantaneous doses, which rarely coincide with a solver step,
+        are applied as jumps in the dosing compartment at their dose times
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        CL, V_c, X = 2.0, 1.0, 3.0
+        dose_times = [0.1 * k + 0.013 for k in range(10)]
+        protocol = Protocol(dose_amount=X, dose_times=dose_times)
+        solution = Solution(Model(clearance_rate=CL, vol_c=V_c), protocol)
+        t = np.linspace(0, 1, 101)
+        solution.solve(t_eval=t, method=method)
+
+        expected = np.zeros_like(t)
+        for dose_time in dose_times:
+            expected += np.where(t >= dose_time, X * np.exp(-CL / V_c * (t - dose_time)), 0)
+        npt.assert_allclose(solution.solution.y[0], expected, rtol=1e-2)
+
+    def test_continuousEdgesAreSegmentBoundaries(self):
+        """
+        Checks that a continuous dose switched off during the simulation is integrated
+        as accurately as a smooth problem
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        model = Model(clearance_rate=1.5, vol_c=2.0)
+        model.add_subcutaneous_compartment(absorption_rate=3.0)
+        model.add_peripheral_compartment(vol_p=2.0, q_p=3.0)
+        protocol = Protocol(instantaneous=False)
+        protocol.make_continuous(0.2, 0.5)
+        t = np.linspace(0, 1, 101)
+
+        numerical = Solution(model, protocol)
+        numerical.solve(t_eval=t)
+        exact = Solution(model, protocol)
+        exact.solve(t_eval=t, method='exact')
+
+        self.assertTrue(numerical.solution.success)
+        npt.assert_allclose(numerical.solution.y, exact.solution.y, atol=1e-3)
+
+    def test_superpositionMatchesExact(self):
+        """
+        Checks that summing shifted unit responses gives the exact solution, and that
+        changing the dose or adding dose times only adds the new unit responses
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        model = Model(clearance_rate=1.5, vol_c=2.0)
+        model.add_subcutaneous_compartment(absorption_rate=3.0)
+        model.add_peripheral_compartment(vol_p=2.0, q_p=3.0)
+        protocol = Protocol(dose_amount=2.0, dose_times=[0, 0.25])
+        protocol.make_continuous(0.4, 0.7)
+        y0 = np.array([1.0, 0.5, 0.0])
+        t = np.linspace(0, 1, 41)
+
+        solution = Solution(model, protocol)
+        exact = Solution(model, protocol)
+        for change in (lambda: None,
+                       lambda: protocol.change_dose(5.0),
+                       lambda: protocol.add_instantaneous(0.6)):
+            change()
+            solution.solve(y0=y0, t_eval=t, method='superposition')
+            exact.solve(y0=y0, t_eval=t, method='exact')
+            npt.assert_allclose(solution.solution.y, exact.solution.y, rtol=1e-10, atol=1e-12)
+
+        # the doses lie on t_eval, so they all shift the same two responses
+        self.assertEqual(sorted(solution._unit_bases), ['bolus', 'continuous'])
+        self.assertEqual(len(solution._unit_responses), 0)
+
+        # responses to doses off the grid are kept up to a bound
+        from pkmodel import solution as module
+        protocol.dose_times = list(np.linspace(0.01, 0.99, module.MAX_UNIT_RESPONSES + 10))
+        solution.solve(y0=y0, t_eval=t, method='superposition')
+        exact.solve(y0=y0, t_eval=t, method='exact')
+        npt.assert_allclose(solution.solution.y, exact.solution.y, rtol=1e-10, atol=1e-12)
+        self.assertEqual(len(solution._unit_responses), module.MAX_UNIT_RESPONSES)
+
+        model.add_peripheral_compartment()
+        solution.solve(t_eval=t, method='superposition')
+        self.assertEqual(solution.solution.y.shape, (4, 41))
+
+    @parameterized.expand([
+        ('aligned', 0.0, np.array([0.0, 0.0, 0.0])),
+        ('offset_start', 0.3, np.array([1.0, 0.5, 2.0]))
+    ])
+    def test_fftMatchesExact(self, name, t_start, y0):
+        """
+        Checks that convolving a sampled dose rate with the impulse response gives the
+        exact solution at the sampling times
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import SampledProtocol
+
+        model = Model(clearance_rate=1.5, vol_c=2.0)
+        model.add_peripheral_compartment(vol_p=2.0, q_p=3.0)
+        model.add_subcutaneous_compartment(absorption_rate=3.0)
+        rates = np.random.default_rng(0).random(200)
+        protocol = SampledProtocol(rates, dt=0.005, t_start=t_start)
+        t = t_start + 0.005 * np.arange(241)
+
+        fft = Solution(model, protocol)
+        fft.solve(y0=y0, t_eval=t, method='fft')
+        exact = Solution(model, protocol)
+        exact.solve(y0=y0, t_eval=t, method='exact')
+
+        npt.assert_allclose(fft.solution.y, exact.solution.y, rtol=1e-9, atol=1e-12)
+
+    def test_fftNeedsSampledProtocol(self):
+        """
+        Checks that the fft and superposition methods refuse protocols they cannot handle
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol, SampledProtocol
+
+        with self.assertRaises(ValueError):
+            Solution(Model(), Protocol()).solve(method='fft')
+        with self.assertRaises(ValueError):
+            Solution(Model(), SampledProtocol([1.0], dt=1)).solve(method='superposition')
+
+    def test_doseSchedule(self):
+        """
+        Checks that a DoseSchedule with individual dose amounts and infusions can be
+        solved like a Protocol, and that the exact and superposition methods agree
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import DoseSchedule
+
+        model = Model(clearance_rate=1.5, vol_c=2.0)
+        model.add_peripheral_compartment(vol_p=2.0, q_p=3.0)
+        rng = np.random.default_rng(0)
+        schedule = DoseSchedule(
+            bolus_times=rng.uniform(0, 10, 5000), bolus_amounts=rng.uniform(0, 1, 5000),
+            infusion_starts=[1, 2], infusion_ends=[4, 3], infusion_rates=[10, 5])
+        t = np.linspace(0, 10, 101)
+
+        exact = Solution(model, schedule)
+        exact.solve(t_eval=t, method='exact')
+        superposition = Solution(model, schedule)
+        superposition.solve(t_eval=t, method='superposition')
+        npt.assert_allclose(superposition.solution.y, exact.solution.y, rtol=1e-9)
+
+    @parameterized.expand([('exact', 1e-10), ('RK45', 1e-3)])
+    def test_iterSolveMatchesSolve(self, method, tolerance):
+        """
+        Checks that solving chunk by chunk gives the same result as a single solve,
+        including for doses given exactly at the start of a chunk
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        model = Model(clearance_rate=1.5, vol_c=2.0)
+        model.add_subcutaneous_compartment(absorption_rate=3.0)
+        model.add_peripheral_compartment(vol_p=2.0, q_p=3.0)
+        protocol = Protocol(dose_times=[0, 0.3, 0.35, 0.9])
+        protocol.make_continuous(0.45, 0.6)
+        t = np.arange(101) / 100
+
+        solution = Solution(model, protocol)
+        blocks = list(solution.iter_solve(t_eval=t, chunk=15, method=method))
+        solution.solve(t_eval=t, method='exact')
+
+        self.assertEqual([len(block_t) for block_t, _ in blocks], [15] * 6 + [11])
+        npt.assert_array_equal(np.concatenate([block_t for block_t, _ in blocks]), t)
+        npt.assert_allclose(np.concatenate([y for _, y in blocks], axis=1), solution.solution.y,
+                            atol=tolerance)
+
+    @parameterized.expand([('fast', 1, 'RK45'), ('stiff', 1000, 'BDF')])
+    def test_autoMethod(self, name, absorption_rate, expected):
+        """
+        Checks that method='auto' picks an implicit solver for fast absorption into a
+        model with a slow, deep peripheral compartment, records why, and stays accurate
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        model = Model(clearance_rate=1, vol_c=10)
+        model.add_subcutaneous_compartment(absorption_rate=absorption_rate)
+        model.add_peripheral_compartment(vol_p=1000, q_p=0.05)
+        protocol = Protocol(dose_amount=100, dose_times=[0, 12])
+        t = np.linspace(0, 24, 241)
+
+        solution = Solution(model, protocol)
+        solution.solve(t_eval=t, method='auto')
+        self.assertEqual(solution.method_info['method'], expected)
+        self.assertTrue(solution.method_info['reason'].startswith('stiff' if expected == 'BDF' else 'not'))
+        self.assertAlmostEqual(solution.method_info['atol'], 1e-9 * 200)
+        exact = Solution(model, protocol)
+        exact.solve(t_eval=t, method='exact')
+        npt.assert_allclose(solution.solution.y, exact.solution.y, atol=1e-3)
+
+    def test_chooseMethodOscillating(self):
+        """
+        Checks that stiff systems with oscillating modes get Radau
+        """
+        from pkmodel.solution import choose_method
+
+        rate_matrix = np.array([[-1000, 0, 0], [0, -1, 10], [0, -10, -1]])
+        self.assertEqual(choose_method(rate_matrix, 10)['method'], 'Radau')
+        self.assertEqual(choose_method(rate_matrix, 0.1)['method'], 'RK45')
+
+    @parameterized.expand([('exact',), ('RK45',), ('BDF',)])
+    def test_incrementalResolve(self, method):
+        """
+        Checks that a solve after a protocol edit resumes from the first changed segment
+        and matches a full solve, and that a model edit invalidates everything
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.protocol import Protocol
+
+        model = Model(clearance_rate=1.5, vol_c=2.0)
+        model.add_subcutaneous_compartment(absorption_rate=3.0)
+        protocol = Protocol(dose_times=[0, 2, 4])
+        protocol.make_continuous(1, 1.5)
+        t = np.linspace(0, 8, 161)
+
+        solution = Solution(model, protocol)
+        solution.solve(t_eval=t, method=method, resume=True)
+        self.assertIsNone(solution.solution.resumed_from)
+        before = solution.solution.y.copy()
+
+        protocol.add_instantaneous(5.01)
+        solution.solve(t_eval=t, method=method, resume=True)
+        self.assertEqual(solution.solution.resumed_from, 4)
+        self.assertEqual(solution.stats.resumed_from, 4)
+        npt.assert_array_equal(solution.solution.y[:, t < 4], before[:, t < 4])
+        full = Solution(model, protocol)
+        full.solve(t_eval=t, method=method)
+        npt.assert_array_equal(solution.solution.y, full.solution.y)
+
+        solution.solve(t_eval=t, method=method, resume=True)
+        self.assertEqual(solution.solution.resumed_from, 8)
+        npt.assert_array_equal(solution.solution.y, full.solution.y)
+
+        # without resume every solve starts from scratch
+        solution.solve(t_eval=t, method=method)
+        self.assertIsNone(solution.solution.resumed_from)
+        npt.assert_array_equal(solution.solution.y, full.solution.y)
+        self.assertEqual(solution.stats.nfev > 0, method != 'exact')
+
+        model.add_peripheral_compartment()
+        solution.solve(t_eval=t, method=method, resume=True)
+        self.assertIsNone(solution.solution.resumed_from)
+        self.assertEqual(solution.solution.y.shape, (3, 161))
@@ -0,0 +1,83 @@
+from unittest import TestCase
+import numpy as np
+from parameterized import parameterized
+
+
+class SolveStatsTest(TestCase):
+    """
+    Tests the :class:`SolveStats` records of :meth:`Solution.solve`, hooks and
+    :func:`collect_stats`.
+    """
+    @parameterized.expand([('RK45', 6), ('RK23', 3)])
+    def test_rungeKuttaStepCounts(self, method, stages):
+        """
+        Checks that accepted and rejected steps account for every right-hand side
+        evaluation of an explicit Runge-Kutta solve, which rejects steps on this stiff model
+        """
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+
+        model = Model(clearance_rate=1, vol_c=10)
+        model.add_subcutaneous_compartment(absorption_rate=200)
+        protocol = Protocol(dose_times=[0, 1])
+        solution = Solution(model, protocol)
+        solution.solve(t_eval=np.linspace(0, 2, 11), method=method)
+
+        stats = solution.stats
+        self.assertEqual(stats.method, method)
+        self.assertEqual((stats.n_compartments, stats.n_times), (2, 11))
+        self.assertGreater(stats.n_rejected, 0)
+        # two integrated segments, each started with two evaluations
+        self.assertEqual(stats.nfev, 2 * 2 + stages * (stats.n_steps + stats.n_rejected))
+        self.assertGreater(stats.integrate_time, 0)
+        self.assertAlmostEqual(stats.total_time, stats.compile_time + stats.integrate_time
+                               + stats.postprocess_time)
+
+    def test_implicitAndExactCounts(self):
+        """
+        Checks which counts are recorded for implicit and exact solves
+        """
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+
+        solution = Solution(Model())
+        solution.solve(method='BDF')
+        self.assertGreater(solution.stats.n_steps, 0)
+        self.assertGreater(solution.stats.nlu, 0)
+        self.assertIsNone(solution.stats.n_rejected)
+
+        solution.solve(method='exact')
+        self.assertEqual(solution.stats.nfev, 0)
+        self.assertIsNone(solution.stats.n_steps)
+        self.assertEqual(solution.stats.to_dict()['method'], 'exact')
+
+    def test_hooksAndCollector(self):
+        """
+        Checks that hooks see every solve, including cache hits, until they are removed
+        """
+        from pkmodel.cache import SolutionCache
+        from pkmodel.model import Model
+        from pkmodel.solution import Solution
+        from pkmodel.stats import add_hook, collect_stats, remove_hook
+
+        seen = []
+        add_hook(seen.append)
+        cache = SolutionCache()
+        try:
+            with collect_stats() as collector:
+                solution = Solution(Model())
+                solution.solve(method='exact', cache=cache)
+                solution.solve(method='exact', cache=cache)
+                solution.solve(method='auto')
+        finally:
+            remove_hook(seen.append)
+        Solution(Model()).solve(method='exact')
+
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(collector.records, seen)
+        summary = collector.summary()
+        self.assertEqual(summary['n_solves'], 3)
+        self.assertEqual(summary['cache_hits'], 1)
+        self.assertEqual(summary['by_method'], {'exact': 2, 'RK45': 1})
+        self.assertEqual(summary['nfev'], seen[2].nfev)
@@ -0,0 +1,77 @@
+from unittest import TestCase
+import numpy as np
+import numpy.testing as npt
+from parameterized import parameterized
+
+
+class PeriodicDosingTest(TestCase):
+    """
+    Tests the :class:`PeriodicDosing` class.
+    """
+    def _model(self):
+        from pkmodel.model import Model
+
+        model = Model(clearance_rate=1.5, vol_c=2.0)
+        model.add_peripheral_compartment(vol_p=4.0, q_p=0.5)
+        model.add_subcutaneous_compartment(absorption_rate=3.0)
+        return model
+
+    @parameterized.expand([('bolus', 0), ('infusion', 0.5)])
+    def test_cycleMatchesSolve(self, name, infusion_duration):
+        """
+        Checks that a single cycle computed directly matches solving through all the
+        cycles before it
+        """
+        from pkmodel.protocol import DoseSchedule
+        from pkmodel.solution import Solution
+        from pkmodel.steady_state import PeriodicDosing
+
+        interval, dose, k = 2.0, 3.0, 7
+        dosing = PeriodicDosing(self._model(), interval, dose, infusion_duration)
+
+        starts = interval * np.arange(k + 1)
+        if infusion_duration:
+            schedule = DoseSchedule(infusion_starts=starts, infusion_ends=starts + infusion_duration,
+                                    infusion_rates=dose / infusion_duration)
+        else:
+            schedule = DoseSchedule(bolus_times=starts, bolus_amounts=dose)
+        t = np.linspace(0, interval, 21)
+        solution = Solution(self._model(), schedule)
+        solution.solve(t_eval=np.append(0, k * interval + t[:-1]), method='exact')
+
+        npt.assert_allclose(dosing.cycle(k, t[:-1]), solution.solution.y[:, 1:], rtol=1e-9)
+
+    def test_steadyState(self):
+        """
+        Checks the fixed point and compares accumulation and the time to steady state
+        with the closed forms for a single compartment
+        """
+        from pkmodel.model import Model
+        from pkmodel.steady_state import PeriodicDosing
+
+        dosing = PeriodicDosing(self._model(), interval=2.0, dose_amount=3.0)
+        npt.assert_allclose(dosing.start_of_cycle(10 ** 4), dosing.steady_state)
+        npt.assert_allclose(dosing.cycle(None, [dosing.interval])[:, 0], dosing.steady_state)
+
+        CL, V_c, interval = 1.0, 2.0, 1.0
+        k = CL / V_c
+        dosing = PeriodicDosing(Model(clearance_rate=CL, vol_c=V_c), interval)
+        expected = 1 / (1 - np.exp(-k * interval))
+        npt.assert_allclose(dosing.accumulation_ratio('auc'), [expected])
+        npt.assert_allclose(dosing.accumulation_ratio('trough'), [expected])
+        # the trough after n doses is 1 - exp(-k n interval) of the steady state
+        expected_cycles = np.ceil(np.log(1 - 0.9) / (-k * interval))
+        self.assertEqual(dosing.time_to_steady_state(0.9), expected_cycles * interval)
+
+    def test_invalidInput(self):
+        """
+        Checks that impossible regimens are rejected
+        """
+        from pkmodel.steady_state import PeriodicDosing
+
+        with self.assertRaises(ValueError):
+            PeriodicDosing(self._model(), interval=0)
+        with self.assertRaises(ValueError):
+            PeriodicDosing(self._model(), interval=1, infusion_duration=2)
+        with self.assertRaises(ValueError):
+            PeriodicDosing(self._model(), interval=1).accumulation_ratio('peak')
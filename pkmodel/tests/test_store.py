@@ -0,0 +1,101 @@
+from unittest import TestCase
+import tempfile
+import os
+import numpy as np
+import numpy.testing as npt
+
+
+class ResultStoreTest(TestCase):
+    """
+    Tests the :class:`ResultStore` class.
+    """
+    def test_streamedSolution(self):
+        """
+        Checks that blocks streamed from iter_solve are stored as memory-mapped
+        columns that read back as the full solution
+        """
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+        from pkmodel.store import ResultStore
+
+        model = Model()
+        model.add_peripheral_compartment(pc_name="Fat")
+        model.add_subcutaneous_compartment()
+        protocol = Protocol(dose_amount=2, dose_times=[0, 0.5])
+        solution = Solution(model, protocol)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = ResultStore.create(os.path.join(directory, "run"), model, protocol)
+            self.assertEqual(len(store.t), 0)
+            store.extend(solution.iter_solve(chunk=300))
+            solution.solve(method='exact')
+
+            reopened = ResultStore(os.path.join(directory, "run"))
+            self.assertIsInstance(reopened.t, np.memmap)
+            npt.assert_array_equal(reopened.t, solution.solution.t)
+            for i, name in enumerate(["Central Compartment", "Fat", "Subcutaneous Compartment"]):
+                npt.assert_allclose(reopened.column(name), solution.solution.y[i], rtol=1e-12)
+            self.assertEqual(reopened.model().to_dict(), model.to_dict())
+            self.assertEqual(reopened.protocol().to_dict(), protocol.to_dict())
+
+            with self.assertRaises(FileExistsError):
+                ResultStore.create(os.path.join(directory, "run"), model, protocol)
+            with self.assertRaises(ValueError):
+                reopened.append([1.0], np.zeros((2, 1)))
+
+    def test_interruptedAppend(self):
+        """
+        Checks that an append interrupted between its header updates leaves columns of
+        equal length, which the next append continues
+        """
+        from unittest import mock
+        from pkmodel.model import Model
+        from pkmodel.store import ResultStore, _write_header
+
+        model = Model()
+        model.add_peripheral_compartment()
+        calls = []
+
+        def failing_header(f, shape):
+            calls.append(shape)
+            if len(calls) > 1:
+                raise OSError("disk full")
+            _write_header(f, shape)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = ResultStore.create(directory, model)
+            store.append([0.0, 1.0], np.arange(4.0).reshape(2, 2))
+            with mock.patch('pkmodel.store._write_header', failing_header):
+                with self.assertRaises(OSError):
+                    store.append([2.0], [[9.0], [9.0]])
+            self.assertEqual(calls[0], (3,))
+            npt.assert_array_equal(store.t, [0.0, 1.0])
+            npt.assert_array_equal(store.column(np.int64(1)), [2.0, 3.0])
+
+            store.append([2.0, 3.0], [[4.0, 5.0], [6.0, 7.0]])
+            npt.assert_array_equal(store.t, [0.0, 1.0, 2.0, 3.0])
+            npt.assert_array_equal(store.column(0), [0.0, 1.0, 4.0, 5.0])
+            npt.assert_array_equal(store.column("Peripheral Compartment 1"), [2.0, 3.0, 6.0, 7.0])
+            store.append([], np.zeros((2, 0)))
+            self.assertEqual(len(store.column(1)), 4)
+
+    def test_populationColumns(self):
+        """
+        Checks that batched results are stored with time as the first axis
+        """
+        from pkmodel.population import PopulationSolution
+        from pkmodel.store import ResultStore
+
+        population = PopulationSolution(clearance_rate=[1.0, 2.0, 3.0], vol_c=[1.0, 1.0, 2.0],
+                                        vol_p=[[1.0], [2.0], [3.0]], q_p=[[1.0], [1.0], [1.0]])
+        y = population.solve()
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = ResultStore.create(directory, population, population.protocol, batch_shape=(3,))
+            store.append(population.t[:500], y[..., :500])
+            store.append(population.t[500:], y[..., 500:])
+
+            self.assertEqual(store.column(1).shape, (1000, 3))
+            npt.assert_array_equal(store.column(1)[:, 2], y[2, 1])
+            npt.assert_array_equal(store.model().rate_matrix(), population.rate_matrix())
@@ -0,0 +1,82 @@
+from unittest import TestCase
+import numpy as np
+import numpy.testing as npt
+
+
+class ParameterSweepTest(TestCase):
+    """
+    Tests the :class:`ParameterSweep` class.
+    """
+    def test_gridOrderAndValues(self):
+        """
+        Checks that a grid sweep run on a process pool returns every scenario's
+        trajectory in the order of the grid
+        """
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.solution import Solution
+        from pkmodel.sweep import ParameterSweep
+
+        model = Model()
+        model.add_peripheral_compartment()
+        t = np.linspace(0, 1, 11)
+        sweep = ParameterSweep.grid(model, Protocol(), clearance_rate=[1.0, 2.0, 3.0],
+                                    dose_amount=[1.0, 4.0], t_eval=t, chunk_size=2, max_workers=2)
+        results = sweep.run()
+
+        self.assertEqual(results.shape, (6, 2, 11))
+        for i, (clearance_rate, dose_amount) in enumerate([(1, 1), (1, 4), (2, 1), (2, 4), (3, 1), (3, 4)]):
+            m = Model(clearance_rate=clearance_rate)
+            m.add_peripheral_compartment()
+            solution = Solution(m, Protocol(dose_amount=dose_amount))
+            solution.solve(t_eval=t, method='exact')
+            npt.assert_allclose(results[i], solution.solution.y)
+
+    def test_serialMatchesPool(self):
+        """
+        Checks that mixed layouts are padded with NaN, and that solving in-process
+        gives the same results as the pool
+        """
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.sweep import ParameterSweep
+
+        sc_model = Model()
+        sc_model.add_subcutaneous_compartment(absorption_rate=2.0)
+        scenarios = [(Model(), Protocol()), (sc_model, Protocol()), (Model(vol_c=2.0), Protocol())]
+
+        pooled = ParameterSweep(scenarios, chunk_size=1, max_workers=2).run()
+        serial = ParameterSweep(scenarios, max_workers=1).run()
+
+        npt.assert_array_equal(pooled, serial)
+        self.assertTrue(np.all(np.isnan(pooled[[0, 2], 1])))
+        self.assertFalse(np.any(np.isnan(pooled[1])))
+
+    def test_withoutSharedMemory(self):
+        """
+        Checks that workers return their results when shared memory is unavailable
+        """
+        from unittest import mock
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.sweep import ParameterSweep
+
+        sweep = ParameterSweep.grid(Model(), Protocol(), clearance_rate=[1.0, 2.0, 3.0],
+                                    t_eval=np.linspace(0, 1, 11), chunk_size=2, max_workers=2)
+        with mock.patch('pkmodel.sweep._shared_memory', return_value=None):
+            pooled = sweep.run()
+        serial = ParameterSweep(sweep.scenarios, t_eval=sweep.t_eval, max_workers=1).run()
+        npt.assert_array_equal(pooled, serial)
+
+    def test_invalidInput(self):
+        """
+        Checks that unknown grid axes and empty chunks are rejected
+        """
+        from pkmodel.model import Model
+        from pkmodel.protocol import Protocol
+        from pkmodel.sweep import ParameterSweep
+
+        with self.assertRaises(AttributeError):
+            ParameterSweep.grid(Model(), Protocol(), not_a_parameter=[1, 2])
+        with self.assertRaises(ValueError):
+            ParameterSweep([], chunk_size=0)
@@ -0,0 +1,170 @@
+from unittest import TestCase
+import numpy as np
+import numpy.testing as npt
+from parameterized import parameterized
+
+
+def build_model():
+    from pkmodel.model import Model
+
+    model = Model(clearance_rate=1.0, vol_c=2.0)
+    model.add_peripheral_compartment(vol_p=1.5, q_p=0.7)
+    model.add_subcutaneous_compartment(absorption_rate=1.5)
+    return model
+
+
+def distributions():
+    import scipy.stats
+
+    return {"clearance_rate": scipy.stats.lognorm(0.3, scale=1.0),
+            "vol_c": scipy.stats.lognorm(0.2, scale=2.0),
+            "q_p_1": scipy.stats.uniform(0.5, 0.5)}
+
+
+def has_qmc():
+    try:
+        import scipy.stats.qmc  # noqa
+    except ImportError:
+        return False
+    return True
+
+
+class StreamingEstimatorTest(TestCase):
+    """
+    Tests :class:`StreamingQuantiles` and :class:`StreamingMoments`.
+    """
+    def test_quantiles(self):
+        """
+        Checks the P-square estimates against the exact quantiles of all observations
+        """
+        from pkmodel.uncertainty import StreamingQuantiles
+
+        x = np.random.default_rng(3).normal(size=(4000, 2, 50)) * [[1], [3]]
+        quantiles = StreamingQuantiles([0.05, 0.5, 0.95])
+        for batch in np.array_split(x, 7):
+            quantiles.update(batch)
+        self.assertEqual(quantiles.count, 4000)
+        estimate = quantiles.result()
+        self.assertEqual(estimate.shape, (3, 2, 50))
+        exact = np.quantile(x, [0.05, 0.5, 0.95], axis=0)
+        npt.assert_allclose(estimate, exact, atol=0.1 * 3)
+        self.assertLess(np.abs(estimate - exact).mean(), 0.05)
+
+    def test_fewObservations(self):
+        """
+        Checks that the quantiles are exact for up to five observations
+        """
+        from pkmodel.uncertainty import StreamingQuantiles
+
+        quantiles = StreamingQuantiles([0.25, 0.5])
+        with self.assertRaises(ValueError):
+            quantiles.result()
+        quantiles.update([[1.0], [4.0], [2.0]])
+        npt.assert_allclose(quantiles.result(), [[1.5], [2.0]])
+        with self.assertRaises(ValueError):
+            StreamingQuantiles([0.5, 1.0])
+
+    def test_moments(self):
+        """
+        Checks the merged mean and variance against those of all observations
+        """
+        from pkmodel.uncertainty import StreamingMoments
+
+        x = 1e6 + np.random.default_rng(4).normal(size=(1000, 3))
+        moments = StreamingMoments()
+        for batch in np.array_split(x, [1, 100, 101, 640]):
+            moments.update(batch)
+        npt.assert_allclose(moments.mean, x.mean(axis=0), rtol=1e-14)
+        npt.assert_allclose(moments.variance(), x.var(axis=0, ddof=1), rtol=1e-9)
+
+
+class MonteCarloTest(TestCase):
+    """
+    Tests the :class:`MonteCarlo` class.
+    """
+    @parameterized.expand([('random',), ('sobol',), ('lhs',)])
+    def test_matchesPopulation(self, sampling):
+        """
+        Checks the bands and moments against a population solve of the same samples
+        """
+        from pkmodel.population import PopulationSolution
+        from pkmodel.protocol import Protocol
+        from pkmodel.uncertainty import MonteCarlo
+
+        if sampling == 'sobol' and not has_qmc():
+            self.skipTest("scipy.stats.qmc needs scipy >= 1.7")
+        model, protocol = build_model(), Protocol(dose_times=[0, 1])
+        t = np.linspace(0, 2, 41)
+        mc = MonteCarlo(model, protocol, distributions(), t_eval=t, sampling=sampling,
+                        seed=7, batch_size=256)
+        result = mc.run(2048)
+
+        samples = {name: np.concatenate([b[name] for b in mc.samples(2048)])
+                   for name in model.parameter_names()}
+        self.assertTrue(np.all(samples["absorption_rate"] == 1.5))
+        population = PopulationSolution(
+            clearance_rate=samples["clearance_rate"], vol_c=samples["vol_c"],
+            absorption_rate=samples["absorption_rate"], vol_p=samples["vol_p_1"][:, None],
+            q_p=samples["q_p_1"][:, None], protocol=protocol)
+        concentration = population.solve(t_eval=t)[:, 0] / samples["vol_c"][:, None]
+
+        self.assertEqual(result["quantiles"].shape, (3, 41))
+        npt.assert_allclose(result["mean"], concentration.mean(axis=0), rtol=1e-10, atol=1e-15)
+        npt.assert_allclose(result["std"], concentration.std(axis=0, ddof=1), rtol=1e-8,
+                            atol=1e-15)
+        exact = np.quantile(concentration, [0.05, 0.5, 0.95], axis=0)
+        npt.assert_allclose(result["quantiles"], exact, rtol=0.03, atol=1e-3)
+
+    def test_latinHypercubeBatches(self):
+        """
+        Checks that every batch of 'lhs' samples has one sample in each stratum
+        """
+        import scipy.stats
+        from pkmodel.protocol import Protocol
+        from pkmodel.uncertainty import MonteCarlo
+
+        uniform = {"clearance_rate": scipy.stats.uniform(), "vol_c": scipy.stats.uniform()}
+        mc = MonteCarlo(build_model(), Protocol(), uniform, sampling='lhs', seed=5,
+                        batch_size=40)
+        batches = list(mc.samples(100))
+        self.assertEqual([len(b["vol_c"]) for b in batches], [40, 40, 20])
+        for batch in batches:
+            m = len(batch["vol_c"])
+            for name in uniform:
+                npt.assert_array_equal(np.sort(np.floor(batch[name] * m)), np.arange(m))
+
+    def test_reproducible(self):
+        """
+        Checks that seeded runs repeat, and that the output can be every compartment
+        """
+        from pkmodel.protocol import Protocol
+        from pkmodel.uncertainty import MonteCarlo
+
+        options = dict(t_eval=np.linspace(0, 1, 11), seed=2, batch_size=100)
+        first = MonteCarlo(build_model(), Protocol(), distributions(), **options).run(250)
+        second = MonteCarlo(build_model(), Protocol(), distributions(), **options).run(250)
+        npt.assert_array_equal(first["quantiles"], second["quantiles"])
+        other = MonteCarlo(build_model(), Protocol(), distributions(),
+                           **dict(options, seed=3)).run(250)
+        self.assertFalse(np.array_equal(first["mean"], other["mean"]))
+
+        amount = MonteCarlo(build_model(), Protocol(), distributions(), output='amount',
+                            **options).run(250)
+        self.assertEqual(amount["quantiles"].shape, (3, 3, 11))
+        self.assertEqual(amount["mean"].shape, (3, 11))
+
+    def test_errors(self):
+        """
+        Checks that invalid options are rejected
+        """
+        from pkmodel.protocol import Protocol
+        from pkmodel.uncertainty import MonteCarlo
+
+        with self.assertRaises(ValueError):
+            MonteCarlo(build_model(), Protocol(), {"vol_p_2": None})
+        with self.assertRaises(ValueError):
+            MonteCarlo(build_model(), Protocol(), distributions(), sampling='halton')
+        with self.assertRaises(ValueError):
+            MonteCarlo(build_model(), Protocol(), distributions(), output='auc')
+        with self.assertRaises(ValueError):
+            MonteCarlo(build_model(), Protocol(), distributions()).run(0)
@@ -0,0 +1,293 @@
+#
+# MonteCarlo class
+#
+
+import numpy as np
+from pkmodel.fit import _get_parameters
+from pkmodel.population import PopulationSolution
+
+SAMPLING = ('random', 'sobol', 'lhs')
+
+
+class StreamingQuantiles:
+    """Estimates quantiles of every element of a stream of equally shaped arrays with
+    the P-square algorithm (Jain and Chlamtac, 1985), which keeps five markers per
+    quantile and element instead of the observations. Memory does not grow with the
+    number of observations; every update is vectorised over the elements and quantiles.
+    """
+
+    def __init__(self, levels):
+        """
+        :param levels: sequence of probabilities between 0 and 1, e.g. (0.05, 0.5, 0.95)
+        :arg count: number of observations so far
+        """
+        self.levels = np.asarray(levels, dtype=float)
+        if self.levels.ndim != 1 or not np.all((self.levels > 0) & (self.levels < 1)):
+            raise ValueError("Quantile levels must be between 0 and 1")
+        p = self.levels
+        # marker positions as fractions of the observations, (5, n_levels)
+        self._fractions = np.stack([0 * p, p / 2, p, (1 + p) / 2, np.ones_like(p)])
+        self.count = 0
+        self._first = []
+
+    def update(self, batch):
+        """
+        Adds a batch of observations. The observations up to and including the batch in
+        which the fifth arrives start the markers off at their order statistics.
+
+        :param batch: (m, ...) array of m observations
+        :return: ---
+        """
+        batch = np.asarray(batch, dtype=float)
+        if self._first is not None:
+            self._first.extend(batch)
+            self.count += len(batch)
+            if self.count >= 5:
+                self._start()
+            return
+        for x in batch:
+            self._add(x)
+        self.count += len(batch)
+
+    def _start(self):
+        """
+        Places the markers at the order statistics of the first observations.
+        """
+        first = np.sort(np.stack(self._first), axis=0)
+        m = len(first)
+        expand = (slice(None), slice(None)) + (np.newaxis,) * (first.ndim - 1)
+        # integer positions, at least one apart
+        positions = np.rint(1 + (m - 1) * self._fractions)
+        for i in range(1, 4):
+            positions[i] = np.maximum(positions[i], positions[i - 1] + 1)
+        for i in range(3, 0, -1):
+            positions[i] = np.minimum(positions[i], positions[i + 1] - 1)
+
+        shape = positions.shape + first.shape[1:]
+        self._heights = first[positions.astype(int) - 1]
+        self._positions = np.broadcast_to(positions[expand], shape).copy()
+        self._desired = np.broadcast_to((1 + (m - 1) * self._fractions)[expand], shape).copy()
+        self._increment = self._fractions[expand]
+        self._first = None
+
+    def _add(self, x):
+        """
+        Adds one observation x, of the shape of the elements, to the markers.
+        """
+        q, n = self._heights, self._positions
+        np.minimum(q[0], x, out=q[0])
+        np.maximum(q[4], x, out=q[4])
+        # markers above the cell that x falls into move up by one
+        cell = (q[1] <= x).astype(int) + (q[2] <= x) + (q[3] <= x)
+        for i in range(1, 5):
+            n[i] += cell < i
+        self._desired += self._increment
+
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            up = (d >= 1) & (n[i + 1] - n[i] > 1)
+            down = (d <= -1) & (n[i - 1] - n[i] < -1)
+            move = up | down
+            if not np.any(move):
+                continue
+            d = np.where(up, 1.0, -1.0)
+            parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+            linear = np.where(up, q[i] + (q[i + 1] - q[i]) / (n[i + 1] - n[i]),
+                              q[i] - (q[i - 1] - q[i]) / (n[i - 1] - n[i]))
+            height = np.where((q[i - 1] < parabolic) & (parabolic < q[i + 1]), parabolic, linear)
+            q[i] = np.where(move, height, q[i])
+            n[i] += np.where(move, d, 0.0)
+
+    def result(self):
+        """
+        Current quantile estimates, exact until the markers have been started.
+
+        :return: (n_levels, ...) numpy array
+        """
+        if self.count == 0:
+            raise ValueError("No observations have been added")
+        if self.count < 5:
+            return np.quantile(np.stack(self._first), self.levels, axis=0)
+        return self._heights[2].copy()
+
+
+class StreamingMoments:
+    """Mean and variance of every element of a stream of equally shaped arrays, merged
+    batch by batch with the numerically stable update of Welford and Chan et al.
+    """
+
+    def __init__(self):
+        """
+        :arg count: number of observations so far
+        """
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+
+    def update(self, batch):
+        """
+        Adds a batch of observations.
+
+        :param batch: (m, ...) array of m observations
+        :return: ---
+        """
+        batch = np.asarray(batch, dtype=float)
+        m = len(batch)
+        if m == 0:
+            return
+        mean = batch.mean(axis=0)
+        m2 = ((batch - mean) ** 2).sum(axis=0)
+        if self.count == 0:
+            self.count, self.mean, self._m2 = m, mean, m2
+            return
+        total = self.count + m
+        delta = mean - self.mean
+        self.mean = self.mean + delta * m / total
+        self._m2 = self._m2 + m2 + delta ** 2 * self.count * m / total
+        self.count = total
+
+    def variance(self, ddof=1):
+        """
+        :param ddof: delta degrees of freedom, 1 for the unbiased sample variance
+        :return: numpy array
+        """
+        return self._m2 / max(self.count - ddof, 1)
+
+
+def _sobol(d, seed):
+    """
+    Scrambled Sobol sequence generator of scipy.stats.qmc, which needs scipy 1.7 or later.
+    """
+    try:
+        from scipy.stats import qmc
+    except ImportError as e:
+        raise ImportError("sampling='sobol' needs scipy.stats.qmc (scipy >= 1.7)") from e
+    return qmc.Sobol(d, scramble=True, seed=seed)
+
+
+class MonteCarlo:
+    """Propagates uncertainty in the model parameters to the solution: parameter sets
+    are drawn from user-given distributions, solved in batches as a PopulationSolution,
+    and each batch is folded into streaming estimators of the quantiles, mean and
+    standard deviation at every time point. Memory depends on the batch size, not on
+    the number of samples, and a seeded run is reproducible.
+    """
+
+    def __init__(self, model, protocol, distributions, t_eval=None, y0=None,
+                 sampling='random', seed=None, batch_size=1024, levels=(0.05, 0.5, 0.95),
+                 output='concentration'):
+        """
+        :param model: Model giving the topology and the values of parameters that are
+                      not sampled
+        :param protocol: dosing protocol shared by all samples
+        :param distributions: parameter name (see Model.parameter_names) -> distribution
+                              with a ppf method, e.g. a frozen scipy.stats distribution
+        :param t_eval: sorted time points, defaults to 1000 points over 1 hour
+        :param y0: (n_compartments,) initial drug quantities, zero by default
+        :param sampling: 'random' for pseudo-random samples, 'lhs' for a Latin hypercube
+                         per batch, or 'sobol' for a scrambled Sobol sequence (this
+                         needs scipy >= 1.7)
+        :param seed: seed of the sampler, None for a different run every time
+        :param batch_size: number of samples solved at once
+        :param levels: quantile levels of the prediction bands
+        :param output: 'concentration' for the central concentration, 'amount' for
+                       the drug quantity in every compartment
+        """
+        names = model.parameter_names()
+        unknown = set(distributions) - set(names)
+        if unknown:
+            raise ValueError("Unknown parameters {}, expected some of {}".format(
+                sorted(unknown), names))
+        if sampling not in SAMPLING:
+            raise ValueError("sampling must be one of {}".format(SAMPLING))
+        if output not in ('concentration', 'amount'):
+            raise ValueError("output must be 'concentration' or 'amount'")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.model = model
+        self.protocol = protocol
+        self.distributions = dict(distributions)
+        self.t_eval = np.linspace(0, 1, 1000) if t_eval is None else np.asarray(t_eval)
+        self.y0 = y0
+        self.sampling = sampling
+        self.seed = seed
+        self.batch_size = batch_size
+        self.levels = levels
+        self.output = output
+
+    def samples(self, n_samples):
+        """
+        Draws parameter sets batch by batch. Uniform samples on the unit hypercube are
+        mapped through the ppf of each distribution; parameters without a distribution
+        keep the model's value.
+
+        :param n_samples: total number of samples
+        :return: generator of dicts of parameter name -> (batch,) numpy array
+        """
+        names = self.model.parameter_names()
+        fixed = dict(zip(names, _get_parameters(self.model, names)))
+        sampled = list(self.distributions)
+        d = len(sampled)
+
+        rng = np.random.default_rng(self.seed)
+        if self.sampling == 'random':
+            def draw(m):
+                return rng.random((m, d))
+        elif self.sampling == 'lhs':
+            # every batch is a Latin hypercube of its own, so no more than a batch of
+            # samples is ever held: one sample per stratum of width 1 / m in every column
+            def draw(m):
+                return (np.argsort(rng.random((m, d)), axis=0) + rng.random((m, d))) / m
+        else:
+            draw = _sobol(d, self.seed).random if d else None
+
+        for start in range(0, n_samples, self.batch_size):
+            m = min(self.batch_size, n_samples - start)
+            u = draw(m) if d else np.empty((m, 0))
+            batch = {name: np.full(m, value) for name, value in fixed.items()}
+            for j, name in enumerate(sampled):
+                batch[name] = np.asarray(self.distributions[name].ppf(u[:, j]), dtype=float)
+            yield batch
+
+    def _population(self, batch):
+        """
+        PopulationSolution of one batch of parameter sets.
+        """
+        k = self.model.number_of_peripheral_compartments
+        m = len(batch["clearance_rate"])
+        return PopulationSolution(
+            clearance_rate=batch["clearance_rate"], vol_c=batch["vol_c"],
+            absorption_rate=batch.get("absorption_rate"),
+            vol_p=np.column_stack([batch["vol_p_{}".format(i)] for i in range(1, k + 1)])
+            if k else np.zeros((m, 0)),
+            q_p=np.column_stack([batch["q_p_{}".format(i)] for i in range(1, k + 1)])
+            if k else np.zeros((m, 0)),
+            protocol=self.protocol)
+
+    def run(self, n_samples):
+        """
+        Solves n_samples parameter sets and summarises the output at every time point.
+
+        :param n_samples: number of samples
+        :return: dict with 't', 'levels', 'quantiles' of shape (n_levels, n_times) for
+                 the concentration or (n_levels, n_compartments, n_times) for amounts,
+                 'mean' and 'std' of the output's shape, and 'n_samples'
+        """
+        if n_samples < 1:
+            raise ValueError("n_samples must be at least 1")
+        quantiles = StreamingQuantiles(self.levels)
+        moments = StreamingMoments()
+        for batch in self.samples(n_samples):
+            y = self._population(batch).solve(self.y0, self.t_eval)
+            if self.output == 'concentration':
+                y = y[:, 0] / batch["vol_c"][:, np.newaxis]
+            quantiles.update(y)
+            moments.update(y)
+        return {"t": self.t_eval,
+                "levels": quantiles.levels,
+                "quantiles": quantiles.result(),
+                "mean": moments.mean,
+                "std": np.sqrt(moments.variance()),
+                "n_samples": n_samples}